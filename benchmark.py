@@ -0,0 +1,627 @@
+#!/usr/bin/python
+
+from __future__ import print_function
+import argparse
+import BaseHTTPServer
+import httplib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import socket
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib
+import urlparse
+import uuid
+
+import unity_auto_build
+
+def benchmark_zip(source, workers):
+    source_size = unity_auto_build.path_size(source)
+    engines = [
+        ('serial', lambda destination: unity_auto_build.zip_file_or_dir_serial(source, destination)),
+        ('parallel', lambda destination: unity_auto_build.zip_file_or_dir_parallel(source, destination, workers))]
+
+    results = []
+    temp_dir = tempfile.mkdtemp(prefix='zip_benchmark_')
+    try:
+        for name, zip_function in engines:
+            destination = os.path.join(temp_dir, name + '.zip')
+            start_time = time.time()
+            zip_function(destination)
+            elapsed = time.time() - start_time
+
+            results.append({
+                'benchmark': 'zip',
+                'engine': name,
+                'workers': workers if name == 'parallel' else 1,
+                'seconds': elapsed,
+                'source_bytes': source_size,
+                'archive_bytes': os.path.getsize(destination),
+                'compression_ratio': os.path.getsize(destination) / float(max(source_size, 1)),
+                'mb_per_s': source_size / (1024.0 * 1024.0) / max(elapsed, 0.001)})
+            os.remove(destination)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    serial = results[0]
+    for result in results:
+        result['size_vs_serial'] = result['archive_bytes'] / float(max(serial['archive_bytes'], 1))
+        result['speedup_vs_serial'] = serial['seconds'] / max(result['seconds'], 0.001)
+    return results
+
+def benchmark_startup(runs):
+    script_dir = os.path.dirname(os.path.abspath(unity_auto_build.__file__))
+    scenarios = [('import', 'import unity_auto_build')]
+    for name in unity_auto_build.backends.keys():
+        scenarios.append(('backend:' + name, 'import unity_auto_build; unity_auto_build.backends[%r].load(required=False)' % name))
+
+    results = []
+    for name, code in scenarios:
+        timings = []
+        for run in range(runs):
+            start_time = time.time()
+            subprocess.check_call([sys.executable, '-c', code], cwd=script_dir)
+            timings.append(time.time() - start_time)
+        timings.sort()
+
+        results.append({
+            'benchmark': 'startup',
+            'scenario': name,
+            'runs': runs,
+            'min_seconds': timings[0],
+            'median_seconds': timings[len(timings) // 2]})
+    return results
+
+synthetic_manifest_name = 'synthetic.json'
+synthetic_block_size = 1024 * 1024
+suite_service_latency = 0
+
+fake_unity_script = '''import sys
+
+lines = int(sys.argv[1])
+phases = [
+    ('Refresh: detecting if any assets need to be imported or removed ...',
+     'Start importing Assets/Textures/texture_%d.png using Guid(00000000000000000000000000000000) Importer(-1,00000000000000000000000000000000)'),
+    ('- starting compile Library/ScriptAssemblies/Assembly-CSharp.dll',
+     'Assets/Scripts/Generated/Script%d.cs(12,20): warning CS0414: The private field is assigned but its value is never used'),
+    ('Begin MonoManager ReloadAssembly',
+     'Platform assembly: /Applications/Unity/Unity.app/Contents/Frameworks/Mono/lib/mono/2.0/System%d.dll (this message is harmless)'),
+    ('Compiling shader "Bench/Standard" pass "FORWARD" (vp)',
+     '    Full variant space:         %d'),
+    ('DisplayProgressbar: Building Asset Bundles',
+     'Packing sprites: Assets/Atlases/atlas_%d.spriteatlas'),
+    ('DisplayProgressbar: Building Player',
+     'Shader Bench/Standard, subprogram %d: unused, stripped'),
+]
+per_phase = max(lines // len(phases), 1)
+write = sys.stdout.write
+for marker, template in phases:
+    write(marker + '\\n')
+    for index in range(per_phase):
+        write(template % index + '\\n')
+write('Refresh completed in 0.01 seconds.\\n')
+write('Build Report\\nUncompressed usage by category:\\n')
+for category in ('Textures', 'Meshes', 'Animations', 'Sounds', 'Shaders', 'Other Assets', 'Levels', 'Scripts'):
+    write(category + ' 12.5 mb\\t 10.0%\\n')
+write('Complete size 125.0 mb\\t 100.0%\\n')
+write('Build Finished, Result: Success.\\n')
+'''
+
+class FakeServiceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        self.respond({'uid': 1, 'display_name': 'benchmark'})
+
+    def do_POST(self):
+        if self.headers.get('Expect', '').lower() == '100-continue':
+            self.wfile.write('HTTP/1.1 100 Continue\r\n\r\n')
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            data = self.rfile.read(min(remaining, synthetic_block_size))
+            if not data:
+                break
+            remaining -= len(data)
+        length = int(self.headers.get('Content-Length', 0))
+
+        url = urlparse.urlparse(self.path)
+        path = urllib.unquote(url.path)
+        if path.startswith('/chunked_upload'):
+            query = urlparse.parse_qs(url.query)
+            upload_id = query.get('upload_id', [uuid.uuid4().hex])[0]
+            self.respond({'upload_id': upload_id, 'offset': int(query.get('offset', ['0'])[0]) + length})
+        elif path.startswith('/shares/'):
+            self.respond({'url': 'https://www.dropbox.com/s/' + uuid.uuid4().hex[:15] + '/' + os.path.basename(path),
+                          'expires': 'Tue, 01 Jan 2030 00:00:00 +0000'})
+        elif path.startswith('/testflight'):
+            self.respond({'install_url': 'https://testflightapp.com/install/' + uuid.uuid4().hex + '/'})
+        else:
+            self.respond({'path': path.split('/', 2)[-1], 'bytes': length})
+
+    def respond(self, response):
+        if suite_service_latency > 0:
+            time.sleep(suite_service_latency)
+        data = json.dumps(response)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeServiceServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 64
+
+class FakeDropboxSession:
+    root = 'auto'
+
+class FakeDropboxClient:
+    def __init__(self, url):
+        self.address = urlparse.urlparse(url).netloc
+        self.session = FakeDropboxSession()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.bytes_sent = 0
+
+    def request(self, method, path, body=None, size=0):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = httplib.HTTPConnection(self.address)
+            connection.connect()
+            connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        start_time = time.time()
+        connection.putrequest(method, urllib.quote(path, safe='/?=&'))
+        connection.putheader('Content-Length', str(size))
+        connection.endheaders()
+        if isinstance(body, str):
+            connection.send(body)
+        elif body is not None:
+            while True:
+                data = body.read(synthetic_block_size)
+                if not data:
+                    break
+                connection.send(data)
+        response = connection.getresponse()
+        data = response.read()
+        with self.lock:
+            self.latencies.append(time.time() - start_time)
+            self.bytes_sent += size
+        if response.status != 200:
+            raise httplib.HTTPException('fake service returned ' + str(response.status))
+        return json.loads(data)
+
+    def account_info(self):
+        return self.request('GET', '/account/info')
+
+    def put_file(self, full_path, file_obj, overwrite=False):
+        return self.request('POST', '/files_put/' + full_path.lstrip('/'), file_obj, os.fstat(file_obj.fileno()).st_size)
+
+    def upload_chunk(self, file_obj, length, offset=0, upload_id=None):
+        path = '/chunked_upload?offset=' + str(offset) + ('&upload_id=' + upload_id if upload_id is not None else '')
+        response = self.request('POST', path, file_obj, length)
+        return response['offset'], response['upload_id']
+
+    def commit_chunked_upload(self, full_path, upload_id, overwrite=False):
+        return self.request('POST', '/commit_chunked_upload/' + full_path.lstrip('/') + '?upload_id=' + upload_id)
+
+    def share(self, path, short_url=True):
+        return self.request('POST', '/shares/' + path.lstrip('/'))
+
+def synthetic_block(seed, size):
+    generator = random.Random(seed)
+    return ('%0*x' % (size * 2, generator.getrandbits(size * 8))).decode('hex')
+
+def synthetic_symbols(seed, size):
+    generator = random.Random(seed)
+    symbols = []
+    length = 0
+    while length < size:
+        symbol = '_ZN5Bench%dModule%dE%dfunction%dEif\0' % tuple(generator.randint(0, 999) for index in range(4))
+        symbols.append(symbol)
+        length += len(symbol)
+    return ''.join(symbols)[:size]
+
+def write_synthetic_file(path, size, blocks, offset):
+    unity_auto_build.mkdir_p(os.path.dirname(path))
+    f = open(path, 'wb')
+    try:
+        written = 0
+        while written < size:
+            block = blocks[(offset + written // synthetic_block_size) % len(blocks)]
+            data = block[:min(synthetic_block_size, size - written)]
+            f.write(data)
+            written += len(data)
+    finally:
+        f.close()
+
+def write_synthetic_unit_tests(path, test_cases, seed):
+    generator = random.Random(seed)
+    fixture_size = 20
+    failures = test_cases // 50
+    f = open(path, 'w')
+    try:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write('<test-results name="Bench.Tests.dll" total="%d" errors="0" failures="%d" not-run="0" inconclusive="0" '
+                'ignored="0" skipped="0" invalid="0" date="2014-01-01" time="00:00:00">\n' % (test_cases, failures))
+        f.write('<test-suite type="Assembly" name="Bench.Tests.dll" executed="True" result="Failure"><results>\n')
+        for index in range(test_cases):
+            fixture = index // fixture_size
+            if index % fixture_size == 0:
+                if index > 0:
+                    f.write('</results></test-suite>\n')
+                f.write('<test-suite type="TestFixture" name="Fixture%d" executed="True" result="Success"><results>\n' % fixture)
+            name = 'Bench.Tests.Fixture%d.Test%d' % (fixture, index)
+            time_attribute = '%.3f' % generator.expovariate(50.0)
+            if index % 50 == 49:
+                f.write('<test-case name="%s" executed="True" result="Failure" success="False" time="%s" asserts="1">'
+                        '<failure><message><![CDATA[Expected: 1 But was: 2]]></message><stack-trace><![CDATA[at %s () '
+                        '[0x00000] in Assets/Tests/Fixture%d.cs:42]]></stack-trace></failure></test-case>\n' %
+                        (name, time_attribute, name, fixture))
+            else:
+                f.write('<test-case name="%s" executed="True" result="Success" success="True" time="%s" asserts="1" />\n' %
+                        (name, time_attribute))
+        if test_cases > 0:
+            f.write('</results></test-suite>\n')
+        f.write('</results></test-suite>\n</test-results>\n')
+    finally:
+        f.close()
+
+def generate_synthetic_project(work_dir, sizes, seed):
+    manifest_file = os.path.join(work_dir, synthetic_manifest_name)
+    manifest = {'seed': seed, 'sizes': sizes}
+    if unity_auto_build.read_json_file(manifest_file, None) == manifest:
+        return None
+
+    start_time = time.time()
+    trees_dir = os.path.join(work_dir, 'trees')
+    unity_auto_build.remove_path(trees_dir)
+    random_blocks = [synthetic_block(seed * 1000 + index, synthetic_block_size) for index in range(4)]
+    symbol_blocks = [synthetic_symbols(seed * 1000 + index, synthetic_block_size) for index in range(4)]
+    dwarf_blocks = [random_blocks[index][:synthetic_block_size // 2] + symbol_blocks[index][:synthetic_block_size // 2]
+                    for index in range(4)]
+
+    generator = random.Random(seed)
+    for index in range(sizes['bundle_files']):
+        bundle_dir = os.path.join(trees_dir, 'bundles', 'bundle_%03d' % (index // 500))
+        if index % 500 == 0:
+            unity_auto_build.mkdir_p(bundle_dir)
+        f = open(os.path.join(bundle_dir, 'asset_%05d.bundle' % index), 'wb')
+        try:
+            offset = generator.randint(0, synthetic_block_size - 65536)
+            f.write(random_blocks[index % 4][offset:offset + generator.randint(1024, 65536)])
+        finally:
+            f.close()
+
+    dsym_dir = os.path.join(trees_dir, 'Bench.dSYM', 'Contents')
+    write_synthetic_file(os.path.join(dsym_dir, 'Resources', 'DWARF', 'Bench'), sizes['dsym_mb'] * 1024 * 1024, dwarf_blocks, 0)
+    write_synthetic_file(os.path.join(dsym_dir, 'Info.plist'), 4096, symbol_blocks, 0)
+    write_synthetic_file(os.path.join(trees_dir, 'Bench.ipa'), sizes['binary_mb'] * 1024 * 1024, random_blocks, 1)
+
+    unity_dir = os.path.join(work_dir, 'unity')
+    unity_auto_build.mkdir_p(unity_dir)
+    f = open(os.path.join(unity_dir, 'fake_unity.py'), 'w')
+    try:
+        f.write(fake_unity_script)
+    finally:
+        f.close()
+    write_synthetic_unit_tests(os.path.join(unity_dir, 'TestResults.xml'), sizes['test_cases'], seed)
+
+    unity_auto_build.write_json_file(manifest_file, manifest)
+    return {
+        'benchmark': 'suite',
+        'case': 'generate',
+        'seed': seed,
+        'sizes': sizes,
+        'seconds': time.time() - start_time,
+        'bytes': unity_auto_build.path_size(trees_dir)}
+
+def suite_settings(work_dir, case, service_url):
+    settings = unity_auto_build.BuildSettings()
+    temp_dir = os.path.join(work_dir, 'tmp', case)
+    unity_auto_build.remove_path(temp_dir)
+    unity_auto_build.mkdir_p(temp_dir)
+
+    config = settings.config
+    config[unity_auto_build.BuildSettings.key_temp_dir] = temp_dir
+    config[unity_auto_build.BuildSettings.key_app_name] = 'Bench'
+    config[unity_auto_build.BuildSettings.key_platforms] = {'iOS': {
+        unity_auto_build.BuildSettings.key_ios_build: True,
+        unity_auto_build.BuildSettings.key_testflight_upload: True,
+        unity_auto_build.BuildSettings.key_dropbox_upload: True}}
+    config[unity_auto_build.BuildSettings.key_testflight_url] = service_url + '/testflight/api/builds.json'
+    config[unity_auto_build.BuildSettings.key_testflight_api_token] = 'benchmark'
+    config[unity_auto_build.BuildSettings.key_testflight_team_token] = 'benchmark'
+    config[unity_auto_build.BuildSettings.key_testflight_notes] = 'benchmark'
+    config[unity_auto_build.BuildSettings.key_testflight_distribution_lists] = []
+    config[unity_auto_build.BuildSettings.key_testflight_notify] = False
+    config[unity_auto_build.BuildSettings.key_testflight_replace] = True
+    config.update(unity_auto_build.read_json_file(os.path.join(work_dir, 'suite_config.json'), {}))
+
+    settings.start_time = time.time()
+    settings.dropbox_client = FakeDropboxClient(service_url)
+    settings.dropbox_account_info = settings.dropbox_client.account_info()
+    settings.dropbox_client.latencies = []
+    unity_auto_build.settings = settings
+    return settings
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def request_metrics(client, elapsed):
+    return {
+        'requests': len(client.latencies),
+        'bytes_sent': client.bytes_sent,
+        'mb_per_s': client.bytes_sent / (1024.0 * 1024.0) / max(elapsed, 0.001),
+        'latency_p50_ms': (percentile(client.latencies, 0.5) or 0) * 1000,
+        'latency_p95_ms': (percentile(client.latencies, 0.95) or 0) * 1000,
+        'latency_max_ms': max(client.latencies or [0]) * 1000}
+
+def suite_zip(work_dir, tree):
+    source = os.path.join(work_dir, 'trees', tree)
+    destination = os.path.join(unity_auto_build.settings.config[unity_auto_build.BuildSettings.key_temp_dir], 'archive.zip')
+    source_size = unity_auto_build.path_size(source)
+    start_time = time.time()
+    unity_auto_build.zip_file_or_dir(source, destination)
+    elapsed = time.time() - start_time
+    return {
+        'seconds': elapsed,
+        'source_bytes': source_size,
+        'archive_bytes': os.path.getsize(destination),
+        'compression_ratio': os.path.getsize(destination) / float(max(source_size, 1)),
+        'mb_per_s': source_size / (1024.0 * 1024.0) / max(elapsed, 0.001)}
+
+def suite_dropbox_upload(work_dir, tree):
+    source = os.path.join(work_dir, 'trees', tree)
+    start_time = time.time()
+    unity_auto_build.dropbox_upload(source, 'benchmark/' + tree)
+    elapsed = time.time() - start_time
+    result = request_metrics(unity_auto_build.settings.dropbox_client, elapsed)
+    result['seconds'] = elapsed
+    if os.path.isdir(source):
+        result['files_per_s'] = result['requests'] / max(elapsed, 0.001)
+    return result
+
+def suite_upload_files_to_dropbox(work_dir):
+    trees_dir = os.path.join(work_dir, 'trees')
+    unity_auto_build.dropbox_add_file_to_upload(os.path.join(trees_dir, 'Bench.ipa'), 'benchmark/iOS', False, 'iOS', True)
+    unity_auto_build.dropbox_add_file_to_upload(os.path.join(trees_dir, 'Bench.dSYM'), 'benchmark/iOS', True, 'iOS', False)
+    unity_auto_build.dropbox_add_file_to_upload(os.path.join(trees_dir, 'bundles'), 'benchmark/iOS', False, 'iOS', False)
+
+    start_time = time.time()
+    unity_auto_build.upload_files_to_dropbox()
+    elapsed = time.time() - start_time
+    result = request_metrics(unity_auto_build.settings.dropbox_client, elapsed)
+    result['seconds'] = elapsed
+    return result
+
+def suite_testflight(work_dir):
+    if not unity_auto_build.backends['testflight'].load(required=False):
+        return {'skipped': 'pycurl is not available'}
+
+    temp_dir = unity_auto_build.settings.config[unity_auto_build.BuildSettings.key_temp_dir]
+    ipa_file, dsym_file = unity_auto_build.get_ios_build_files(temp_dir)
+    unity_auto_build.link_or_copy_file(os.path.join(work_dir, 'trees', 'Bench.ipa'), ipa_file, False)
+    unity_auto_build.link_or_copy_file(os.path.join(work_dir, 'trees', 'Bench.dSYM', 'Contents', 'Info.plist'), dsym_file, False)
+    size = os.path.getsize(ipa_file) + os.path.getsize(dsym_file)
+
+    start_time = time.time()
+    unity_auto_build.upload_projects_to_testflight()
+    elapsed = time.time() - start_time
+    return {
+        'seconds': elapsed,
+        'bytes_sent': size,
+        'mb_per_s': size / (1024.0 * 1024.0) / max(elapsed, 0.001)}
+
+def suite_execute_command(work_dir):
+    lines = unity_auto_build.read_json_file(os.path.join(work_dir, synthetic_manifest_name))['sizes']['log_lines']
+    command = '"' + sys.executable + '" "' + os.path.join(work_dir, 'unity', 'fake_unity.py') + '" ' + str(lines)
+
+    devnull = open(os.devnull, 'w')
+    try:
+        start_time = time.time()
+        subprocess.check_call([sys.executable, os.path.join(work_dir, 'unity', 'fake_unity.py'), str(lines)], stdout=devnull)
+        baseline = time.time() - start_time
+    finally:
+        devnull.close()
+
+    parser = unity_auto_build.UnityLogParser('benchmark')
+    start_time = time.time()
+    unity_auto_build.execute_command(command, line_handler=parser.feed)
+    elapsed = time.time() - start_time
+    report = parser.finish()
+    return {
+        'seconds': elapsed,
+        'baseline_seconds': baseline,
+        'lines': lines,
+        'lines_per_s': lines / max(elapsed, 0.001),
+        'phases': len(report['phases']),
+        'result': report['result']}
+
+def suite_unit_test_results(work_dir):
+    result_file = os.path.join(work_dir, 'unity', 'TestResults.xml')
+    start_time = time.time()
+    totals, test_cases = unity_auto_build.read_unit_test_results(result_file)
+    parse_time = time.time() - start_time
+
+    history = {}
+    start_time = time.time()
+    unity_auto_build.update_unit_test_history(history, test_cases)
+    history_time = time.time() - start_time
+    return {
+        'seconds': parse_time + history_time,
+        'parse_seconds': parse_time,
+        'history_seconds': history_time,
+        'bytes': os.path.getsize(result_file),
+        'test_cases': len(test_cases),
+        'cases_per_s': len(test_cases) / max(parse_time, 0.001)}
+
+suite_cases = [
+    ('zip_bundles', lambda work_dir: suite_zip(work_dir, 'bundles')),
+    ('zip_dsym', lambda work_dir: suite_zip(work_dir, 'Bench.dSYM')),
+    ('zip_binary', lambda work_dir: suite_zip(work_dir, 'Bench.ipa')),
+    ('dropbox_upload_bundles', lambda work_dir: suite_dropbox_upload(work_dir, 'bundles')),
+    ('dropbox_upload_binary', lambda work_dir: suite_dropbox_upload(work_dir, 'Bench.ipa')),
+    ('upload_files_to_dropbox', suite_upload_files_to_dropbox),
+    ('testflight_upload', suite_testflight),
+    ('execute_command_unity', suite_execute_command),
+    ('unit_test_results', suite_unit_test_results)]
+
+def peak_rss_kb(who):
+    peak = resource.getrusage(who).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def benchmark_suite_case(case, work_dir, service_url, result_file):
+    suite_settings(work_dir, case, service_url)
+    result = dict(suite_cases)[case](work_dir)
+    result.update({
+        'benchmark': 'suite',
+        'case': case,
+        'peak_rss_kb': peak_rss_kb(resource.RUSAGE_SELF),
+        'children_peak_rss_kb': peak_rss_kb(resource.RUSAGE_CHILDREN)})
+    unity_auto_build.write_json_file(result_file, result)
+
+def benchmark_suite(args):
+    global suite_service_latency
+    sizes = {
+        'bundle_files': int(args.bundle_files * args.scale),
+        'dsym_mb': int(args.dsym_mb * args.scale),
+        'binary_mb': int(args.binary_mb * args.scale),
+        'log_lines': int(args.log_lines * args.scale),
+        'test_cases': int(args.test_cases * args.scale)}
+    cases = args.cases or [name for name, function in suite_cases]
+    unknown = [case for case in cases if case not in dict(suite_cases)]
+    if len(unknown) > 0:
+        raise SystemExit('unknown suite case(s): ' + ', '.join(unknown) + ' (available: ' + ', '.join(name for name, function in suite_cases) + ')')
+
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='suite_benchmark_')
+    unity_auto_build.mkdir_p(work_dir)
+    suite_service_latency = args.latency_ms / 1000.0
+    server = FakeServiceServer(('127.0.0.1', 0), FakeServiceHandler)
+    server_thread = threading.Thread(target=server.serve_forever, name='fake services')
+    server_thread.daemon = True
+    server_thread.start()
+    service_url = 'http://127.0.0.1:' + str(server.server_address[1])
+
+    results = []
+    output = None if args.verbose else open(os.devnull, 'w')
+    try:
+        generated = generate_synthetic_project(work_dir, sizes, args.seed)
+        if generated is not None:
+            results.append(generated)
+
+        config = {}
+        if args.zip_workers is not None:
+            config[unity_auto_build.BuildSettings.key_zip_workers] = args.zip_workers
+        if args.upload_threads is not None:
+            config[unity_auto_build.BuildSettings.key_dropbox_upload_threads] = args.upload_threads
+        unity_auto_build.write_json_file(os.path.join(work_dir, 'suite_config.json'), config)
+
+        for case in cases:
+            result_file = os.path.join(work_dir, 'result_' + case + '.json')
+            unity_auto_build.remove_path(result_file)
+            start_time = time.time()
+            exit_code = subprocess.call([sys.executable, os.path.abspath(__file__), 'suite-case', case, work_dir, service_url, result_file],
+                                        stdout=output, stderr=output)
+            result = unity_auto_build.read_json_file(result_file, None)
+            if exit_code != 0 or result is None:
+                result = {'benchmark': 'suite', 'case': case, 'error': 'exit code ' + str(exit_code),
+                          'seconds': time.time() - start_time}
+            results.append(result)
+    finally:
+        server.shutdown()
+        server.server_close()
+        if output is not None:
+            output.close()
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+        else:
+            unity_auto_build.remove_path(os.path.join(work_dir, 'tmp'))
+    return results
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='benchmarks parts of the unity auto build pipeline')
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    zip_parser = subparsers.add_parser('zip', help='compare serial and parallel zip on a file or directory (e.g. a dSYM)')
+    zip_parser.add_argument('source', metavar='SOURCE', help='file or directory to zip')
+    zip_parser.add_argument('-w', '--workers', dest='workers', type=int, default=multiprocessing.cpu_count(),
+                            help='parallel zip workers (default: cpu count)')
+
+    startup_parser = subparsers.add_parser('startup', help='measure module import time and the cost of loading each backend')
+    startup_parser.add_argument('-r', '--runs', dest='runs', type=int, default=5,
+                                help='interpreter starts per scenario (default: 5)')
+
+    suite_parser = subparsers.add_parser('suite', help='run the pipeline against a synthetic project and local dropbox/testflight stand-ins')
+    suite_parser.add_argument('cases', metavar='CASE', nargs='*',
+                              help='cases to run (default: all): ' + ', '.join(name for name, function in suite_cases))
+    suite_parser.add_argument('--work-dir', dest='work_dir',
+                              help='keep the synthetic project here and reuse it between runs (default: a temporary directory)')
+    suite_parser.add_argument('--scale', dest='scale', type=float, default=1.0,
+                              help='multiplies all synthetic sizes (default: 1.0)')
+    suite_parser.add_argument('--seed', dest='seed', type=int, default=0,
+                              help='seed for the synthetic content (default: 0)')
+    suite_parser.add_argument('--bundle-files', dest='bundle_files', type=int, default=4000,
+                              help='small asset bundle files, 1-64 KB each (default: 4000)')
+    suite_parser.add_argument('--dsym-mb', dest='dsym_mb', type=int, default=2048,
+                              help='size of the dSYM-like directory in MB (default: 2048)')
+    suite_parser.add_argument('--binary-mb', dest='binary_mb', type=int, default=512,
+                              help='size of the incompressible ipa-like binary in MB (default: 512)')
+    suite_parser.add_argument('--log-lines', dest='log_lines', type=int, default=500000,
+                              help='lines printed by the fake Unity executable (default: 500000)')
+    suite_parser.add_argument('--test-cases', dest='test_cases', type=int, default=50000,
+                              help='test cases in the generated NUnit results (default: 50000)')
+    suite_parser.add_argument('--latency-ms', dest='latency_ms', type=float, default=0,
+                              help='latency added to every fake service response (default: 0)')
+    suite_parser.add_argument('--zip-workers', dest='zip_workers', type=int,
+                              help='zip_workers option for the zip cases (default: cpu count)')
+    suite_parser.add_argument('--upload-threads', dest='upload_threads', type=int,
+                              help='dropbox_upload_threads option for the upload cases (default: 8)')
+    suite_parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
+                              help='show the build log of each case')
+
+    case_parser = subparsers.add_parser('suite-case', help='run a single suite case in this process (used by suite)')
+    case_parser.add_argument('case', metavar='CASE')
+    case_parser.add_argument('work_dir', metavar='WORK_DIR')
+    case_parser.add_argument('service_url', metavar='SERVICE_URL')
+    case_parser.add_argument('result_file', metavar='RESULT_FILE')
+
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    if args.benchmark == 'zip':
+        results = benchmark_zip(args.source, args.workers)
+    elif args.benchmark == 'startup':
+        results = benchmark_startup(args.runs)
+    elif args.benchmark == 'suite':
+        results = benchmark_suite(args)
+    elif args.benchmark == 'suite-case':
+        benchmark_suite_case(args.case, args.work_dir, args.service_url, args.result_file)
+        return
+
+    for result in results:
+        print(json.dumps(result, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import unity_auto_build
+
+fake_unity_script = """#!/bin/sh
+method=""
+while [ $# -gt 0 ]; do
+  if [ "$1" = "-executeMethod" ]; then method="$2"; shift; fi
+  shift
+done
+echo "$method" >> "%(calls)s"
+if [ "$method" = "Build.Player" ]; then output="%(project)s/Builds/Android"; else output="%(project)s/Bundles"; fi
+mkdir -p "$output"
+cp "%(project)s/Assets/Resources/version.txt" "$output/version.txt"
+echo "$method" > "$output/content.dat"
+"""
+
+
+class BuildCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.project = os.path.join(self.temp_dir, 'project')
+        self.calls = os.path.join(self.temp_dir, 'calls.txt')
+        os.makedirs(os.path.join(self.project, 'Assets', 'Resources'))
+        os.makedirs(os.path.join(self.project, 'ProjectSettings'))
+        self.write(os.path.join(self.project, 'Assets', 'Resources', 'version.txt'), json.dumps({'bundle': '1.0', 'build': 1}))
+        self.write(os.path.join(self.project, 'Assets', 'Game.cs'), 'class Game {}')
+        self.write(os.path.join(self.project, 'ProjectSettings', 'ProjectSettings.asset'), 'settings')
+
+        unity = os.path.join(self.temp_dir, 'unity')
+        self.write(unity, fake_unity_script % {'calls': self.calls, 'project': self.project})
+        os.chmod(unity, os.stat(unity).st_mode | stat.S_IXUSR)
+
+        self.previous_settings = unity_auto_build.settings
+        unity_auto_build.settings = unity_auto_build.BuildSettings()
+        unity_auto_build.settings.log_file_name = os.path.join(self.temp_dir, 'build.log')
+        unity_auto_build.settings.config = {
+            'project_path': self.project,
+            'version_file': 'Assets/Resources/version.txt',
+            'unity_app': unity,
+            'unity_app_args': '',
+            'build_cache_dir': os.path.join(self.temp_dir, 'cache'),
+            'platforms': {'Android': {'unity_build_path': 'Builds/Android', 'bundle_output_path': 'Bundles'}}}
+
+    def tearDown(self):
+        unity_auto_build.settings = self.previous_settings
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, content):
+        f = open(path, 'w')
+        try:
+            f.write(content)
+        finally:
+            f.close()
+
+    def read(self, path):
+        f = open(path)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def build(self):
+        unity_auto_build.settings.project_fingerprint = None
+        unity_auto_build.increment_build_number()
+        unity_auto_build.parse_version()
+        unity_auto_build.run_unity_build_method('Android', 'Build.Player', 'Builds/Android')
+        unity_auto_build.run_unity_build_method('Android', 'Build.Bundles', 'Bundles', versioned=False)
+
+    def unity_calls(self):
+        return self.read(self.calls).split()
+
+    def test_second_build_restores_bundles_from_cache(self):
+        self.build()
+        self.assertEqual(self.unity_calls(), ['Build.Player', 'Build.Bundles'])
+        shutil.rmtree(os.path.join(self.project, 'Bundles'))
+
+        self.build()
+        self.assertEqual(self.unity_calls(), ['Build.Player', 'Build.Bundles', 'Build.Player'])
+        self.assertEqual(self.read(os.path.join(self.project, 'Bundles', 'content.dat')), 'Build.Bundles\n')
+        self.assertEqual(json.loads(self.read(os.path.join(self.project, 'Builds', 'Android', 'version.txt')))['build'], 3)
+
+    def test_versioned_player_is_not_stored(self):
+        self.build()
+
+        cache_dir = unity_auto_build.settings.config['build_cache_dir']
+        entries = [unity_auto_build.read_json_file(os.path.join(cache_dir, name, 'entry.json'))
+                   for name in os.listdir(cache_dir) if os.path.isdir(os.path.join(cache_dir, name))]
+        self.assertEqual([entry['method'] for entry in entries], ['Build.Bundles'])
+
+    def test_source_change_misses_cache(self):
+        self.build()
+        self.write(os.path.join(self.project, 'Assets', 'Game.cs'), 'class Game { int score; }')
+
+        self.build()
+        self.assertEqual(self.unity_calls(), ['Build.Player', 'Build.Bundles', 'Build.Player', 'Build.Bundles'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import unity_auto_build
+
+
+class FakeDropboxSession:
+    root = 'auto'
+
+
+class FakeDropboxClient:
+    def __init__(self, failing=()):
+        self.session = FakeDropboxSession()
+        self.failing = set(failing)
+        self.files = {}
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def put_file(self, full_path, file_obj, overwrite=False):
+        data = file_obj.read()
+        # network latency, lets the other upload threads pick up work meanwhile
+        time.sleep(0.05)
+        with self.lock:
+            self.threads.add(threading.current_thread().name)
+            if os.path.basename(full_path) in self.failing:
+                raise ValueError('rejected: ' + full_path)
+            self.files[full_path] = data
+        return {'path': full_path, 'bytes': len(data)}
+
+    def share(self, path, short_url=True):
+        return {'url': 'https://www.dropbox.com/s/share/' + path}
+
+
+class DropboxUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.build_dir = os.path.join(self.temp_dir, 'Builds', 'WebPlayer')
+        self.contents = {
+            'WebPlayer.html': '<html></html>',
+            'WebPlayer.unity3d': os.urandom(64 * 1024),
+            os.path.join('Data', 'level1.assets'): os.urandom(16 * 1024),
+            os.path.join('Data', 'Resources', 'shared.assets'): os.urandom(8 * 1024)}
+        for name, content in self.contents.items():
+            self.write(os.path.join(self.build_dir, name), content)
+        self.write(os.path.join(self.build_dir, '.DS_Store'), 'finder')
+        self.write(os.path.join(self.temp_dir, 'Game.apk'), os.urandom(32 * 1024))
+
+        self.previous_settings = unity_auto_build.settings
+        unity_auto_build.settings = unity_auto_build.BuildSettings()
+        unity_auto_build.settings.log_file_name = os.path.join(self.temp_dir, 'build.log')
+        unity_auto_build.settings.config = {
+            'temp_dir': os.path.join(self.temp_dir, 'tmp'),
+            'dropbox_pipeline_uploads': True,
+            'dropbox_upload_threads': 4,
+            'upload_retries': 0}
+        unity_auto_build.settings.dropbox_account_info = {'uid': 1234}
+
+        self.authenticate = unity_auto_build.dropbox_authenticate
+        self.clients = []
+
+    def tearDown(self):
+        unity_auto_build.dropbox_authenticate = self.authenticate
+        unity_auto_build.settings = self.previous_settings
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, content):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, 'wb')
+        try:
+            f.write(content)
+        finally:
+            f.close()
+
+    def read(self, path):
+        f = open(path, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def use_client(self, failing=()):
+        def authenticate():
+            client = FakeDropboxClient(failing)
+            self.clients.append(client)
+            return client
+        unity_auto_build.dropbox_authenticate = authenticate
+
+    def upload(self):
+        unity_auto_build.start_dropbox_upload_worker()
+        unity_auto_build.dropbox_add_file_to_upload(self.build_dir, 'Game/1.0', False, 'WebPlayer')
+        unity_auto_build.dropbox_add_file_to_upload(os.path.join(self.temp_dir, 'Game.apk'), 'Game/1.0', False, 'Android')
+        unity_auto_build.upload_files_to_dropbox()
+
+    def test_directory_upload_arrives_complete(self):
+        self.use_client()
+        self.upload()
+
+        files = self.clients[0].files
+        expected = dict(('Game/1.0/WebPlayer/' + name, content) for name, content in self.contents.items())
+        expected['Game/1.0/Game.apk'] = self.read(os.path.join(self.temp_dir, 'Game.apk'))
+        self.assertEqual(sorted(files.keys()), sorted(expected.keys()))
+        for path, content in expected.items():
+            self.assertEqual(files[path], content)
+
+        build_info = unity_auto_build.settings.build_info
+        self.assertEqual(build_info['WebPlayer'][unity_auto_build.BuildSettings.key_bi_dropbox_link],
+                         'https://dl.dropboxusercontent.com/s/share/Game/1.0/WebPlayer/WebPlayer.html')
+        self.assertEqual(build_info['Android'][unity_auto_build.BuildSettings.key_bi_dropbox_link],
+                         'https://dl.dropboxusercontent.com/s/share/Game/1.0/Game.apk')
+        self.assertEqual(unity_auto_build.settings.dropbox_upload_errors, [])
+
+    def test_upload_threads_share_one_client(self):
+        self.use_client()
+        self.upload()
+
+        self.assertEqual(len(self.clients), 1)
+        self.assertTrue(unity_auto_build.settings.dropbox_client is self.clients[0])
+        self.assertTrue(len(self.clients[0].threads) > 1)
+
+    def test_worker_failure_fails_build(self):
+        self.use_client(failing=['level1.assets'])
+        self.assertRaises(SystemExit, self.upload)
+
+        errors = unity_auto_build.settings.dropbox_upload_errors
+        self.assertEqual([cache[unity_auto_build.BuildSettings.key_dp_source] for cache in errors], [self.build_dir])
+        self.assertTrue('Game/1.0/Game.apk' in self.clients[0].files)
+        self.assertEqual(unity_auto_build.settings.dropbox_upload_thread, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import unity_auto_build
+from unity_auto_build import PbxprojFile
+
+sample_project = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'Unity-iPhone.pbxproj')
+
+debug_configuration = '1D6058940D05DD3E006BFB54'
+release_configuration = '1D6058950D05DD3E006BFB54'
+tests_configuration = '5623C57F17FDCB0900090B9E'
+
+distribution_identity = 'iPhone Distribution: Example Company'
+
+
+class PbxprojFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'project.pbxproj')
+        shutil.copyfile(sample_project, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_lines(self, path):
+        f = open(path)
+        try:
+            return f.read().splitlines()
+        finally:
+            f.close()
+
+    def build_settings(self, configuration):
+        return PbxprojFile(self.path).root.get('objects').get(configuration).get('buildSettings')
+
+    def update(self, overrides, replacements=None):
+        unity_auto_build.update_xcode_build_settings(self.path, overrides, replacements)
+
+    def test_signing_identity_replaces_default_identity_only(self):
+        self.update({}, {unity_auto_build.xcode_signing_identity_setting:
+                         (unity_auto_build.xcode_default_signing_identity, distribution_identity)})
+
+        key = unity_auto_build.xcode_signing_identity_setting
+        self.assertEqual(self.build_settings(debug_configuration).get(key), distribution_identity)
+        self.assertEqual(self.build_settings(release_configuration).get(key), distribution_identity)
+        self.assertEqual(self.build_settings(tests_configuration).get(key), 'iPhone Distribution: Example Tests')
+
+        changed = [(old, new) for old, new in zip(self.read_lines(sample_project), self.read_lines(self.path)) if old != new]
+        self.assertEqual(changed, [('\t\t\t\t"CODE_SIGN_IDENTITY[sdk=iphoneos*]" = "iPhone Developer";',
+                                    '\t\t\t\t"CODE_SIGN_IDENTITY[sdk=iphoneos*]" = "' + distribution_identity + '";')] * 2)
+
+    def test_configuration_without_build_settings_is_skipped(self):
+        project = PbxprojFile(self.path)
+        self.assertEqual(project.apply_overrides({'*': {'ENABLE_BITCODE': False}}), 3)
+        self.assertTrue(project.save())
+
+        for configuration in (debug_configuration, release_configuration, tests_configuration):
+            self.assertEqual(self.build_settings(configuration).get('ENABLE_BITCODE'), 'NO')
+        self.assertEqual(PbxprojFile(self.path).root.get('objects').get('C01FCF4F08A954540054247B').get('buildSettings'), None)
+
+    def test_overrides_by_configuration_name(self):
+        self.update({'Release': {'OTHER_LDFLAGS': None, 'VALID_ARCHS': ['arm64', 'armv7'], 'STRIP_INSTALLED_PRODUCT': True}})
+
+        release = self.build_settings(release_configuration)
+        self.assertEqual(release.get('OTHER_LDFLAGS'), None)
+        self.assertEqual(release.get('VALID_ARCHS'), ['arm64', 'armv7'])
+        self.assertEqual(release.get('STRIP_INSTALLED_PRODUCT'), 'YES')
+        self.assertEqual(list(release.entries.keys()), ['CODE_SIGN_IDENTITY[sdk=iphoneos*]', 'ENABLE_BITCODE', 'PRODUCT_NAME',
+                                                        'STRIP_INSTALLED_PRODUCT', 'VALID_ARCHS'])
+        self.assertEqual(self.build_settings(tests_configuration).get('VALID_ARCHS'), ['arm64', 'armv7'])
+
+        debug = self.build_settings(debug_configuration)
+        self.assertEqual(debug.get('GCC_PREPROCESSOR_DEFINITIONS'), ['DEBUG=1', '$(inherited)'])
+        self.assertEqual(debug.get('VALID_ARCHS'), None)
+
+    def test_up_to_date_project_is_not_rewritten(self):
+        project = PbxprojFile(self.path)
+        changes = project.apply_overrides({'Debug': {'ENABLE_BITCODE': True, 'PRODUCT_NAME': 'ProductName'}},
+                                          {unity_auto_build.xcode_signing_identity_setting: ('iPhone Developer', 'iPhone Developer')})
+        self.assertEqual(changes, 0)
+        self.assertFalse(project.save())
+        self.assertEqual(self.read_lines(self.path), self.read_lines(sample_project))
+
+
+if __name__ == '__main__':
+    unittest.main()
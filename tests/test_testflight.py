@@ -0,0 +1,132 @@
+import BaseHTTPServer
+import SocketServer
+import cgi
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import unity_auto_build
+
+try:
+    import pycurl
+except ImportError:
+    pycurl = None
+
+
+class MultipartServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, response):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), MultipartHandler)
+        self.response = response
+        self.uploads = []
+
+
+class MultipartHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        form = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                environ={'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': self.headers['Content-Type']})
+        self.server.uploads.append(dict((key, form[key].value) for key in form.keys()))
+
+        body = json.dumps(self.server.response)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(pycurl is None, 'pycurl is not installed')
+class TestflightUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.ipa_data = os.urandom(256 * 1024)
+        self.dsym_data = os.urandom(16 * 1024)
+        with open(os.path.join(self.temp_dir, 'App.ipa'), 'wb') as f:
+            f.write(self.ipa_data)
+        with open(os.path.join(self.temp_dir, 'App.dSYM.zip'), 'wb') as f:
+            f.write(self.dsym_data)
+
+        self.previous_settings = unity_auto_build.settings
+        unity_auto_build.settings = unity_auto_build.BuildSettings()
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        unity_auto_build.settings = self.previous_settings
+        shutil.rmtree(self.temp_dir)
+
+    def start_server(self, response):
+        self.server = MultipartServer(response)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        unity_auto_build.settings.config = {
+            'temp_dir': self.temp_dir,
+            'app_name': 'App',
+            'testflight_url': 'http://127.0.0.1:' + str(self.server.server_port) + '/api/builds.json',
+            'testflight_api_token': 'api',
+            'testflight_team_token': 'team',
+            'testflight_notes': 'notes',
+            'testflight_distribution_lists': ['testers'],
+            'testflight_notify': False,
+            'testflight_replace': True,
+            'platforms': {
+                'iOS': {'ios_build': True, 'testflight_upload': True},
+                'Android': {}}}
+
+    def upload(self):
+        unity_auto_build.start_testflight_uploads()
+        unity_auto_build.upload_projects_to_testflight()
+
+    def test_upload_sends_multipart_form(self):
+        self.start_server({'install_url': 'http://testflight/install'})
+        self.upload()
+
+        self.assertEqual(len(self.server.uploads), 1)
+        upload = self.server.uploads[0]
+        self.assertEqual(upload['file'], self.ipa_data)
+        self.assertEqual(upload['dsym'], self.dsym_data)
+        self.assertEqual(upload['api_token'], 'api')
+        self.assertEqual(upload['distribution_lists'], 'testers')
+        self.assertEqual(upload['replace'], 'true')
+        self.assertEqual(unity_auto_build.settings.build_info['iOS'][unity_auto_build.BuildSettings.key_bi_testflight_link], 'http://testflight/install')
+        self.assertEqual(unity_auto_build.settings.testflight_errors, [])
+
+    def test_missing_install_url_fails_build(self):
+        self.start_server({'message': 'processing'})
+        self.assertRaises(SystemExit, self.upload)
+        self.assertEqual(unity_auto_build.settings.testflight_errors, ['iOS'])
+
+    def test_worker_exception_fails_build(self):
+        self.start_server({'install_url': 'http://testflight/install'})
+        finish_request = unity_auto_build.testflight_finish_request
+
+        def broken_finish_request(request, error_message=None):
+            raise KeyError('install_url')
+
+        unity_auto_build.testflight_finish_request = broken_finish_request
+        try:
+            self.assertRaises(SystemExit, self.upload)
+        finally:
+            unity_auto_build.testflight_finish_request = finish_request
+        self.assertEqual(unity_auto_build.settings.testflight_errors, ['iOS'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import BaseHTTPServer
+import SocketServer
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import unity_auto_build
+
+try:
+    import pycurl
+except ImportError:
+    pycurl = None
+
+
+class ErrorResponse(Exception):
+    def __init__(self, status):
+        Exception.__init__(self, 'status ' + str(status))
+        self.status = status
+
+
+class FlakyUpload:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def __call__(self, data):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'uploaded ' + data
+
+
+class RetryUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous_settings = unity_auto_build.settings
+        unity_auto_build.settings = unity_auto_build.BuildSettings()
+        unity_auto_build.settings.config = {'upload_retries': 3, 'upload_retry_delay': 0}
+
+    def tearDown(self):
+        unity_auto_build.settings = self.previous_settings
+
+    def test_server_errors_are_retried(self):
+        upload = FlakyUpload([ErrorResponse(503), ErrorResponse(429), socket.error('connection reset')])
+        self.assertEqual(unity_auto_build.retry_upload('upload', upload, 'data'), 'uploaded data')
+        self.assertEqual(upload.attempts, 4)
+
+    def test_gives_up_after_configured_retries(self):
+        upload = FlakyUpload([ErrorResponse(503)] * 5)
+        self.assertRaises(ErrorResponse, unity_auto_build.retry_upload, 'upload', upload, 'data')
+        self.assertEqual(upload.attempts, 4)
+
+    def test_client_errors_are_not_retried(self):
+        for status in (400, 403, 404, 409):
+            upload = FlakyUpload([ErrorResponse(status)])
+            self.assertRaises(ErrorResponse, unity_auto_build.retry_upload, 'upload', upload, 'data')
+            self.assertEqual(upload.attempts, 1)
+
+        upload = FlakyUpload([ValueError('bad data')])
+        self.assertRaises(ValueError, unity_auto_build.retry_upload, 'upload', upload, 'data')
+        self.assertEqual(upload.attempts, 1)
+
+    def test_retryable_errors(self):
+        self.assertTrue(unity_auto_build.retryable_upload_error(ErrorResponse(500)))
+        self.assertTrue(unity_auto_build.retryable_upload_error(ErrorResponse(408)))
+        self.assertTrue(unity_auto_build.retryable_upload_error(ErrorResponse(429)))
+        self.assertTrue(unity_auto_build.retryable_upload_error(socket.error('timed out')))
+        self.assertFalse(unity_auto_build.retryable_upload_error(ErrorResponse(404)))
+        self.assertFalse(unity_auto_build.retryable_upload_error(KeyError('path')))
+
+    def test_retry_delay_is_capped(self):
+        unity_auto_build.settings.config.update({'upload_retry_delay': 2, 'upload_retry_max_delay': 10})
+        for attempt in range(8):
+            delay = unity_auto_build.upload_retry_delay(attempt)
+            self.assertTrue(min(2 * 2 ** attempt, 10) / 2.0 <= delay <= min(2 * 2 ** attempt, 10))
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_charge_returns_delay_for_rate(self):
+        bucket = unity_auto_build.TokenBucket(1000)
+        self.assertTrue(bucket.charge(1000) <= 0)
+        self.assertAlmostEqual(bucket.charge(500), 0.5, places=1)
+        self.assertAlmostEqual(bucket.charge(1000), 1.5, places=1)
+
+    def test_consume_paces_to_rate(self):
+        bucket = unity_auto_build.TokenBucket(20000)
+        start = time.time()
+        for i in range(5):
+            bucket.consume(8000)
+        # the first 20000 bytes are the burst, the remaining 20000 take one second
+        self.assertTrue(0.9 <= time.time() - start < 1.5)
+
+
+class FlakyServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, failures, failure_code):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FlakyHandler)
+        self.failures = failures
+        self.failure_code = failure_code
+        self.attempts = 0
+
+
+class FlakyHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 65536)))
+
+        self.server.attempts += 1
+        if self.server.attempts <= self.server.failures:
+            code, body = self.server.failure_code, 'try again later'
+        else:
+            code, body = 200, json.dumps({'install_url': 'http://testflight/install'})
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(pycurl is None, 'pycurl is not installed')
+class TestflightRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        for name in ('App.ipa', 'App.dSYM.zip'):
+            f = open(os.path.join(self.temp_dir, name), 'wb')
+            try:
+                f.write(os.urandom(64 * 1024))
+            finally:
+                f.close()
+
+        self.previous_settings = unity_auto_build.settings
+        unity_auto_build.settings = unity_auto_build.BuildSettings()
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        unity_auto_build.settings = self.previous_settings
+        shutil.rmtree(self.temp_dir)
+
+    def upload(self, failures, failure_code=503):
+        self.server = FlakyServer(failures, failure_code)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        unity_auto_build.settings.config = {
+            'temp_dir': self.temp_dir,
+            'app_name': 'App',
+            'testflight_url': 'http://127.0.0.1:' + str(self.server.server_port) + '/api/builds.json',
+            'testflight_api_token': 'api',
+            'testflight_team_token': 'team',
+            'testflight_notes': 'notes',
+            'testflight_distribution_lists': ['testers'],
+            'testflight_notify': False,
+            'testflight_replace': False,
+            'upload_retries': 2,
+            'upload_retry_delay': 0,
+            'platforms': {'iOS': {'ios_build': True, 'testflight_upload': True}}}
+        unity_auto_build.start_testflight_uploads()
+        unity_auto_build.upload_projects_to_testflight()
+
+    def test_unavailable_server_is_retried(self):
+        self.upload(2)
+        self.assertEqual(self.server.attempts, 3)
+        self.assertEqual(unity_auto_build.settings.build_info['iOS'][unity_auto_build.BuildSettings.key_bi_testflight_link],
+                         'http://testflight/install')
+
+    def test_rate_limited_upload_gives_up_after_retries(self):
+        self.assertRaises(SystemExit, self.upload, 5, 429)
+        self.assertEqual(self.server.attempts, 3)
+        self.assertEqual(unity_auto_build.settings.testflight_errors, ['iOS'])
+
+    def test_client_error_is_not_retried(self):
+        self.assertRaises(SystemExit, self.upload, 1, 403)
+        self.assertEqual(self.server.attempts, 1)
+        self.assertEqual(unity_auto_build.settings.testflight_errors, ['iOS'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import unity_auto_build
+
+
+class XcodeArchivePruneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.archives_dir = os.path.join(self.temp_dir, 'Archives')
+
+        self.previous_settings = unity_auto_build.settings
+        unity_auto_build.settings = unity_auto_build.BuildSettings()
+        unity_auto_build.settings.config = {
+            'app_name': 'Game',
+            'xcode_archives_dir': self.archives_dir,
+            'xcode_archive_keep': 2,
+            'xcode_archive_max_size_mb': 0}
+        unity_auto_build.settings.bundle_version = '1.0'
+        unity_auto_build.settings.build_number = 10
+
+    def tearDown(self):
+        unity_auto_build.settings = self.previous_settings
+        shutil.rmtree(self.temp_dir)
+
+    def create_archive(self, name, days_ago=0, size=1024, version='1.0', platform='iOS', indexed=True):
+        created = time.time() - days_ago * 24 * 3600
+        path = os.path.join(self.archives_dir, time.strftime('%Y-%m-%d', time.localtime(created)), name + '.xcarchive')
+        os.makedirs(os.path.join(path, 'Products'))
+        f = open(os.path.join(path, 'Products', 'Game.app'), 'wb')
+        try:
+            f.write('\0' * size)
+        finally:
+            f.close()
+
+        if indexed:
+            index = unity_auto_build.read_json_file(unity_auto_build.xcode_archive_index_file(), [])
+            index.append({'path': path, 'app': 'Game', 'platform': platform, 'version': version, 'build': days_ago,
+                          'created': created, 'size': size})
+            unity_auto_build.write_json_file(unity_auto_build.xcode_archive_index_file(), index)
+        return path
+
+    def indexed_paths(self):
+        return [entry['path'] for entry in unity_auto_build.read_json_file(unity_auto_build.xcode_archive_index_file(), [])]
+
+    def test_keeps_newest_archives_per_version(self):
+        oldest = self.create_archive('oldest', days_ago=3)
+        older = self.create_archive('older', days_ago=2)
+        other_version = self.create_archive('other version', days_ago=5, version='0.9')
+        other_platform = self.create_archive('other platform', days_ago=4, platform='iOS-dev')
+        current = self.create_archive('current', indexed=False)
+
+        unity_auto_build.xcode_archive_record(current, 'iOS')
+
+        self.assertFalse(os.path.exists(oldest))
+        self.assertFalse(os.path.exists(os.path.dirname(oldest)))
+        for path in (older, other_version, other_platform, current):
+            self.assertTrue(os.path.isdir(path))
+        self.assertEqual(sorted(self.indexed_paths()), sorted([older, other_version, other_platform, current]))
+
+    def test_size_limit_removes_oldest_archives_first(self):
+        unity_auto_build.settings.config.update({'xcode_archive_keep': 10, 'xcode_archive_max_size_mb': 3})
+        megabyte = 1024 * 1024
+        oldest = self.create_archive('oldest', days_ago=30, size=megabyte, version='0.8')
+        old = self.create_archive('old', days_ago=20, size=megabyte, version='0.9')
+        recent = self.create_archive('recent', days_ago=1, size=megabyte)
+        current = self.create_archive('current', size=megabyte, indexed=False)
+
+        unity_auto_build.xcode_archive_record(current, 'iOS')
+
+        self.assertFalse(os.path.exists(oldest))
+        for path in (old, recent, current):
+            self.assertTrue(os.path.isdir(path))
+        self.assertEqual(sorted(self.indexed_paths()), sorted([old, recent, current]))
+
+    def test_never_removes_current_archive(self):
+        unity_auto_build.settings.config.update({'xcode_archive_keep': 1, 'xcode_archive_max_size_mb': 1})
+        newer = self.create_archive('newer', size=1024)
+        current = self.create_archive('current', days_ago=1, size=2 * 1024 * 1024, indexed=False)
+
+        index = unity_auto_build.read_json_file(unity_auto_build.xcode_archive_index_file(), [])
+        index.append({'path': current, 'app': 'Game', 'platform': 'iOS', 'version': '1.0', 'build': 10,
+                      'created': time.time() - 24 * 3600, 'size': 2 * 1024 * 1024})
+        kept = unity_auto_build.xcode_archive_prune(index, current)
+
+        self.assertTrue(os.path.isdir(current))
+        self.assertFalse(os.path.exists(newer))
+        self.assertEqual([entry['path'] for entry in kept], [current])
+
+    def test_leaves_unindexed_archives_alone(self):
+        unity_auto_build.settings.config['xcode_archive_keep'] = 1
+        manual = self.create_archive('archived in xcode', days_ago=10, indexed=False)
+        missing = self.create_archive('deleted by hand', days_ago=5)
+        shutil.rmtree(missing)
+        current = self.create_archive('current', indexed=False)
+
+        unity_auto_build.xcode_archive_record(current, 'iOS')
+
+        self.assertTrue(os.path.isdir(manual))
+        self.assertEqual(self.indexed_paths(), [current])
+
+
+if __name__ == '__main__':
+    unittest.main()
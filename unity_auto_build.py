@@ -7,10 +7,8 @@ import os
 import json
 import subprocess
 import StringIO
-import fileinput
+import Queue
 import re
-import smtplib
-from email.mime.text import MIMEText
 import shlex
 from os.path import expanduser
 import zipfile
@@ -20,34 +18,104 @@ import getpass
 import time
 import xml.etree.ElementTree as ET
 import datetime
-
-try:
-    import dropbox
-except ImportError, e:
-    log_error('no dropbox python sdk, please install it: \nhttps://www.dropbox.com/developers/core/sdks/python')
-    exit(1)
-
-try:
-    import pycurl
-except ImportError, e:
-    log_error('no pycurl, please install it: \nhttp://pycurl.sourceforge.net/doc/install.html')
-    exit(1)
-
-try:
-    import keyring
-except ImportError, e:
-    log_error('no pycurl, please install it: \nhttps://pypi.python.org/pypi/keyring')
-    exit(1)
-
-try:
-    from git import *
-except ImportError, e:
-    log_error('no GitPython module, please install it: \nhttps://pythonhosted.org/GitPython/0.3.1/intro.html#installing-gitpython')
-    exit(1)
+import importlib
+import BaseHTTPServer
+import SocketServer
+import traceback
+import signal
+import collections
+import contextlib
+import threading
+import shutil
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import stat
+import struct
+import zlib
+import random
+import socket
+import httplib
+import itertools
+import fnmatch
+import pipes
+import email.utils
+import ctypes
+import ctypes.util
+import fcntl
+import urllib
+import sqlite3
+
+# loaded on demand by backends, see load_backends()
+dropbox = None
+pycurl = None
+keyring = None
+git = None
+smtplib = None
+MIMEText = None
 
 verbose = False
 settings = None
+daemon_port = None
+daemon_config_dir = None
+daemon_allowed_config = None
+daemon_checked_configs = set()
+daemon_dropbox_clients = {}
 ignored_files = ['.DS_Store']
+workspace_skipped_dirs = ['.git', 'Library', 'Temp', 'obj']
+workspace_copied_dirs = ['ProjectSettings', 'Packages']
+workspace_copied_patterns = ['*.meta', '*.csproj', '*.sln', '*.userprefs']
+dropbox_client_lock = threading.Lock()
+dropbox_manifest_lock = threading.Lock()
+build_cache_lock = threading.Lock()
+unity_report_lock = threading.Lock()
+trace_lock = threading.Lock()
+library_cache_lock = threading.Lock()
+xcode_archive_lock = threading.Lock()
+xcode_signing_identity_setting = 'CODE_SIGN_IDENTITY[sdk=iphoneos*]'
+xcode_default_signing_identity = 'iPhone Developer'
+artifact_store_lock = threading.Lock()
+artifact_store_grace_period = 3600
+upload_bucket_lock = threading.Lock()
+session_cache_lock = threading.Lock()
+session_cache_file_mode = 0600
+publish_buffer_size = 8 * 1024 * 1024
+publish_unsupported = set()
+publish_fallback_errors = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM, errno.ENOTTY, errno.EOPNOTSUPP, errno.EBADF)
+FICLONE = 0x40049409
+history_min_runs = 3
+history_min_seconds = 1.0
+history_min_bytes = 64 * 1024
+upload_sequence = itertools.count()
+library_marker_file = 'unity_auto_build_platform.txt'
+build_cache_inputs = ['Assets', 'ProjectSettings']
+build_cache_stale_temp_age = 6 * 60 * 60
+command_output_tail_lines = 200
+command_output_read_size = 64 * 1024
+command_output_max_line_length = 64 * 1024
+command_terminate_grace_period = 10
+testflight_progress_interval = 0.5
+unit_test_method = 'UnityTest.Batch.RunUnitTests'
+unit_test_result_file = 'UnitTestResults.xml'
+unit_test_noise_pattern = re.compile('//[^\\n]*|/\\*.*?\\*/|@"(?:[^"]|"")*"|"(?:\\\\.|[^"\\\\\\n])*"|\'(?:\\\\.|[^\'\\\\\\n])*\'', re.DOTALL)
+unit_test_source_pattern = re.compile('(?P<namespace>\\bnamespace\\s+(?P<namespace_name>[\\w.]+)\\s*\\{)|'
+                                      '(?P<class>(?P<modifiers>\\b(?:(?:public|internal|private|protected|sealed|abstract|static|partial)\\s+)*)'
+                                      '(?:class|struct)\\s+(?P<class_name>\\w+)\\s*(?P<generic><[^{;]*?>)?\\s*'
+                                      '(?::\\s*(?P<base>[\\w.]+)[^{;]*)?(?:where[^{;]*)?\\{)|'
+                                      '(?P<attribute>\\[[^\\[\\]]*\\])|(?P<method>\\b\\w+\\s*(?:<[^<>()]*>)?\\s*\\()|(?P<open>\\{)|(?P<close>\\})')
+unit_test_attribute_pattern = re.compile('(?:^|[\\[,])\\s*(?:NUnit\\.Framework\\.)?(Test|TestCase|TestCaseSource|Theory|TestFixture)(?:Attribute)?\\s*(?:[(,\\]]|$)')
+unit_test_method_pattern = re.compile('(\\w+)\\s*(?:<[^<>()]*>)?\\s*\\($')
+unit_test_generic_pattern = re.compile('<[^<>]*>')
+unit_test_count_attributes = ['total', 'errors', 'failures', 'not-run', 'inconclusive', 'ignored', 'skipped', 'invalid']
+unit_test_regression_min_runs = 3
+unit_test_regression_min_seconds = 0.1
+unit_test_report_size = 10
+zip_chunk_size = 4 * 1024 * 1024
+zip_sample_size = 64 * 1024
+zip_sample_count = 16
+zip_pool_min_size = 1024 * 1024
+crc32_chunk_operator = None
+zip_stored_extensions = ['.apk', '.ipa', '.obb', '.zip', '.gz', '.bz2', '.xz', '.7z', '.png', '.jpg', '.jpeg', '.gif', '.webp',
+                         '.pvr', '.ktx', '.mp3', '.ogg', '.aac', '.m4a', '.mp4', '.unity3d', '.assetbundle']
 
 class BuildSettings:
     def __init__(self):
@@ -61,7 +129,18 @@ class BuildSettings:
         self.build_info = {}
 
         self.tf_upload_response = {}
+        self.testflight_thread = None
+        self.testflight_errors = []
         self.dropbox_upload_cache = []
+        self.dropbox_upload_queue = None
+        self.dropbox_upload_thread = None
+        self.dropbox_upload_errors = []
+        self.dropbox_client = None
+        self.dropbox_account_info = None
+        self.upload_bucket = None
+        self.session_cache = None
+        self.history_regressions = []
+        self.history_recorded = False
 
         self.log_file_name = 'build.log'
         self.log_file = None
@@ -71,9 +150,15 @@ class BuildSettings:
         self.start_time = 0
         self.tests_total = 0
         self.tests_errors = 0
+        self.project_fingerprint = None
+        self.unity_reports = []
+        self.unit_test_report = None
+        self.trace_events = []
+        self.trace_threads = {}
 
     key_bi_dropbox_link = 'dropbox'
     key_bi_testflight_link = 'testflight'
+    key_bi_local_link = 'local'
 
     key_dp_source = 'source'
     key_dp_destination = 'destination'
@@ -101,6 +186,10 @@ class BuildSettings:
     key_version_file = 'version_file'
     key_unity_app = 'unity_app'
     key_unity_app_args = 'unity_app_args'
+    key_command_timeout = 'command_timeout'
+    key_command_idle_timeout = 'command_idle_timeout'
+    key_trace_file = 'trace_file'
+    key_zip_workers = 'zip_workers'
     key_temp_dir = 'temp_dir'
     key_bundle_method = 'bundle_method'
     key_bundle_output_path = 'bundle_output_path'
@@ -112,6 +201,13 @@ class BuildSettings:
     key_dropbox_upload_path = 'dropbox_upload_path'
     key_dropbox_zip_upload = 'dropbox_zip_upload'
     key_dropbox_bundle_path = 'dropbox_bundle_path'
+    key_dropbox_pipeline_uploads = 'dropbox_pipeline_uploads'
+    key_dropbox_upload_threads = 'dropbox_upload_threads'
+    key_dropbox_chunked_upload_threshold = 'dropbox_chunked_upload_threshold_mb'
+    key_dropbox_chunk_size = 'dropbox_chunk_size_mb'
+    key_dropbox_manifest = 'dropbox_manifest'
+    key_dropbox_delete_removed = 'dropbox_delete_removed'
+    key_dropbox_stream_zip = 'dropbox_stream_zip'
 
     key_platforms = 'platforms'
     key_unity_build_method = 'unity_build_method'
@@ -130,9 +226,53 @@ class BuildSettings:
     key_testflight_notify = 'testflight_notify'
     key_testflight_replace = 'testflight_replace'
 
+    key_session_cache_ttl = 'session_cache_ttl_hours'
+
+    key_history_db = 'history_db'
+    key_history_baseline_runs = 'history_baseline_runs'
+    key_history_regression_threshold = 'history_regression_threshold_percent'
+
+    key_local_publish_dir = 'local_publish_dir'
+    key_local_publish_url = 'local_publish_url'
+    key_local_publish_hardlinks = 'local_publish_hardlinks'
+
+    key_upload_retries = 'upload_retries'
+    key_upload_retry_delay = 'upload_retry_delay'
+    key_upload_retry_max_delay = 'upload_retry_max_delay'
+    key_upload_bandwidth_limit = 'upload_bandwidth_limit_kb'
+
+    key_parallel_builds = 'parallel_builds'
+    key_parallel_max_builds = 'parallel_max_builds'
+    key_parallel_admission_delay = 'parallel_admission_delay'
+    key_parallel_min_free_memory = 'parallel_min_free_memory_mb'
+    key_parallel_min_free_disk = 'parallel_min_free_disk_mb'
+    key_workspace_dir = 'workspace_dir'
+
+    key_build_cache_dir = 'build_cache_dir'
+    key_build_cache_max_size = 'build_cache_max_size_mb'
+    key_build_cache_exclude = 'build_cache_exclude'
+
+    key_library_cache_dir = 'library_cache_dir'
+    key_library_cache_max_size = 'library_cache_max_size_mb'
+
+    key_unit_test_shards = 'unit_test_shards'
+    key_unit_test_fail_fast = 'unit_test_fail_fast'
+    key_unit_test_max_parallel = 'unit_test_max_parallel'
+    key_unit_test_history = 'unit_test_history'
+    key_unit_test_history_runs = 'unit_test_history_runs'
+    key_unit_test_regression_factor = 'unit_test_regression_factor'
+
+    key_artifact_store_dir = 'artifact_store_dir'
+    key_artifact_store_max_size = 'artifact_store_max_size_mb'
+    key_artifact_store_max_age = 'artifact_store_max_age_days'
+
     key_ios_build = 'ios_build'
     key_xcode_profile_name = 'xcode_profile_name'
     key_xcode_profile_file = 'xcode_profile_file'
+    key_xcode_build_settings = 'xcode_build_settings'
+    key_xcode_archives_dir = 'xcode_archives_dir'
+    key_xcode_archive_keep = 'xcode_archive_keep'
+    key_xcode_archive_max_size = 'xcode_archive_max_size_mb'
 
     def __str__(self):
         output = BuildSettings.print_dict(self.config)
@@ -144,23 +284,101 @@ class BuildSettings:
         self.start_time = time.time()
 
     def end_timer(self):
-        execution_time = time.time() - self.start_time
-        self.execution_time_text = str(datetime.timedelta(seconds=execution_time))
+        self.execution_time = time.time() - self.start_time
+        self.execution_time_text = str(datetime.timedelta(seconds=self.execution_time))
         log_info('execution time: ' + self.execution_time_text)
 
+    def add_trace_event(self, name, category, start_time, end_time, args=None):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': int((start_time - self.start_time) * 1000000),
+            'dur': int((end_time - start_time) * 1000000),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': args or {}}
+        with trace_lock:
+            self.trace_events.append(event)
+            self.trace_threads[thread.ident] = thread.name
+
+    def save_trace(self):
+        trace_file = self.option(BuildSettings.key_trace_file, os.path.splitext(self.log_file_name)[0] + '_trace.json')
+        with trace_lock:
+            events = list(self.trace_events)
+            for tid, name in self.trace_threads.items():
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}})
+        write_json_file(trace_file, {'traceEvents': events, 'displayTimeUnit': 'ms'})
+        log_debug('trace saved: ' + trace_file)
+
     def start_log(self):
         self.log_file = open(self.log_file_name, 'w', buffering=0)
 
     def end_log(self):
         self.log_file.close()
 
-    def add_build_info(self, platform_name, dropbox_link=None, testflight_link=None):
+    def add_unity_report(self, report):
+        with unity_report_lock:
+            self.unity_reports.append(report)
+            report_file = os.path.splitext(self.log_file_name)[0] + '_unity_report.json'
+            write_json_file(report_file, self.unity_reports)
+
+    def generate_unity_reports_info(self):
+        if len(self.unity_reports) == 0:
+            return ''
+
+        info = 'Unity build breakdown:\n'
+        for report in self.unity_reports:
+            info += ' - ' + report['name'] + ': ' + format_duration(report['total_time']) + ' (' + report['result'] + ')\n'
+            for phase in report['phases']:
+                info += '     ' + phase['name'] + ': ' + format_duration(phase['time']) + '\n'
+            if len(report['sizes']) > 0:
+                sizes = [category + ' ' + format_size(size) for category, size in report['sizes']]
+                info += '     sizes: ' + ', '.join(sizes) + '\n'
+            if 'library_cache' in report:
+                info += '     library cache: ' + report['library_cache']
+                if report.get('import_time_saved') is not None:
+                    info += ', reimport time saved: ' + format_duration(report['import_time_saved'])
+                info += '\n'
+        return info
+
+    def generate_unit_test_report_info(self):
+        if self.unit_test_report is None:
+            return ''
+
+        info = 'Slowest unit tests:\n'
+        for test in self.unit_test_report['slowest']:
+            info += ' - ' + test['name'] + ': ' + "{0:.2f}".format(test['time']) + ' s\n'
+        if len(self.unit_test_report['regressed']) > 0:
+            info += 'Slower than usual unit tests:\n'
+            for test in self.unit_test_report['regressed']:
+                info += ' - ' + test['name'] + ': ' + "{0:.2f}".format(test['time']) + ' s (median ' +\
+                        "{0:.2f}".format(test['median']) + ' s)\n'
+        return info
+
+    def generate_history_info(self):
+        if len(self.history_regressions) == 0:
+            return ''
+
+        info = 'Regressions against recent builds:\n'
+        for kind, name, value, baseline in self.history_regressions:
+            if kind == 'artifact':
+                text = format_size(value) + ' (baseline ' + format_size(baseline) + ')'
+            else:
+                text = format_duration(value) + ' (baseline ' + format_duration(baseline) + ')'
+            info += ' - ' + kind + ' ' + name + ': ' + text + ', +' + "{0:.0f}".format((value / baseline - 1) * 100) + '%\n'
+        return info
+
+    def add_build_info(self, platform_name, dropbox_link=None, testflight_link=None, local_link=None):
         if platform_name not in self.build_info:
             self.build_info[platform_name] = {}
         if dropbox_link is not None:
             self.build_info[platform_name][BuildSettings.key_bi_dropbox_link] = dropbox_link
         if testflight_link is not None:
             self.build_info[platform_name][BuildSettings.key_bi_testflight_link] = testflight_link
+        if local_link is not None:
+            self.build_info[platform_name][BuildSettings.key_bi_local_link] = local_link
 
     def generate_build_info(self):
         info = ''
@@ -184,6 +402,16 @@ class BuildSettings:
                 info += self.build_info[platform_name][BuildSettings.key_bi_testflight_link]
                 info += ' )\n'
 
+        local_text = False
+        for platform_name in self.build_info.keys():
+            if BuildSettings.key_bi_local_link in self.build_info[platform_name]:
+                if not local_text:
+                    info += '\nLocal:\n'
+                    local_text = True
+                info += ' - ' + platform_name + ' ( '
+                info += self.build_info[platform_name][BuildSettings.key_bi_local_link]
+                info += ' )\n'
+
         return info
 
     @staticmethod
@@ -226,6 +454,7 @@ class BuildSettings:
                 BuildSettings.key_ios_build             : True,
                 BuildSettings.key_xcode_profile_name    : "iPhone Distribution: Some Developer (some numbers)",
                 BuildSettings.key_xcode_profile_file    : "relative_path_to_provisioning_prifile/profile_name.mobileprovision",
+                BuildSettings.key_xcode_build_settings  : {"Release": {"ENABLE_BITCODE": False}},
                 BuildSettings.key_testflight_upload     : True,
                 BuildSettings.key_dropbox_upload        : True,
                 BuildSettings.key_dropbox_upload_path   : "Public/MyPorjectName/iOS/",
@@ -241,10 +470,36 @@ class BuildSettings:
         sample.config[BuildSettings.key_version_file] = 'Assets/Resources/version.txt'
         sample.config[BuildSettings.key_unity_app] = '/Applications/Unity/Unity.app/Contents/MacOS/Unity'
         sample.config[BuildSettings.key_unity_app_args] = '-logFile'
+        sample.config[BuildSettings.key_command_timeout] = 7200
+        sample.config[BuildSettings.key_command_idle_timeout] = 1800
+        sample.config[BuildSettings.key_trace_file] = 'build_trace.json'
+        sample.config[BuildSettings.key_zip_workers] = 0
 
         sample.config[BuildSettings.key_dropbox_app_key] = '_dropbox_app_key_ (you need to create app)'
         sample.config[BuildSettings.key_dropbox_app_secret] = '_dropbox_app_secret_'
         sample.config[BuildSettings.key_dropbox_access_token] = None
+        sample.config[BuildSettings.key_dropbox_pipeline_uploads] = False
+        sample.config[BuildSettings.key_dropbox_upload_threads] = 8
+        sample.config[BuildSettings.key_dropbox_chunked_upload_threshold] = 64
+        sample.config[BuildSettings.key_dropbox_chunk_size] = 8
+        sample.config[BuildSettings.key_dropbox_manifest] = True
+        sample.config[BuildSettings.key_dropbox_delete_removed] = False
+        sample.config[BuildSettings.key_dropbox_stream_zip] = False
+
+        sample.config[BuildSettings.key_session_cache_ttl] = 24
+
+        sample.config[BuildSettings.key_history_db] = None
+        sample.config[BuildSettings.key_history_baseline_runs] = 10
+        sample.config[BuildSettings.key_history_regression_threshold] = 25
+
+        sample.config[BuildSettings.key_local_publish_dir] = None
+        sample.config[BuildSettings.key_local_publish_url] = None
+        sample.config[BuildSettings.key_local_publish_hardlinks] = False
+
+        sample.config[BuildSettings.key_upload_retries] = 5
+        sample.config[BuildSettings.key_upload_retry_delay] = 2
+        sample.config[BuildSettings.key_upload_retry_max_delay] = 120
+        sample.config[BuildSettings.key_upload_bandwidth_limit] = 0
 
         sample.config[BuildSettings.key_testflight_url]                 = 'http://testflightapp.com/api/builds.json'
         sample.config[BuildSettings.key_testflight_api_token]           = '_testflight_api_token_'
@@ -260,10 +515,43 @@ class BuildSettings:
         sample.config[BuildSettings.key_notification_mail_title] = '[new build][MyPorjectName]'
         sample.config[BuildSettings.key_commit_changes] = False
 
+        sample.config[BuildSettings.key_parallel_builds] = False
+        sample.config[BuildSettings.key_parallel_max_builds] = 2
+        sample.config[BuildSettings.key_parallel_admission_delay] = 30
+        sample.config[BuildSettings.key_parallel_min_free_memory] = 6144
+        sample.config[BuildSettings.key_parallel_min_free_disk] = 20480
+        sample.config[BuildSettings.key_workspace_dir] = '/tmp/unity_workspaces'
+
+        sample.config[BuildSettings.key_build_cache_dir] = None
+        sample.config[BuildSettings.key_build_cache_max_size] = 20480
+        sample.config[BuildSettings.key_build_cache_exclude] = []
+
+        sample.config[BuildSettings.key_library_cache_dir] = None
+        sample.config[BuildSettings.key_library_cache_max_size] = 51200
+
+        sample.config[BuildSettings.key_xcode_archives_dir] = None
+        sample.config[BuildSettings.key_xcode_archive_keep] = 3
+        sample.config[BuildSettings.key_xcode_archive_max_size] = 20480
+
+        sample.config[BuildSettings.key_artifact_store_dir] = None
+        sample.config[BuildSettings.key_artifact_store_max_size] = 102400
+        sample.config[BuildSettings.key_artifact_store_max_age] = 30
+
+        # every shard runs in its own workspace holding a full copy of the project Library, see prepare_workspace()
+        sample.config[BuildSettings.key_unit_test_shards] = 1
+        sample.config[BuildSettings.key_unit_test_fail_fast] = False
+        sample.config[BuildSettings.key_unit_test_max_parallel] = 2
+        sample.config[BuildSettings.key_unit_test_history] = None
+        sample.config[BuildSettings.key_unit_test_history_runs] = 10
+        sample.config[BuildSettings.key_unit_test_regression_factor] = 1.5
+
         sample.save_config_file(file_name)
 
         return sample
 
+    def option(self, key, default=None):
+        return self.config.get(key, default)
+
     def pretty_version(self):
         return self.bundle_version + ' (' + str(self.build_number) + ')'
 
@@ -289,6 +577,664 @@ class BuildSettings:
         finally:
             f.close()
 
+class UnityLogParser:
+    phase_markers = [
+        ('asset import', re.compile('Refresh: detecting if any assets need to be imported|^Start importing |^Updating Assets/')),
+        ('script compilation', re.compile('- starting compile|^Compiling scripts|^Starting: .*(mcs|csc)')),
+        ('assembly reload', re.compile('^Reloading assemblies|^Begin MonoManager ReloadAssembly')),
+        ('shader compilation', re.compile('^Compiling shader ')),
+        ('asset bundle build', re.compile('DisplayProgressbar: Building Asset ?Bundles|^Building AssetBundle')),
+        ('player build', re.compile('DisplayProgressbar: Building Player|^Building Player|^BuildPlayer')),
+    ]
+    idle_marker = re.compile('^Refresh: elapses|^Refresh completed|- Finished compile|^Mono: successfully reloaded assembly|'
+                             '- Completed reload|^Build Finished, Result|^\\*\\*\\* Completed')
+    result_marker = re.compile('Build Finished, Result: (\\w+)|^\\*\\*\\* Completed .* in ')
+    report_start = re.compile('^Build Report|^Uncompressed usage by category')
+    size_line = re.compile('^(Textures|Meshes|Animations|Sounds|Shaders|Other Assets|Levels|Scripts|Included DLLs|File headers|'
+                           'Total User Assets|Complete size|Complete build size)\\s+([\\d.]+) (kb|mb|gb)')
+    size_units = {'kb': 1024, 'mb': 1024 * 1024, 'gb': 1024 * 1024 * 1024}
+
+    def __init__(self, name):
+        self.name = name
+        self.start_time = time.time()
+        self.phase = None
+        self.phase_start = self.start_time
+        self.phase_times = collections.OrderedDict()
+        self.in_report = False
+        self.sizes = []
+        self.result = 'unknown'
+
+    def feed(self, line):
+        line = line.strip()
+        now = time.time()
+
+        for phase, marker in UnityLogParser.phase_markers:
+            if marker.search(line):
+                if phase != self.phase:
+                    self.switch_phase(phase, now)
+                break
+        else:
+            if UnityLogParser.idle_marker.search(line):
+                self.switch_phase(None, now)
+
+        m = UnityLogParser.result_marker.search(line)
+        if m is not None:
+            self.result = m.group(1) if m.group(1) is not None else 'Success'
+
+        if UnityLogParser.report_start.search(line):
+            self.in_report = True
+        elif self.in_report:
+            m = UnityLogParser.size_line.search(line)
+            if m is not None:
+                self.sizes.append((m.group(1), int(float(m.group(2)) * UnityLogParser.size_units[m.group(3)])))
+
+    def switch_phase(self, phase, now):
+        if self.phase is not None:
+            self.phase_times[self.phase] = self.phase_times.get(self.phase, 0) + now - self.phase_start
+        self.phase = phase
+        self.phase_start = now
+
+    def finish(self):
+        now = time.time()
+        self.switch_phase(None, now)
+        total_time = now - self.start_time
+        other_time = total_time - sum(self.phase_times.values())
+
+        phases = [{'name': phase, 'time': phase_time} for phase, phase_time in self.phase_times.items()]
+        phases.append({'name': 'other', 'time': max(other_time, 0)})
+        return {'name': self.name, 'total_time': total_time, 'result': self.result, 'phases': phases, 'sizes': self.sizes}
+
+class PbxprojDict:
+    def __init__(self, start):
+        self.start = start
+        self.end = None
+        self.entries = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            return self.entries[key]['value']
+        return default
+
+class PbxprojFile:
+    token_pattern = re.compile('\\s+|/\\*.*?\\*/|//[^\\n]*|"(?:[^"\\\\]|\\\\.)*"|[\\w$+/:.\\-]+|[{}()=;,]', re.DOTALL)
+    unquoted_pattern = re.compile('^[\\w$/:.\\-]+$')
+
+    def __init__(self, path):
+        self.path = path
+        f = open(path)
+        try:
+            self.text = f.read()
+        finally:
+            f.close()
+        self.tokens = self.tokenize()
+        self.position = 0
+        self.root = self.parse_value()
+        self.edits = []
+
+    def tokenize(self):
+        tokens = []
+        position = 0
+        while position < len(self.text):
+            match = PbxprojFile.token_pattern.match(self.text, position)
+            if match is None:
+                raise ValueError('unexpected character in ' + self.path + ' at offset ' + str(position))
+            token = match.group(0)
+            if not token[0].isspace() and not token.startswith('/*') and not token.startswith('//'):
+                tokens.append((token, match.start(), match.end()))
+            position = match.end()
+        return tokens
+
+    def next_token(self, expected=None):
+        if self.position >= len(self.tokens):
+            raise ValueError('unexpected end of ' + self.path)
+        token = self.tokens[self.position]
+        self.position += 1
+        if expected is not None and token[0] != expected:
+            raise ValueError('expected ' + expected + ' in ' + self.path + ' at offset ' + str(token[1]) + ', got: ' + token[0])
+        return token
+
+    def parse_value(self):
+        token, start, end = self.next_token()
+        if token == '{':
+            dictionary = PbxprojDict(start)
+            while self.tokens[self.position][0] != '}':
+                key, key_start, key_end = self.next_token()
+                self.next_token('=')
+                value_start = self.tokens[self.position][1]
+                value = self.parse_value()
+                value_end = self.tokens[self.position - 1][2]
+                entry_end = self.next_token(';')[2]
+                dictionary.entries[PbxprojFile.unquote(key)] = {
+                    'value': value, 'start': key_start, 'end': entry_end, 'value_start': value_start, 'value_end': value_end}
+            dictionary.end = self.next_token('}')[1]
+            return dictionary
+        if token == '(':
+            array = []
+            while self.tokens[self.position][0] != ')':
+                array.append(self.parse_value())
+                if self.tokens[self.position][0] == ',':
+                    self.next_token(',')
+            self.next_token(')')
+            return array
+        if token in ('}', ')', '=', ';', ','):
+            raise ValueError('unexpected ' + token + ' in ' + self.path + ' at offset ' + str(start))
+        return PbxprojFile.unquote(token)
+
+    @staticmethod
+    def unquote(token):
+        if not token.startswith('"'):
+            return token
+        return re.sub('\\\\(.)', lambda match: {'n': '\n', 't': '\t'}.get(match.group(1), match.group(1)), token[1:-1])
+
+    @staticmethod
+    def quote(value):
+        if isinstance(value, list):
+            return '(' + ''.join(PbxprojFile.quote(item) + ', ' for item in value) + ')'
+        if PbxprojFile.unquoted_pattern.match(value):
+            return value
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+    @staticmethod
+    def normalize(value):
+        if isinstance(value, bool):
+            return 'YES' if value else 'NO'
+        if isinstance(value, (list, tuple)):
+            return [PbxprojFile.normalize(item) for item in value]
+        if value is None or isinstance(value, basestring):
+            return value
+        return str(value)
+
+    def build_configurations(self):
+        objects = self.root.get('objects') if isinstance(self.root, PbxprojDict) else None
+        if not isinstance(objects, PbxprojDict):
+            raise ValueError('no objects in ' + self.path)
+        for entry in objects.entries.values():
+            value = entry['value']
+            if isinstance(value, PbxprojDict) and value.get('isa') == 'XCBuildConfiguration':
+                yield value
+
+    def line_start(self, position):
+        return self.text.rfind('\n', 0, position) + 1
+
+    def set_build_setting(self, build_settings, key, value):
+        value = PbxprojFile.normalize(value)
+        entry = build_settings.entries.get(key)
+
+        if value is None:
+            if entry is not None:
+                end = entry['end'] + 1 if self.text[entry['end']:entry['end'] + 1] == '\n' else entry['end']
+                self.edits.append((self.line_start(entry['start']), end, ''))
+            return
+        if entry is not None:
+            if entry['value'] != value:
+                self.edits.append((entry['value_start'], entry['value_end'], PbxprojFile.quote(value)))
+            return
+
+        following = [other for other_key, other in build_settings.entries.items() if other_key > key]
+        if len(following) > 0:
+            position = self.line_start(following[0]['start'])
+            indent = self.text[position:following[0]['start']]
+        else:
+            position = self.line_start(build_settings.end)
+            indent = self.text[position:build_settings.end]
+            if indent.strip() != '':
+                self.edits.append((build_settings.end, build_settings.end, PbxprojFile.quote(key) + ' = ' + PbxprojFile.quote(value) + '; '))
+                return
+            indent += '\t'
+        self.edits.append((position, position, indent + PbxprojFile.quote(key) + ' = ' + PbxprojFile.quote(value) + ';\n'))
+
+    def apply_overrides(self, overrides, replacements=None):
+        for configuration in self.build_configurations():
+            build_settings = configuration.get('buildSettings')
+            if not isinstance(build_settings, PbxprojDict):
+                log_debug('skipping xcode build configuration without build settings: ' + str(configuration.get('name')))
+                continue
+
+            # replacements only touch settings that still have the expected value, e.g. the default signing identity
+            configuration_overrides = {}
+            for key, (current, value) in (replacements or {}).items():
+                if build_settings.get(key) == current:
+                    configuration_overrides[key] = value
+            configuration_overrides.update(overrides.get('*', {}))
+            configuration_overrides.update(overrides.get(configuration.get('name'), {}))
+            for key in sorted(configuration_overrides.keys()):
+                self.set_build_setting(build_settings, key, configuration_overrides[key])
+        return len(self.edits)
+
+    def save(self):
+        if len(self.edits) == 0:
+            return False
+
+        text = self.text
+        for index, (start, end, replacement) in reversed(sorted(enumerate(self.edits), key=lambda edit: (edit[1][0], edit[0]))):
+            if isinstance(replacement, unicode):
+                replacement = replacement.encode('utf-8')
+            text = text[:start] + replacement + text[end:]
+        temp_path = self.path + '.tmp'
+        f = open(temp_path, 'w')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+        os.rename(temp_path, self.path)
+        return True
+
+class ZipStreamWriter:
+    zip64_limit = (1 << 31) - 1
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offset = 0
+        self.entries = []
+        self.member = None
+
+    def write(self, data):
+        self.stream.write(data)
+        self.offset += len(data)
+
+    def start_member(self, arcname, stat, compress_type):
+        mtime = time.localtime(stat.st_mtime)
+        dos_date = (max(mtime.tm_year, 1980) - 1980) << 9 | mtime.tm_mon << 5 | mtime.tm_mday
+        dos_time = mtime.tm_hour << 11 | mtime.tm_min << 5 | mtime.tm_sec // 2
+        flags = 0x08
+        if any(ord(c) > 0x7f for c in arcname):
+            flags |= 0x800
+        zip64 = stat.st_size * 1.05 > ZipStreamWriter.zip64_limit
+
+        self.member = {
+            'arcname': arcname,
+            'flags': flags,
+            'compress_type': compress_type,
+            'dos_date': dos_date,
+            'dos_time': dos_time,
+            'external_attr': (stat.st_mode & 0xFFFF) << 16,
+            'zip64': zip64,
+            'header_offset': self.offset}
+
+        extra = ''
+        size_field = 0
+        if zip64:
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            size_field = 0xFFFFFFFF
+        self.write(struct.pack('<4sHHHHHLLLHH', 'PK\003\004', 45 if zip64 else 20, flags, compress_type, dos_time, dos_date,
+                               0, size_field, size_field, len(arcname), len(extra)))
+        self.write(arcname)
+        self.write(extra)
+
+    def end_member(self, crc, compress_size, file_size):
+        member = self.member
+        member.update({'crc': crc, 'compress_size': compress_size, 'file_size': file_size})
+        if member['zip64']:
+            self.write(struct.pack('<4sLQQ', 'PK\007\010', crc, compress_size, file_size))
+        else:
+            self.write(struct.pack('<4sLLL', 'PK\007\010', crc, compress_size, file_size))
+        self.entries.append(member)
+        self.member = None
+
+    def close(self):
+        limit = ZipStreamWriter.zip64_limit
+        central_offset = self.offset
+        for member in self.entries:
+            extra_fields = []
+            file_size, compress_size, header_offset = member['file_size'], member['compress_size'], member['header_offset']
+            if file_size > limit:
+                extra_fields.append(file_size)
+                file_size = 0xFFFFFFFF
+            if compress_size > limit:
+                extra_fields.append(compress_size)
+                compress_size = 0xFFFFFFFF
+            if header_offset > limit:
+                extra_fields.append(header_offset)
+                header_offset = 0xFFFFFFFF
+
+            extra = ''
+            version = 20
+            if len(extra_fields) > 0 or member['zip64']:
+                version = 45
+            if len(extra_fields) > 0:
+                extra = struct.pack('<HH' + 'Q' * len(extra_fields), 1, 8 * len(extra_fields), *extra_fields)
+
+            self.write(struct.pack('<4sBBBBHHHHLLLHHHHHLL', 'PK\001\002', version, 3, version, 0, member['flags'],
+                                   member['compress_type'], member['dos_time'], member['dos_date'], member['crc'],
+                                   compress_size, file_size, len(member['arcname']), len(extra), 0, 0, 0,
+                                   member['external_attr'], header_offset))
+            self.write(member['arcname'])
+            self.write(extra)
+
+        central_size = self.offset - central_offset
+        count = len(self.entries)
+        if count >= 0xFFFF or central_size > limit or central_offset > limit:
+            zip64_offset = self.offset
+            self.write(struct.pack('<4sQHHLLQQQQ', 'PK\006\006', 44, 45, 45, 0, 0, count, count, central_size, central_offset))
+            self.write(struct.pack('<4sLQL', 'PK\006\007', 0, zip64_offset, 1))
+
+        self.write(struct.pack('<4sHHHHLLH', 'PK\005\006', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                               min(central_size, 0xFFFFFFFF), min(central_offset, 0xFFFFFFFF), 0))
+
+class DropboxUploadStream:
+    def __init__(self, client, destination, chunk_size):
+        self.client = client
+        self.destination = destination
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffered = 0
+        self.offset = 0
+        self.upload_id = None
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffered == 0:
+            return
+        chunk = ''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+
+        start = self.offset
+        while self.offset < start + len(chunk):
+            data = chunk[self.offset - start:]
+            throttle_upload(len(data))
+            try:
+                self.offset, self.upload_id = retry_upload('dropbox chunk upload', self.client.upload_chunk,
+                                                           data, len(data), self.offset, self.upload_id)
+            except dropbox.rest.ErrorResponse, e:
+                if e.status == 400 and isinstance(e.body, dict) and start <= e.body.get('offset', -1) <= start + len(chunk):
+                    self.offset = e.body['offset']
+                    continue
+                raise
+        log_debug('streamed chunk: ' + str(self.offset) + ' bytes => ' + self.destination)
+
+    def close(self):
+        self.flush()
+        return retry_upload('dropbox commit', self.client.commit_chunked_upload,
+                            dropbox_commit_path(self.client, self.destination), self.upload_id, overwrite=True)
+
+class ZipChunkResult:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        delay = self.charge(amount)
+        if delay > 0:
+            time.sleep(delay)
+
+    def charge(self, amount):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate
+
+class ThrottledFile:
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        throttle_upload(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+class Backend:
+    kind = None
+
+    def __init__(self, name, modules):
+        self.name = name
+        self.modules = modules
+        self.loaded = False
+
+    def enabled(self):
+        return False
+
+    def load(self, required=True):
+        if self.loaded:
+            return True
+
+        for module_name, attribute, install_hint in self.modules:
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError, e:
+                if not required:
+                    log_debug(self.name + ' backend not available: ' + str(e))
+                    return False
+                log_error('no ' + module_name + ' module, please install it: \n' + install_hint)
+                sys.exit(1)
+            if attribute is not None:
+                globals()[attribute] = module if attribute == module_name else getattr(module, attribute)
+
+        log_debug('loaded ' + self.name + ' backend')
+        self.loaded = True
+        return True
+
+    def preflight(self):
+        pass
+
+    def start(self):
+        pass
+
+    def publish(self):
+        pass
+
+    def finish(self):
+        pass
+
+class TestflightBackend(Backend):
+    kind = 'upload'
+
+    def enabled(self):
+        return any(testflight_enabled(platform) for platform in selected_platforms())
+
+    def publish(self):
+        start_testflight_uploads()
+
+    def finish(self):
+        upload_projects_to_testflight()
+
+class LocalBackend(Backend):
+    kind = 'upload'
+
+    def enabled(self):
+        return bool(settings.option(BuildSettings.key_local_publish_dir))
+
+    def publish(self):
+        publish_files_locally()
+
+class DropboxBackend(Backend):
+    kind = 'upload'
+
+    def enabled(self):
+        # upload paths double as local publish destinations, only credentials tell that dropbox is in use
+        return dropbox_configured() and any(dropbox_upload_expected(platform) for platform in selected_platforms())
+
+    def preflight(self):
+        request_dropbox_password()
+
+    def start(self):
+        start_dropbox_upload_worker()
+
+    def publish(self):
+        upload_files_to_dropbox()
+
+class GitBackend(Backend):
+    kind = 'commit'
+
+    def enabled(self):
+        return settings.option(BuildSettings.key_commit_changes, False)
+
+    def publish(self):
+        commit_version_file()
+
+class MailBackend(Backend):
+    kind = 'notify'
+
+    def enabled(self):
+        return settings.option(BuildSettings.key_mail_notification, False)
+
+    def preflight(self):
+        request_mail_password()
+
+    def publish(self):
+        mail_notification()
+
+class NotifierBackend(Backend):
+    def enabled(self):
+        return len(settings.option(BuildSettings.key_system_notifier_command) or '') > 0
+
+    def notify(self, message):
+        execute_command(settings.config[BuildSettings.key_system_notifier_command] +  ' "' + str(message) + '"')
+
+backends = collections.OrderedDict((backend.name, backend) for backend in [
+    TestflightBackend('testflight', [
+        ('pycurl', 'pycurl', 'http://pycurl.sourceforge.net/doc/install.html')]),
+    LocalBackend('local', []),
+    DropboxBackend('dropbox', [
+        ('dropbox.client', None, 'https://www.dropbox.com/developers/core/sdks/python'),
+        ('dropbox.rest', None, 'https://www.dropbox.com/developers/core/sdks/python'),
+        ('dropbox', 'dropbox', 'https://www.dropbox.com/developers/core/sdks/python')]),
+    GitBackend('git', [
+        ('git', 'git', 'https://pythonhosted.org/GitPython/0.3.1/intro.html#installing-gitpython')]),
+    MailBackend('mail', [
+        ('smtplib', 'smtplib', ''),
+        ('email.mime.text', 'MIMEText', ''),
+        ('keyring', 'keyring', 'https://pypi.python.org/pypi/keyring')]),
+    NotifierBackend('notifier', [])])
+
+class BuildQueue:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = []
+        self.running = None
+        self.next_id = 1
+
+    def put(self, config, platform, message, priority):
+        with self.condition:
+            for request in self.pending:
+                if request['config'] == config and request['platform'] in (platform, '_all_'):
+                    BuildQueue.merge(request, [message], priority)
+                    return request, True
+
+            request = {'id': self.next_id, 'config': config, 'platform': platform, 'messages': [message],
+                       'priority': priority, 'queued_at': time.time()}
+            self.next_id += 1
+            if platform == '_all_':
+                for other in [other for other in self.pending if other['config'] == config]:
+                    BuildQueue.merge(request, other['messages'], other['priority'])
+                    self.pending.remove(other)
+
+            self.pending.append(request)
+            self.condition.notify()
+            return request, False
+
+    @staticmethod
+    def merge(request, messages, priority):
+        for message in messages:
+            if message not in request['messages']:
+                request['messages'].append(message)
+        request['priority'] = max(request['priority'], priority)
+
+    def get(self):
+        with self.condition:
+            while len(self.pending) == 0:
+                self.condition.wait(1.0)
+            request = max(self.pending, key=lambda request: (request['priority'], -request['id']))
+            self.pending.remove(request)
+            self.running = request
+            return request
+
+    def done(self):
+        with self.condition:
+            self.running = None
+
+    def status(self):
+        with self.condition:
+            return {'running': self.running, 'pending': list(self.pending)}
+
+class BuildRequestServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class BuildRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/status':
+            self.send_json(404, {'error': 'unknown path: ' + self.path})
+            return
+        self.send_json(200, self.server.build_queue.status())
+
+    def do_POST(self):
+        if self.path != '/build':
+            self.send_json(404, {'error': 'unknown path: ' + self.path})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.getheader('content-length', 0))))
+            config = os.path.abspath(body['config'])
+            platform = body.get('platform') or '_all_'
+            message = body['message']
+            priority = int(body.get('priority', 0))
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'error': 'expected json with config, message and optional platform, priority: ' + str(e)})
+            return
+
+        if not daemon_config_allowed(config):
+            self.send_json(403, {'error': 'config file not allowed: ' + config})
+            return
+
+        if not os.path.exists(config):
+            self.send_json(400, {'error': 'config file not found: ' + config})
+            return
+
+        try:
+            platforms = daemon_config_platforms(config)
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'error': 'cannot read platforms from config file ' + config + ': ' + str(e)})
+            return
+        if platform != '_all_' and platform not in platforms:
+            self.send_json(400, {'error': 'platform not configured: ' + platform + ' (available: ' + ', '.join(sorted(platforms)) + ')'})
+            return
+
+        request, coalesced = self.server.build_queue.put(config, platform, message, priority)
+        log_info(('merged build request into #' if coalesced else 'queued build request #') + str(request['id']) + ': ' +
+                 config + ' (' + platform + ')')
+        self.send_json(202, {'id': request['id'], 'coalesced': coalesced})
+
+    def send_json(self, code, content):
+        body = json.dumps(content)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log_debug('daemon: ' + (format % args))
+
+@contextlib.contextmanager
+def trace_span(name, category='stage', **args):
+    start_time = time.time()
+    try:
+        yield args
+    except BaseException as e:
+        args['error'] = type(e).__name__ + ': ' + str(e)
+        raise
+    finally:
+        settings.add_trace_event(name, category, start_time, time.time(), args)
+
 def log_info(message):
     print(str(message))
     BuildSettings.write_log(message)
@@ -307,7 +1253,8 @@ def log_error(message):
 def log_notification(message):
     print(str(message))
     BuildSettings.write_log(str(message))
-    execute_command(settings.config[BuildSettings.key_system_notifier_command] +  ' "' + str(message) + '"')
+    if backend_enabled('notifier'):
+        backends['notifier'].notify(message)
 
 def parse_arguments():
     global settings
@@ -324,11 +1271,25 @@ def parse_arguments():
                         help='message attached to build notificaiton')
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=False,
                         help='prints debug information')
+    parser.add_argument('-m', '--materialize', metavar = ('BUILD', 'PLATFORM', 'DESTINATION'), dest='materialize', nargs=3, default=None,
+                        help='restores BUILD (e.g. "1.2 (45)" or 1.2-45) of PLATFORM from the artifact store of -x CONFIG_FILE')
+    parser.add_argument('--history', metavar = 'COUNT', dest='history', nargs='?', type=int, const=10, default=None,
+                        help='shows trends of the last COUNT (default: 10) builds recorded for -x CONFIG_FILE')
+    parser.add_argument('-d', '--daemon', metavar = 'PORT', dest='daemon_port', action='store', type=int, default=None,
+                        help='run as build daemon accepting build requests on localhost PORT (-x checks CONFIG_FILE on start)')
+    parser.add_argument('--daemon_config_dir', metavar = 'DIR', dest='daemon_config_dir', action='store', default=None,
+                        help='build daemon also accepts config files inside DIR, otherwise only -x CONFIG_FILE')
     args = parser.parse_args()
 
     global verbose
     verbose = args.verbose
 
+    global daemon_port
+    daemon_port = args.daemon_port
+
+    global daemon_config_dir
+    daemon_config_dir = args.daemon_config_dir
+
     if args.create_config is not None:
         settings = BuildSettings.sample_config(args.create_config)
         settings.file_name = args.create_config
@@ -337,10 +1298,13 @@ def parse_arguments():
         settings = BuildSettings()
         settings.read_config_file(args.execute_config)
 
-    if args.execute_config is None and args.create_config is None:
-        log_error('no action specified: -c or -x')
+    if args.execute_config is None and args.create_config is None and args.daemon_port is None:
+        log_error('no action specified: -c, -x or -d')
         sys.exit(1)
 
+    if args.daemon_port is not None:
+        return
+
     if args.build_platform is not None:
         if args.build_platform in settings.config[BuildSettings.key_platforms].keys():
             settings.build_platform = args.build_platform
@@ -353,6 +1317,14 @@ def parse_arguments():
 
     log_debug('\n' + str(settings) + '\n')
 
+    if args.history is not None and args.execute_config is not None:
+        print_build_history(args.history)
+        sys.exit(0)
+
+    if args.materialize is not None and args.execute_config is not None:
+        materialize_artifacts(*args.materialize)
+        sys.exit(0)
+
     if args.execute_config is None:
         sys.exit(0)
     elif args.build_message is None:
@@ -390,24 +1362,307 @@ def increment_build_number():
 
     log_debug('increased build number: ' + str(parsed['build']))
 
+def selected_platforms():
+    if settings.build_platform == '_all_':
+        return settings.config[BuildSettings.key_platforms].keys()
+    return [settings.build_platform]
+
+def platform_option_enabled(key):
+    for platform in selected_platforms():
+        platform_settings = settings.config[BuildSettings.key_platforms][platform]
+        if key in platform_settings and platform_settings[key]:
+            return True
+    return False
+
+def backend_enabled(name):
+    return backends[name].enabled()
+
+def enabled_backends(kind=None):
+    return [backend for backend in backends.values() if backend.enabled() and kind in (None, backend.kind)]
+
+def load_backends():
+    for backend in enabled_backends():
+        backend.load()
+
+def preflight_backends():
+    for backend in enabled_backends():
+        backend.preflight()
+
+def start_backends():
+    for backend in enabled_backends():
+        backend.start()
+
+def publish_backends(kind):
+    publishing = enabled_backends(kind)
+    for backend in publishing:
+        backend.publish()
+    for backend in publishing:
+        backend.finish()
+
+def upload_build_products():
+    publish_backends('upload')
+
+def commit_build():
+    publish_backends('commit')
+
+def notify_build():
+    publish_backends('notify')
+
+def dropbox_configured():
+    return len(settings.option(BuildSettings.key_dropbox_app_key) or '') > 0 or\
+        len(settings.option(BuildSettings.key_dropbox_access_token) or '') > 0
+
+def dropbox_upload_expected(platform):
+    platform_settings = settings.config[BuildSettings.key_platforms][platform]
+    ios_build = BuildSettings.key_ios_build in platform_settings and platform_settings[BuildSettings.key_ios_build]
+    return (not ios_build and BuildSettings.key_dropbox_upload_path in platform_settings) or\
+        BuildSettings.key_dropbox_bundle_path in platform_settings or platform_settings.get(BuildSettings.key_dropbox_upload, False)
+
 def build_unity_projects():
+    platforms = selected_platforms()
+
+    if settings.option(BuildSettings.key_parallel_builds, False) and len(platforms) > 1:
+        log_debug('building unity platforms in parallel: ' + ', '.join(platforms))
+        build_unity_projects_parallel(platforms)
+        return
+
     if settings.build_platform == '_all_':
         log_debug('building all unity platforms')
-        for platform in settings.config[BuildSettings.key_platforms].keys():
-            build_unity_platform(platform)
-    else:
-        build_unity_platform(settings.build_platform)
+    for platform in platforms:
+        build_unity_platform(platform)
+
+def build_unity_projects_parallel(platforms):
+    max_builds = settings.option(BuildSettings.key_parallel_max_builds, 2)
+    admission_delay = settings.option(BuildSettings.key_parallel_admission_delay, 30)
+    workspace_root = workspace_dir()
+    mkdir_p(workspace_root)
+
+    pending = list(platforms)
+    running = []
+    failed = []
+    last_start = 0
+    while pending or running:
+        running = [thread for thread in running if thread.is_alive()]
+        can_start = len(pending) > 0 and len(running) < max_builds and time.time() - last_start >= admission_delay
+        if can_start and (len(running) == 0 or build_resources_available(workspace_root)):
+            platform = pending.pop(0)
+            thread = threading.Thread(target=build_unity_platform_in_workspace, args=(platform, failed), name=platform)
+            thread.start()
+            running.append(thread)
+            last_start = time.time()
+        else:
+            time.sleep(1)
 
-def build_unity_platform(platform_name):
-    log_notification('building: ' + platform_name)
+    if len(failed) > 0:
+        log_error('unity build failed for: ' + ', '.join(failed))
+        sys.exit(1)
+
+def build_unity_platform_in_workspace(platform_name, failed):
+    try:
+        workspace = prepare_workspace(platform_name)
+        build_unity_platform(platform_name, workspace)
+    except (SystemExit, Exception) as e:
+        log_error('building ' + platform_name + ' failed: ' + str(e))
+        failed.append(platform_name)
+
+def build_resources_available(path):
+    min_memory = settings.option(BuildSettings.key_parallel_min_free_memory, 0)
+    min_disk = settings.option(BuildSettings.key_parallel_min_free_disk, 0)
+
+    memory = free_memory_mb()
+    if memory is not None and memory < min_memory:
+        log_debug('waiting for free memory: ' + str(memory) + ' MB < ' + str(min_memory) + ' MB')
+        return False
+
+    disk = free_disk_mb(path)
+    if disk < min_disk:
+        log_debug('waiting for free disk space: ' + str(disk) + ' MB < ' + str(min_disk) + ' MB')
+        return False
+
+    return True
+
+def free_memory_mb():
+    try:
+        meminfo = open('/proc/meminfo')
+        try:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+        finally:
+            meminfo.close()
+    except IOError:
+        pass
 
-    method = settings.config[BuildSettings.key_platforms][platform_name][BuildSettings.key_unity_build_method]
+    try:
+        output = subprocess.check_output(['vm_stat'])
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    page_size = 4096
+    m = re.search('page size of (\\d+) bytes', output)
+    if m is not None:
+        page_size = int(m.group(1))
+
+    pages = 0
+    for name in ('Pages free', 'Pages inactive', 'Pages speculative'):
+        m = re.search(name + ':\\s+(\\d+)', output)
+        if m is not None:
+            pages += int(m.group(1))
+    return pages * page_size // (1024 * 1024)
+
+def free_disk_mb(path):
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize // (1024 * 1024)
+
+def workspace_dir():
+    return settings.option(BuildSettings.key_workspace_dir, os.path.join(settings.config[BuildSettings.key_temp_dir], 'unity_workspaces'))
+
+def workspace_excluded_paths():
+    paths = []
+    for platform_settings in settings.config[BuildSettings.key_platforms].values():
+        for key in (BuildSettings.key_unity_build_path, BuildSettings.key_bundle_output_path):
+            if key in platform_settings:
+                paths.append(platform_settings[key])
+    return paths
+
+def prepare_workspace(name):
+    project_path = os.path.abspath(settings.config[BuildSettings.key_project_path])
+    workspace = os.path.abspath(os.path.join(workspace_dir(), name))
+    log_info('preparing workspace: ' + workspace)
+
+    excluded = set(os.path.normpath(os.path.join(project_path, path)) for path in workspace_excluded_paths())
+    excluded.add(os.path.abspath(workspace_dir()))
+    sync_workspace(project_path, workspace, excluded)
+
+    library = os.path.join(project_path, 'Library')
+    workspace_library = os.path.join(workspace, 'Library')
+    if os.path.isdir(library) and not os.path.isdir(workspace_library) and not settings.option(BuildSettings.key_library_cache_dir):
+        # unity rewrites library files in place, so every workspace needs a real copy, made once and kept with the workspace
+        log_info('warning: copying unity library (' + format_size(path_size(library)) + ') into workspace, each workspace keeps ' +
+                 'its own copy: ' + library + ' => ' + workspace_library)
+        shutil.copytree(library, workspace_library, symlinks=True)
+
+    return workspace
+
+def sync_workspace(project_path, workspace, excluded):
+    # files unity or this script write to are copied, a write through a hardlink would change the main project
+    version_file = os.path.normpath(os.path.join(project_path, settings.config[BuildSettings.key_version_file]))
+    expected = set()
+    for root, dirs, files in os.walk(project_path):
+        rel_root = os.path.relpath(root, project_path)
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d not in workspace_skipped_dirs]
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in excluded]
+
+        target_root = os.path.normpath(os.path.join(workspace, rel_root))
+        mkdir_p(target_root)
+        copied_dir = rel_root.split(os.sep)[0] in workspace_copied_dirs
+        for file in files:
+            source = os.path.join(root, file)
+            if source in excluded:
+                continue
+            target = os.path.join(target_root, file)
+            expected.add(target)
+            copy = copied_dir or source == version_file or any(fnmatch.fnmatch(file, pattern) for pattern in workspace_copied_patterns)
+            link_or_copy_file(source, target, copy)
+
+    excluded_in_workspace = set(os.path.join(workspace, os.path.relpath(path, project_path)) for path in excluded)
+    for root, dirs, files in os.walk(workspace):
+        if root == workspace:
+            dirs[:] = [d for d in dirs if d not in workspace_skipped_dirs]
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in excluded_in_workspace]
+        for file in files:
+            target = os.path.join(root, file)
+            if target not in expected and target not in excluded_in_workspace:
+                log_debug('removing stale workspace file: ' + target)
+                os.remove(target)
+
+def link_or_copy_file(source, target, copy):
+    if os.path.lexists(target):
+        linked = os.path.exists(target) and os.path.samefile(source, target)
+        if not copy and linked:
+            return
+        if copy and not linked:
+            source_stat = os.stat(source)
+            target_stat = os.stat(target)
+            if source_stat.st_size == target_stat.st_size and int(source_stat.st_mtime) == int(target_stat.st_mtime):
+                return
+        os.remove(target)
+
+    if not copy:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, target)
+
+def collect_workspace_output(workspace, relative_path):
+    source = os.path.join(workspace, relative_path)
+    destination = os.path.join(settings.config[BuildSettings.key_project_path], relative_path)
+    if not os.path.exists(source):
+        return
+
+    log_debug('collecting workspace output: ' + source + ' => ' + destination)
+    remove_path(destination)
+    mkdir_p(os.path.dirname(os.path.abspath(destination)))
+    shutil.move(source, destination)
+
+def remove_path(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+def unity_command(method, project_path=None):
     args = settings.config[BuildSettings.key_unity_app_args]
+    log_file = unity_log_file(project_path)
+    if log_file is not None and project_path is not None:
+        # parallel workspaces must not share a log file
+        split_args = shlex.split(args)
+        split_args[split_args.index('-logFile') + 1] = log_file
+        args = ' '.join(pipes.quote(arg) for arg in split_args)
     unity = settings.config[BuildSettings.key_unity_app]
-    execute_command(unity + ' ' + args + ' -batchmode -quit -executeMethod ' + method, dry_run = False)
+    command = unity + ' ' + args + ' -batchmode -quit'
+    if project_path is not None:
+        command += ' -projectPath "' + project_path + '"'
+    return command + ' -executeMethod ' + method
+
+def unity_log_file(project_path=None):
+    args = shlex.split(settings.config[BuildSettings.key_unity_app_args])
+    if '-logFile' not in args:
+        return None
+    index = args.index('-logFile') + 1
+    if index >= len(args) or args[index] == '-' or args[index].startswith('-'):
+        return None
+
+    log_file = os.path.abspath(args[index])
+    if project_path is not None:
+        root, ext = os.path.splitext(log_file)
+        log_file = root + '_' + os.path.basename(os.path.normpath(project_path)) + ext
+    return log_file
+
+def unity_idle_timeout():
+    # without -logFile unity writes its log to Editor.log and stays silent on stdout, so silence says nothing about progress
+    if '-logFile' in shlex.split(settings.config[BuildSettings.key_unity_app_args]):
+        return None
+    return 0
+
+def build_unity_platform(platform_name, workspace=None):
+    with trace_span('build ' + platform_name, 'build', workspace=workspace):
+        build_unity_platform_products(platform_name, workspace)
+
+def build_unity_platform_products(platform_name, workspace=None):
+    log_notification('building: ' + platform_name)
 
     platform_settings = settings.config[BuildSettings.key_platforms][platform_name]
-    build_asset_bundles(platform_settings, platform_name)
+    method = platform_settings[BuildSettings.key_unity_build_method]
+    run_unity_build_method(platform_name, method, platform_settings[BuildSettings.key_unity_build_path], workspace)
+    if BuildSettings.key_ios_build not in platform_settings:
+        # the xcode project is an intermediate, the ipa and dSYM are stored once they are built
+        store_artifact(platform_name, platform_settings[BuildSettings.key_unity_build_path])
+
+    build_asset_bundles(platform_settings, platform_name, workspace)
 
     if BuildSettings.key_ios_build in platform_settings:
         if platform_settings[BuildSettings.key_ios_build]:
@@ -419,15 +1674,14 @@ def build_unity_platform(platform_name):
     zipped = platform_settings[BuildSettings.key_dropbox_zip_upload]
     dropbox_add_file_to_upload(product, destination, zipped, platform=platform_name)
 
-def build_asset_bundles(platform_settings, platform_name):
+def build_asset_bundles(platform_settings, platform_name, workspace=None):
     if BuildSettings.key_bundle_method not in platform_settings:
         return
 
     log_notification('creating asset bundles: ' + platform_name)
     method = platform_settings[BuildSettings.key_bundle_method]
-    args = settings.config[BuildSettings.key_unity_app_args]
-    unity = settings.config[BuildSettings.key_unity_app]
-    execute_command(unity + ' ' + args + ' -batchmode -quit -executeMethod ' + method, dry_run = False)
+    run_unity_build_method(platform_name, method, platform_settings[BuildSettings.key_bundle_output_path], workspace, versioned=False)
+    store_artifact(platform_name, platform_settings[BuildSettings.key_bundle_output_path])
 
     if BuildSettings.key_dropbox_bundle_path not in platform_settings:
         return
@@ -437,48 +1691,525 @@ def build_asset_bundles(platform_settings, platform_name):
     destination = platform_settings[BuildSettings.key_dropbox_bundle_path]
     dropbox_add_file_to_upload(product, destination, False, platform=platform_name)
 
-def execute_command(command, dry_run=False):
-    log_debug('executing command: ' + command)
-    if not dry_run:
-        p = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        output, error = p.communicate()
-        exit_code = p.returncode
+def run_unity_build_method(platform_name, method, output, workspace=None, versioned=True):
+    product = os.path.join(settings.config[BuildSettings.key_project_path], output)
 
-        log_debug('command exit code: ' + str(exit_code))
-        log_debug('command output:\n' + str(output))
+    # a versioned player embeds the build number, which changes on every run, so only unversioned outputs are cached
+    fingerprint = None
+    if settings.option(BuildSettings.key_build_cache_dir) and not versioned:
+        fingerprint = build_fingerprint(platform_name, method)
+        if build_cache_restore(fingerprint, product):
+            log_info('build cache hit, skipping unity: ' + method)
+            return
+
+    library_state = None
+    if settings.option(BuildSettings.key_library_cache_dir):
+        library_state = library_cache_activate(workspace or settings.config[BuildSettings.key_project_path], platform_name)
 
-        if exit_code != 0:
-            log_error('command: ' + command + '\nexit code: ' + str(exit_code) + '\nerror: ' + str(error))
-            sys.exit(exit_code)
+    parser = UnityLogParser(platform_name + ' (' + method + ')')
+    try:
+        execute_command(unity_command(method, workspace), dry_run = False, line_handler=parser.feed, log_file=unity_log_file(workspace),
+                        idle_timeout=unity_idle_timeout())
+    except (SystemExit, Exception):
+        report = parser.finish()
+        report['result'] = 'Failure'
+        settings.add_unity_report(report)
+        raise
+    report = parser.finish()
+    if library_state is not None:
+        library_cache_record(platform_name, 'player' if versioned else 'bundles', library_state, report)
+    settings.add_unity_report(report)
+    if workspace is not None:
+        collect_workspace_output(workspace, output)
+
+    if fingerprint is not None:
+        build_cache_store(fingerprint, product, platform_name, method)
+
+def library_cache_activate(project_path, platform_name):
+    cache_dir = settings.config[BuildSettings.key_library_cache_dir]
+    library = os.path.join(project_path, 'Library')
+
+    with library_cache_lock:
+        current = library_platform(library)
+        if current == platform_name:
+            log_debug('unity library already set up for: ' + platform_name)
+            return 'active'
+
+        mkdir_p(cache_dir)
+        cached = os.path.join(cache_dir, platform_name)
+        if os.path.isdir(library):
+            if current is not None:
+                log_info('caching unity library for ' + current + ': ' + library)
+                library_cache_stash(library, current)
+            elif os.path.isdir(cached):
+                log_info('removing unmanaged unity library: ' + library)
+                shutil.rmtree(library)
+
+        hit = os.path.isdir(cached)
+        if hit:
+            log_info('restoring cached unity library for ' + platform_name + ' => ' + library)
+            shutil.move(cached, library)
         else:
-            return (exit_code, output)
-    return (0, '')
+            log_info('no cached unity library for ' + platform_name + ', assets will be imported')
+            mkdir_p(library)
+
+        marker = open(os.path.join(library, library_marker_file), 'w')
+        try:
+            marker.write(platform_name)
+        finally:
+            marker.close()
+
+        index = library_cache_index()
+        index.setdefault(platform_name, {})['last_used'] = time.time()
+        library_cache_save_index(index)
+        library_cache_evict(index)
+        return 'hit' if hit else 'miss'
+
+def library_platform(library):
+    marker_file = os.path.join(library, library_marker_file)
+    if not os.path.exists(marker_file):
+        return None
+    marker = open(marker_file)
+    try:
+        return marker.read().strip()
+    finally:
+        marker.close()
+
+def library_cache_stash(library, platform_name):
+    cached = os.path.join(settings.config[BuildSettings.key_library_cache_dir], platform_name)
+    remove_path(cached)
+    shutil.move(library, cached)
+
+    index = library_cache_index()
+    entry = index.setdefault(platform_name, {})
+    entry['size'] = path_size(cached)
+    entry['last_used'] = time.time()
+    library_cache_save_index(index)
+
+def library_cache_index_file():
+    return os.path.join(settings.config[BuildSettings.key_library_cache_dir], 'library_cache.json')
+
+def library_cache_index():
+    return read_json_file(library_cache_index_file(), {})
+
+def library_cache_save_index(index):
+    write_json_file(library_cache_index_file(), index)
+
+def library_cache_evict(index):
+    cache_dir = settings.config[BuildSettings.key_library_cache_dir]
+    max_size = settings.option(BuildSettings.key_library_cache_max_size, 51200) * 1024 * 1024
+
+    cached = [(entry.get('last_used', 0), entry.get('size', 0), platform_name) for platform_name, entry in index.items()
+              if os.path.isdir(os.path.join(cache_dir, platform_name))]
+    total_size = sum(entry[1] for entry in cached)
+    for last_used, size, platform_name in sorted(cached):
+        if total_size <= max_size:
+            break
+        log_info('evicting cached unity library: ' + platform_name)
+        shutil.rmtree(os.path.join(cache_dir, platform_name))
+        index[platform_name].pop('size', None)
+        total_size -= size
+    library_cache_save_index(index)
+
+def library_cache_record(platform_name, kind, state, report):
+    import_time = sum(phase['time'] for phase in report['phases'] if phase['name'] == 'asset import')
+    report['library_cache'] = state
+
+    with library_cache_lock:
+        index = library_cache_index()
+        cold_import_times = index.setdefault(platform_name, {}).setdefault('cold_import_times', {})
+        if state == 'miss':
+            cold_import_times[kind] = import_time
+        elif state == 'hit' and cold_import_times.get(kind) is not None:
+            report['import_time_saved'] = max(cold_import_times[kind] - import_time, 0)
+            log_info('unity library cache saved ~' + format_duration(report['import_time_saved']) + ' of asset import for ' +
+                     platform_name + ' (' + kind + ')')
+        library_cache_save_index(index)
+
+def build_fingerprint(platform_name, method):
+    digest = hashlib.sha1()
+    digest.update(get_project_fingerprint())
+    fingerprint_update(digest, method)
+    fingerprint_update(digest, json.dumps(settings.config[BuildSettings.key_platforms][platform_name], sort_keys=True))
+    fingerprint_update(digest, settings.config[BuildSettings.key_unity_app] + ' ' + settings.config[BuildSettings.key_unity_app_args])
+    return digest.hexdigest()
+
+def fingerprint_update(digest, value):
+    digest.update(value.encode('utf-8') if isinstance(value, unicode) else value)
+
+def get_project_fingerprint():
+    with build_cache_lock:
+        if settings.project_fingerprint is None:
+            start_time = time.time()
+            settings.project_fingerprint = compute_project_fingerprint()
+            log_debug('project fingerprint: ' + settings.project_fingerprint + ' (' + "{0:.1f}".format(time.time() - start_time) + ' s)')
+        return settings.project_fingerprint
+
+def build_cache_excluded(path):
+    for excluded in [settings.config[BuildSettings.key_version_file]] + settings.option(BuildSettings.key_build_cache_exclude, []):
+        excluded = os.path.normpath(excluded)
+        if path == excluded or path.startswith(excluded + os.sep):
+            return True
+    return False
+
+def compute_project_fingerprint():
+    project_path = settings.config[BuildSettings.key_project_path]
+    if os.path.isdir(os.path.join(project_path, '.git')) and backends['git'].load(required=False):
+        try:
+            return git_project_fingerprint(project_path)
+        except Exception as e:
+            log_debug('cannot fingerprint project with git, hashing files: ' + str(e))
+
+    if isinstance(project_path, unicode):
+        project_path = project_path.encode(sys.getfilesystemencoding() or 'utf-8')
+
+    digest = hashlib.sha1()
+    for directory in build_cache_inputs:
+        for root, dirs, files in os.walk(os.path.join(project_path, directory)):
+            dirs.sort()
+            for file in sorted(files):
+                file_name = os.path.join(root, file)
+                relative_name = os.path.relpath(file_name, project_path)
+                if not build_cache_excluded(relative_name):
+                    fingerprint_update(digest, relative_name + '\0' + file_hash(file_name) + '\n')
+    return digest.hexdigest()
+
+def git_project_fingerprint(project_path):
+    repo = git.Repo(project_path)
+    digest = hashlib.sha1()
+
+    for line in repo.git.ls_tree('-r', 'HEAD', '--', *build_cache_inputs).splitlines():
+        info, path = line.split('\t', 1)
+        if not build_cache_excluded(os.path.normpath(path)):
+            fingerprint_update(digest, line + '\n')
+
+    entries = repo.git.status('--porcelain', '-z', '--untracked-files=all', '--', *build_cache_inputs).split('\0')
+    index = 0
+    while index < len(entries):
+        entry = entries[index]
+        index += 1
+        if len(entry) < 4:
+            continue
+        status, path = entry[:2], entry[3:]
+        if status[0] in ('R', 'C'):
+            index += 1
+        if build_cache_excluded(os.path.normpath(path)):
+            continue
+        file_name = os.path.join(project_path, path)
+        content_hash = file_hash(file_name) if os.path.isfile(file_name) else 'deleted'
+        fingerprint_update(digest, status + ' ' + path + '\0' + content_hash + '\n')
+
+    return digest.hexdigest()
+
+def build_cache_entry_dir(fingerprint):
+    return os.path.join(settings.config[BuildSettings.key_build_cache_dir], fingerprint)
+
+def build_cache_restore(fingerprint, product):
+    entry_dir = build_cache_entry_dir(fingerprint)
+    entry_file = os.path.join(entry_dir, 'entry.json')
+    if not os.path.exists(entry_file):
+        log_debug('build cache miss: ' + fingerprint)
+        return False
+
+    log_info('restoring cached build: ' + fingerprint + ' => ' + product)
+    remove_path(product)
+    mkdir_p(os.path.dirname(os.path.abspath(product)))
+    copy_path(os.path.join(entry_dir, 'output'), product)
+    os.utime(entry_file, None)
+    return True
+
+def build_cache_store(fingerprint, product, platform_name, method):
+    if not os.path.exists(product):
+        log_debug('nothing to cache, build output missing: ' + product)
+        return
+
+    entry_dir = build_cache_entry_dir(fingerprint)
+    temp_dir = entry_dir + '.tmp'
+    log_debug('storing build in cache: ' + product + ' => ' + entry_dir)
+    remove_path(temp_dir)
+    mkdir_p(temp_dir)
+    copy_path(product, os.path.join(temp_dir, 'output'))
+    write_json_file(os.path.join(temp_dir, 'entry.json'), {'platform': platform_name, 'method': method,
+                                                           'size': path_size(product), 'created': time.time()})
+    with build_cache_lock:
+        remove_path(entry_dir)
+        os.rename(temp_dir, entry_dir)
+        build_cache_evict()
+
+def build_cache_evict():
+    cache_dir = settings.config[BuildSettings.key_build_cache_dir]
+    max_size = settings.option(BuildSettings.key_build_cache_max_size, 20480) * 1024 * 1024
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.tmp'):
+            temp_dir = os.path.join(cache_dir, name)
+            if time.time() - os.path.getmtime(temp_dir) > build_cache_stale_temp_age:
+                log_debug('removing stale build cache entry: ' + name)
+                remove_path(temp_dir)
+            continue
+        entry_file = os.path.join(cache_dir, name, 'entry.json')
+        if os.path.exists(entry_file):
+            entries.append((os.path.getmtime(entry_file), read_json_file(entry_file, {}).get('size', 0), name))
+
+    total_size = sum(entry[1] for entry in entries)
+    for last_used, size, name in sorted(entries):
+        if total_size <= max_size:
+            break
+        log_info('evicting cached build: ' + name)
+        remove_path(os.path.join(cache_dir, name))
+        total_size -= size
+
+def copy_path(source, destination):
+    if os.path.isdir(source):
+        shutil.copytree(source, destination, symlinks=True)
+    else:
+        shutil.copy2(source, destination)
+
+def path_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            file_name = os.path.join(root, file)
+            if not os.path.islink(file_name):
+                size += os.path.getsize(file_name)
+    return size
+
+def execute_command(command, dry_run=False, timeout=None, idle_timeout=None, line_handler=None, exit_on_error=True, cancel=None,
+                    log_file=None):
+    log_debug('executing command: ' + command)
+    if dry_run:
+        return 0
+
+    if timeout is None:
+        timeout = settings.option(BuildSettings.key_command_timeout)
+    if idle_timeout is None:
+        idle_timeout = settings.option(BuildSettings.key_command_idle_timeout)
+
+    if log_file is not None:
+        remove_path(log_file)
+    p = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, preexec_fn=os.setsid,
+                         close_fds=True)
+    tail = collections.deque(maxlen=command_output_tail_lines)
+    output_state = {'last_output': time.time()}
+    reader = threading.Thread(target=read_command_output, args=(p.stdout, tail, output_state, None if log_file else line_handler),
+                              name='command output')
+    reader.daemon = True
+    reader.start()
+    log_follower_stopped = threading.Event()
+    log_follower = None
+    if log_file is not None:
+        log_follower = threading.Thread(target=follow_command_log, args=(log_file, output_state, line_handler, log_follower_stopped),
+                                        name='command log')
+        log_follower.daemon = True
+        log_follower.start()
+
+    start_time = time.time()
+    timed_out = None
+    try:
+        while p.poll() is None:
+            reader.join(0.5)
+            now = time.time()
+            if cancel is not None and cancel.is_set():
+                log_info('command cancelled, terminating: ' + command)
+                terminate_process(p)
+                break
+            if timeout and now - start_time > timeout:
+                timed_out = 'no exit after ' + str(timeout) + ' s'
+            elif idle_timeout and now - output_state['last_output'] > idle_timeout:
+                timed_out = 'no output for ' + str(idle_timeout) + ' s'
+            if timed_out is not None:
+                log_error('command timed out (' + timed_out + '), terminating: ' + command)
+                terminate_process(p)
+                break
+    except BaseException:
+        terminate_process(p)
+        raise
+    finally:
+        log_follower_stopped.set()
+
+    reader.join(command_terminate_grace_period)
+    if log_follower is not None:
+        log_follower.join(command_terminate_grace_period)
+    exit_code = p.returncode
+    output = '\n'.join(tail)
+    settings.add_trace_event(os.path.basename(shlex.split(command)[0]), 'subprocess', start_time, time.time(),
+                             {'command': command, 'exit_code': exit_code})
+
+    log_debug('command exit code: ' + str(exit_code))
+
+    if (exit_code != 0 or timed_out is not None) and exit_on_error:
+        log_error('command: ' + command + '\nexit code: ' + str(exit_code) + '\nlast output:\n' + output)
+        sys.exit(exit_code if exit_code > 0 else 1)
+    return exit_code
+
+def follow_command_log(path, output_state, line_handler, stopped):
+    log_file = None
+    pending = ''
+    while True:
+        finished = stopped.is_set()
+        if log_file is None and os.path.exists(path):
+            log_file = open(path)
+        while log_file is not None:
+            data = log_file.read(command_output_read_size)
+            if not data:
+                break
+            pending = handle_command_output(pending, data, output_state, line_handler)
+        if finished:
+            break
+        stopped.wait(0.2)
+
+    if log_file is not None:
+        log_file.close()
+    handle_command_output(pending, '', output_state, line_handler, final=True)
+
+def read_command_output(stream, tail, output_state, line_handler):
+    # read in blocks, a readline() per line costs more than unity spends writing it
+    pending = ''
+    while True:
+        data = os.read(stream.fileno(), command_output_read_size)
+        if not data:
+            break
+        pending = handle_command_output(pending, data, output_state, line_handler, tail)
+    handle_command_output(pending, '', output_state, line_handler, tail, final=True)
+    stream.close()
+
+def handle_command_output(pending, data, output_state, line_handler, tail=None, final=False):
+    if data:
+        output_state['last_output'] = time.time()
+    lines = (pending + data).split('\n')
+    pending = lines.pop()
+    if len(pending) >= command_output_max_line_length or (final and pending):
+        lines.append(pending)
+        pending = ''
+    if len(lines) == 0:
+        return pending
+
+    log_debug('\n'.join(lines))
+    if tail is not None:
+        tail.extend(lines)
+    if line_handler is not None:
+        for line in lines:
+            line_handler(line + '\n')
+    return pending
+
+def terminate_process(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except OSError:
+        return
+
+    deadline = time.time() + command_terminate_grace_period
+    while process.poll() is None and time.time() < deadline:
+        time.sleep(0.2)
+
+    if process.poll() is None:
+        log_error('process did not terminate, killing: ' + str(process.pid))
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        process.wait()
 
 def dropbox_authenticate():
+    backends['dropbox'].load()
     dropbox_access_token = settings.config[BuildSettings.key_dropbox_access_token]
     if dropbox_access_token in (None, ''):
         dropbox_access_token = dropbox_request_for_token()
 
-    success = False
-    while not success:
-        client = dropbox.client.DropboxClient(dropbox_access_token)
+    connections = settings.option(BuildSettings.key_dropbox_upload_threads, 8)
+    account_info = session_cache_get('dropbox', dropbox_session_key(dropbox_access_token))
+    if account_info is not None and 'uid' not in account_info:
+        account_info = None
+    if account_info is not None:
+        log_debug('using cached dropbox session')
+        rest_client = dropbox.rest.RESTClientObject(max_reusable_connections=connections)
+        client = dropbox.client.DropboxClient(dropbox_access_token, rest_client=rest_client)
+
+    while account_info is None:
+        rest_client = dropbox.rest.RESTClientObject(max_reusable_connections=connections)
+        client = dropbox.client.DropboxClient(dropbox_access_token, rest_client=rest_client)
         try:
-            client.account_info()
-            success = True
+            account_info = client.account_info()
+            session_cache_set('dropbox', dropbox_session_key(dropbox_access_token), account_info)
         except dropbox.rest.ErrorResponse, e:
             log_error("Wrong or missing Dropbox access token!")
             dropbox_access_token = dropbox_request_for_token()
 
-    dropbox_save_access_token(dropbox_access_token)
+    if dropbox_access_token != settings.config[BuildSettings.key_dropbox_access_token]:
+        dropbox_save_access_token(dropbox_access_token)
 
-    log_debug('linked dropbox account: ' + str(client.account_info()))
+    log_debug('linked dropbox account: ' + str(account_info))
+    settings.dropbox_account_info = account_info
 
     return client
 
+def dropbox_account_uid():
+    dropbox_client()
+    return str(settings.dropbox_account_info['uid'])
+
+def dropbox_session_key(token):
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+def dropbox_share_link(client, path):
+    key = dropbox_account_uid() + '|' + dropbox_manifest_key(path)
+    share_link = session_cache_get('share_links', key, ttl=None)
+    if share_link is not None:
+        log_debug('using cached share link: ' + path)
+        return share_link
+
+    share_link = retry_upload('dropbox share link', client.share, path, short_url=False)
+    expires = email.utils.parsedate_tz(share_link['expires']) if share_link.get('expires') else None
+    session_cache_set('share_links', key, share_link, email.utils.mktime_tz(expires) if expires is not None else None)
+    return share_link
+
+def session_cache_file():
+    return os.path.join(settings.config[BuildSettings.key_temp_dir], 'session_cache.json')
+
+def session_cache():
+    if settings.session_cache is None:
+        settings.session_cache = read_json_file(session_cache_file(), {})
+    return settings.session_cache
+
+def session_cache_get(section, key, ttl=-1):
+    if ttl == -1:
+        ttl = settings.option(BuildSettings.key_session_cache_ttl, 24) * 3600
+    with session_cache_lock:
+        entry = session_cache().get(section, {}).get(key)
+    if entry is None:
+        return None
+    if ttl is not None and time.time() - entry['cached'] > ttl:
+        return None
+    if entry.get('expires') is not None and time.time() > entry['expires']:
+        return None
+    return entry['value']
+
+def session_cache_set(section, key, value, expires=None):
+    with session_cache_lock:
+        session_cache().setdefault(section, {})[key] = {'value': value, 'cached': time.time(), 'expires': expires}
+        mkdir_p(settings.config[BuildSettings.key_temp_dir])
+        write_json_file(session_cache_file(), settings.session_cache, session_cache_file_mode)
+
+def session_cache_invalidate(section, key=None):
+    with session_cache_lock:
+        if key is None:
+            session_cache().pop(section, None)
+        else:
+            session_cache().get(section, {}).pop(key, None)
+        write_json_file(session_cache_file(), settings.session_cache, session_cache_file_mode)
+
+def dropbox_client():
+    with dropbox_client_lock:
+        if settings.dropbox_client is None:
+            settings.dropbox_client = dropbox_authenticate()
+        return settings.dropbox_client
+
 def request_dropbox_password():
-    if BuildSettings.key_dropbox_app_key in settings.config and len(settings.config[BuildSettings.key_dropbox_app_key]) > 0:
+    if len(settings.option(BuildSettings.key_dropbox_app_key) or '') > 0:
         log_info('checking dropbox token')
-        dropbox_authenticate()
+        dropbox_client()
 
 def dropbox_save_access_token(token):
     log_debug('saving access token')
@@ -505,28 +2236,249 @@ def dropbox_request_for_token():
         return None
 
 def dropbox_upload(source, destination):
-    client = dropbox_authenticate()
+    client = dropbox_client()
 
     if os.path.isdir(source):
+        uploads = []
         for root, dirs, files in os.walk(source):
             for file in files:
                 file_name = os.path.join(root, file)
+                if file in ignored_files:
+                    log_debug('ignoring file: ' + file_name)
+                    continue
                 dest_path = os.path.join(destination, file_name[len(source) + 1:])
-                dropbox_upload_single_file(client, file_name, dest_path)
+                uploads.append((file_name, dest_path))
     else:
-         dropbox_upload_single_file(client, source, destination)
+        uploads = [(source, destination)]
+
+    if not settings.option(BuildSettings.key_dropbox_manifest, False):
+        dropbox_upload_files(client, uploads)
+        return
+
+    manifest = dropbox_load_manifest(client, destination)
+    try:
+        dropbox_upload_files(client, dropbox_changed_files(manifest, uploads), manifest)
+        if settings.option(BuildSettings.key_dropbox_delete_removed, False):
+            dropbox_delete_removed_files(client, manifest, uploads)
+    finally:
+        dropbox_save_manifest(manifest)
+
+def dropbox_upload_files(client, uploads, manifest=None):
+    if len(uploads) == 0:
+        return
+
+    def upload(item):
+        size = dropbox_upload_single_file(client, item[0], item[1])
+        if manifest is not None:
+            dropbox_manifest_commit(manifest, item[1])
+        return size
+
+    threads = min(settings.option(BuildSettings.key_dropbox_upload_threads, 8), len(uploads))
+    start_time = time.time()
+    pool = ThreadPool(max(threads, 1))
+    try:
+        sizes = pool.map(upload, uploads)
+    finally:
+        pool.close()
+        pool.join()
+
+    elapsed = max(time.time() - start_time, 0.001)
+    megabytes = sum(sizes) / (1024.0 * 1024.0)
+    log_info('uploaded ' + str(len(uploads)) + ' files (' + "{0:.2f}".format(megabytes) + ' MB) in ' + "{0:.1f}".format(elapsed) + ' s: ' +
+             "{0:.1f}".format(len(uploads) / elapsed) + ' files/s, ' + "{0:.2f}".format(megabytes / elapsed) + ' MB/s')
 
 def dropbox_upload_single_file(client, source, destination):
     if os.path.basename(source) in ignored_files:
         log_debug('ignoring file: ' + source)
-        return
+        return 0
+
+    size = os.path.getsize(source)
+    with trace_span('dropbox upload', 'upload', destination=destination, bytes=size):
+        if size >= settings.option(BuildSettings.key_dropbox_chunked_upload_threshold, 64) * 1024 * 1024:
+            dropbox_upload_chunked(client, source, destination, size)
+            return size
+
+        log_info('uploading file to dropbox: ' + source + ' => ' + destination)
+        response = retry_upload('dropbox upload of ' + source, dropbox_put_file, client, source, destination)
+        log_debug(response)
+    return size
+
+def dropbox_put_file(client, source, destination):
+    f = open(source, 'rb')
+    try:
+        return client.put_file(destination, ThrottledFile(f), overwrite=True)
+    finally:
+        f.close()
+
+def dropbox_upload_chunked(client, source, destination, size):
+    chunk_size = settings.option(BuildSettings.key_dropbox_chunk_size, 8) * 1024 * 1024
+    state_file = dropbox_upload_state_file(source, destination)
+    mtime = os.path.getmtime(source)
+
+    state = read_json_file(state_file, {})
+    if state.get('size') != size or state.get('mtime') != mtime:
+        state = {}
+    upload_id = state.get('upload_id')
+    offset = state.get('offset', 0)
+
+    if offset > 0:
+        log_info('resuming dropbox upload at ' + str(offset) + '/' + str(size) + ' bytes: ' + source + ' => ' + destination)
+    else:
+        log_info('uploading file to dropbox in chunks: ' + source + ' => ' + destination)
 
     f = open(source, 'rb')
-    log_info('uploading file to dropbox: ' + source + ' => ' + destination)
-    response = client.put_file(destination, f, overwrite=True)
-    f.close()
+    try:
+        while offset < size:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            throttle_upload(len(chunk))
+            try:
+                offset, upload_id = retry_upload('dropbox chunk upload of ' + source, client.upload_chunk,
+                                                 chunk, len(chunk), offset, upload_id)
+            except dropbox.rest.ErrorResponse, e:
+                if e.status == 400 and isinstance(e.body, dict) and 'offset' in e.body:
+                    log_debug('dropbox upload offset mismatch, continuing at: ' + str(e.body['offset']))
+                    offset = e.body['offset']
+                    continue
+                if e.status == 404 and upload_id is not None:
+                    log_info('dropbox upload session expired, restarting: ' + source)
+                    offset, upload_id = 0, None
+                    continue
+                raise
+
+            write_json_file(state_file, {'source': source, 'destination': destination, 'size': size, 'mtime': mtime,
+                                         'upload_id': upload_id, 'offset': offset})
+            log_debug('uploaded chunk: ' + str(offset) + '/' + str(size) + ' bytes')
+    finally:
+        f.close()
+
+    response = retry_upload('dropbox commit of ' + source, client.commit_chunked_upload,
+                            dropbox_commit_path(client, destination), upload_id, overwrite=True)
+    os.remove(state_file)
     log_debug(response)
 
+def dropbox_commit_path(client, destination):
+    return client.session.root + '/' + destination.lstrip('/')
+
+def dropbox_upload_zip_stream(source, destination):
+    client = dropbox_client()
+    chunk_size = settings.option(BuildSettings.key_dropbox_chunk_size, 8) * 1024 * 1024
+    workers = settings.option(BuildSettings.key_zip_workers) or multiprocessing.cpu_count()
+
+    log_info('streaming zip to dropbox: ' + source + ' => ' + destination)
+    with trace_span('dropbox zip stream', 'upload', destination=destination, workers=workers) as span:
+        stream = DropboxUploadStream(client, destination, chunk_size)
+        zip_write_members(ZipStreamWriter(stream), zip_members(source), workers)
+        log_debug(stream.close())
+        span['bytes'] = stream.offset
+
+def dropbox_manifest_key(remote_path):
+    return '/' + remote_path.strip('/').lower()
+
+def dropbox_load_manifest(client, destination):
+    key = dropbox_account_uid() + '|' + dropbox_manifest_key(destination)
+    path = os.path.join(settings.config[BuildSettings.key_temp_dir], 'dropbox_manifests', hashlib.md5(key.encode()).hexdigest() + '.json')
+
+    stored = read_json_file(path)
+    if stored is not None:
+        files = stored['files']
+    else:
+        log_info('no upload manifest for ' + destination + ', reconciling with dropbox')
+        files = {}
+        for remote_path, entry in dropbox_list_remote(client, destination).items():
+            files[dropbox_manifest_key(remote_path)] = entry
+
+    return {'path': path, 'destination': destination, 'files': files, 'pending': {}}
+
+def dropbox_save_manifest(manifest):
+    mkdir_p(os.path.dirname(manifest['path']))
+    with dropbox_manifest_lock:
+        content = {'destination': manifest['destination'], 'files': dict(manifest['files'])}
+    write_json_file(manifest['path'], content)
+
+def dropbox_manifest_commit(manifest, destination):
+    key = dropbox_manifest_key(destination)
+    with dropbox_manifest_lock:
+        manifest['files'][key] = manifest['pending'].pop(key)
+
+def dropbox_list_remote(client, path):
+    try:
+        metadata = client.metadata(path, list=True)
+    except dropbox.rest.ErrorResponse, e:
+        if e.status == 404:
+            return {}
+        raise
+
+    if not metadata.get('is_dir', False):
+        return {metadata['path']: dropbox_remote_entry(metadata)}
+
+    files = {}
+    for entry in metadata.get('contents', []):
+        if entry.get('is_deleted', False):
+            continue
+        if entry['is_dir']:
+            files.update(dropbox_list_remote(client, entry['path']))
+        else:
+            files[entry['path']] = dropbox_remote_entry(entry)
+    return files
+
+def dropbox_remote_entry(metadata):
+    client_mtime = email.utils.parsedate_tz(metadata['client_mtime']) if metadata.get('client_mtime') else None
+    return {'size': metadata['bytes'], 'rev': metadata.get('rev'),
+            'client_mtime': email.utils.mktime_tz(client_mtime) if client_mtime is not None else None}
+
+def dropbox_changed_files(manifest, uploads):
+    changed = []
+    skipped_bytes = 0
+    for source, destination in uploads:
+        key = dropbox_manifest_key(destination)
+        stat = os.stat(source)
+        entry = manifest['files'].get(key)
+
+        content_hash = None
+        if entry is not None and entry.get('hash') is None and entry['size'] == stat.st_size and\
+                entry.get('client_mtime') is not None and entry['client_mtime'] >= int(stat.st_mtime):
+            # reconciled from a remote listing: the remote copy is newer than the local file, adopt it
+            entry.update({'hash': file_hash(source), 'mtime': stat.st_mtime})
+            skipped_bytes += stat.st_size
+            continue
+        if entry is not None and entry.get('hash') is not None and entry['size'] == stat.st_size:
+            if entry.get('mtime') == stat.st_mtime:
+                skipped_bytes += stat.st_size
+                continue
+            content_hash = file_hash(source)
+            if content_hash == entry['hash']:
+                entry['mtime'] = stat.st_mtime
+                skipped_bytes += stat.st_size
+                continue
+
+        if content_hash is None:
+            content_hash = file_hash(source)
+        manifest['pending'][key] = {'hash': content_hash, 'size': stat.st_size, 'mtime': stat.st_mtime}
+        changed.append((source, destination))
+
+    if len(changed) < len(uploads):
+        log_info('skipping ' + str(len(uploads) - len(changed)) + ' unchanged files (' +
+                 "{0:.2f}".format(skipped_bytes / (1024.0 * 1024.0)) + ' MB): ' + manifest['destination'])
+    return changed
+
+def dropbox_delete_removed_files(client, manifest, uploads):
+    local_files = set(dropbox_manifest_key(destination) for source, destination in uploads)
+    for key in manifest['files'].keys():
+        if key in local_files:
+            continue
+        log_info('deleting removed file from dropbox: ' + key)
+        try:
+            client.file_delete(key)
+        except dropbox.rest.ErrorResponse, e:
+            if e.status != 404:
+                raise
+        del manifest['files'][key]
+
+def dropbox_upload_state_file(source, destination):
+    key = hashlib.md5((source + '|' + destination).encode()).hexdigest()
+    return os.path.join(settings.config[BuildSettings.key_temp_dir], 'dropbox_upload_' + key + '.json')
+
 def dropbox_add_file_to_upload(source, destination, zipped, platform, store_link=True):
     cache = {\
         BuildSettings.key_dp_source : source,
@@ -537,64 +2489,332 @@ def dropbox_add_file_to_upload(source, destination, zipped, platform, store_link
 
     log_debug('adding dropbox file upload: ' + source + ' (zip: ' + str(zipped) + ') => ' + destination);
     settings.dropbox_upload_cache.append(cache)
+    if settings.dropbox_upload_thread is not None:
+        settings.dropbox_upload_queue.put((upload_priority(cache), next(upload_sequence), cache))
+
+def start_dropbox_upload_worker():
+    if not settings.option(BuildSettings.key_dropbox_pipeline_uploads, False):
+        return
+
+    log_debug('starting background dropbox uploads')
+    settings.dropbox_upload_queue = Queue.PriorityQueue()
+    settings.dropbox_upload_thread = threading.Thread(target=dropbox_upload_worker, name='dropbox upload')
+    settings.dropbox_upload_thread.daemon = True
+    settings.dropbox_upload_thread.start()
+
+def dropbox_upload_worker():
+    while True:
+        priority, sequence, cache = settings.dropbox_upload_queue.get()
+        if cache is None:
+            return
+        try:
+            upload_cached_file_to_dropbox(cache)
+        except (SystemExit, Exception) as e:
+            log_error('dropbox upload failed: ' + cache[BuildSettings.key_dp_source] + ' (' + str(e) + ')')
+            settings.dropbox_upload_errors.append(cache)
 
 def upload_files_to_dropbox():
-    for cache in settings.dropbox_upload_cache:
-        source = cache[BuildSettings.key_dp_source]
-        destination = cache[BuildSettings.key_dp_destination]
-        zipped = cache[BuildSettings.key_dp_zip]
-        platform = cache[BuildSettings.key_dp_platform]
-        store = cache[BuildSettings.key_dp_store_link]
+    if settings.dropbox_upload_thread is not None:
+        log_info('waiting for background dropbox uploads')
+        settings.dropbox_upload_queue.put(((2, 0), next(upload_sequence), None))
+        settings.dropbox_upload_thread.join()
+        settings.dropbox_upload_thread = None
+        if len(settings.dropbox_upload_errors) > 0:
+            log_error('dropbox upload failed for ' + str(len(settings.dropbox_upload_errors)) + ' file(s)')
+            sys.exit(1)
+        return
 
-        upload_file_to_dropbox(source, destination, zipped, platform, store)
+    for cache in sorted(settings.dropbox_upload_cache, key=upload_priority):
+        upload_cached_file_to_dropbox(cache)
+
+def upload_priority(cache):
+    source = cache[BuildSettings.key_dp_source]
+    size = path_size(source) if os.path.exists(source) else 0
+    return (0 if cache[BuildSettings.key_dp_store_link] else 1, size)
+
+def retry_upload(description, function, *args, **kwargs):
+    retries = settings.option(BuildSettings.key_upload_retries, 5)
+    attempt = 0
+    while True:
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if getattr(e, 'status', None) == 401:
+                log_debug('dropbox token rejected, dropping cached session')
+                session_cache_invalidate('dropbox')
+            if attempt >= retries or not retryable_upload_error(e):
+                raise
+            delay = upload_retry_delay(attempt)
+            attempt += 1
+            log_info(description + ' failed (' + str(e) + '), retry ' + str(attempt) + '/' + str(retries) +
+                     ' in ' + "{0:.1f}".format(delay) + ' s')
+            time.sleep(delay)
+
+def retryable_upload_error(e):
+    status = getattr(e, 'status', None)
+    if status is not None:
+        return status >= 500 or status in (408, 429)
+    if dropbox is not None and isinstance(e, dropbox.rest.RESTSocketError):
+        return True
+    return isinstance(e, (socket.error, httplib.HTTPException))
+
+def upload_retry_delay(attempt):
+    delay = min(settings.option(BuildSettings.key_upload_retry_delay, 2) * (2 ** attempt),
+                settings.option(BuildSettings.key_upload_retry_max_delay, 120))
+    return random.uniform(delay / 2.0, delay)
+
+def throttle_upload(amount, wait=True):
+    limit = settings.option(BuildSettings.key_upload_bandwidth_limit, 0)
+    if not limit:
+        return
+    with upload_bucket_lock:
+        if settings.upload_bucket is None:
+            settings.upload_bucket = TokenBucket(limit * 1024)
+    if wait:
+        settings.upload_bucket.consume(amount)
+    else:
+        settings.upload_bucket.charge(amount)
+
+def upload_cached_file_to_dropbox(cache):
+    source = cache[BuildSettings.key_dp_source]
+    destination = cache[BuildSettings.key_dp_destination]
+    zipped = cache[BuildSettings.key_dp_zip]
+    platform = cache[BuildSettings.key_dp_platform]
+    store = cache[BuildSettings.key_dp_store_link]
+
+    upload_file_to_dropbox(source, destination, zipped, platform, store)
 
 def upload_file_to_dropbox(source, destination, zipped, platform, store_link):
     upload_file = source
+    stream_zip = zipped and settings.option(BuildSettings.key_dropbox_stream_zip, False)
     if zipped:
         path, filename = os.path.split(upload_file)
         filename , extension = os.path.splitext(filename)
         zipped_file = os.path.join(settings.config[BuildSettings.key_temp_dir], filename + platform + '.zip')
-        zip_file_or_dir(upload_file, zipped_file)
+        if not stream_zip:
+            zip_file_or_dir(upload_file, zipped_file)
         upload_file = zipped_file
 
     upload_file_path, upload_file_name = os.path.split(upload_file)
     final_destination = os.path.join(destination, upload_file_name)
-    dropbox_upload(upload_file, final_destination)
+    if stream_zip:
+        dropbox_upload_zip_stream(source, final_destination)
+    else:
+        dropbox_upload(upload_file, final_destination)
 
     link = final_destination
-    if os.path.isdir(upload_file):
+    if not stream_zip and os.path.isdir(upload_file):
         link = None
         for file in os.listdir(upload_file):
             if file.endswith('.html') or file.endswith('.apk'):
                 link = final_destination + '/' + file
 
     if store_link and link is not None:
-        client = dropbox_authenticate()
+        client = dropbox_client()
         share_link = ''
         public_link = link.startswith('Public/')
         if public_link:
             link = link[len('Public/'):]
-            share_link = 'dl.dropboxusercontent.com/u/' + str(client.account_info()['uid']) + '/' + link
+            share_link = 'dl.dropboxusercontent.com/u/' + dropbox_account_uid() + '/' + link
         else:
-            share_link = client.share(link, short_url=False)
+            share_link = dropbox_share_link(client, link)
             share_link = share_link['url'].replace('www.dropbox.com', 'dl.dropboxusercontent.com', 1)
         settings.add_build_info(platform, share_link)
 
+def publish_files_locally():
+    start_time = time.time()
+    published = 0
+    for cache in sorted(settings.dropbox_upload_cache, key=upload_priority):
+        published += publish_file_locally(cache[BuildSettings.key_dp_source], cache[BuildSettings.key_dp_destination],
+                                          cache[BuildSettings.key_dp_zip], cache[BuildSettings.key_dp_platform],
+                                          cache[BuildSettings.key_dp_store_link])
+
+    elapsed = max(time.time() - start_time, 0.001)
+    log_info('published ' + format_size(published) + ' to ' + settings.config[BuildSettings.key_local_publish_dir] + ' in ' +
+             "{0:.1f}".format(elapsed) + ' s (' + format_size(published / elapsed) + '/s)')
+
+def publish_file_locally(source, destination, zipped, platform, store_link):
+    publish_dir = settings.config[BuildSettings.key_local_publish_dir]
+    target = os.path.join(publish_dir, destination, os.path.basename(source.rstrip('/')))
+    mkdir_p(os.path.dirname(target))
+
+    with trace_span('local publish', 'upload', destination=target) as span:
+        published = 0
+        if zipped:
+            target = os.path.splitext(target)[0] + platform + '.zip'
+            temp_target = publish_temp_name(target)
+            zip_file_or_dir(source, temp_target)
+            os.rename(temp_target, target)
+            published = os.path.getsize(target)
+        elif os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                for file in files:
+                    if file not in ignored_files:
+                        file_name = os.path.join(root, file)
+                        published += publish_copy_file(file_name, os.path.join(target, os.path.relpath(file_name, source)))
+        else:
+            published = publish_copy_file(source, target)
+        span['bytes'] = published
+
+    link = target
+    if os.path.isdir(target):
+        link = None
+        for file in os.listdir(target):
+            if file.endswith('.html') or file.endswith('.apk'):
+                link = os.path.join(target, file)
+
+    if store_link and link is not None:
+        settings.add_build_info(platform, local_link=publish_link(link))
+    return published
+
+def publish_link(path):
+    base_url = settings.option(BuildSettings.key_local_publish_url)
+    if base_url:
+        relative_path = os.path.relpath(path, settings.config[BuildSettings.key_local_publish_dir])
+        return base_url.rstrip('/') + '/' + urllib.quote(relative_path.replace(os.sep, '/'))
+    return 'file://' + urllib.pathname2url(os.path.abspath(path))
+
+def publish_temp_name(target):
+    return os.path.join(os.path.dirname(target), '.' + os.path.basename(target) + '.' + str(os.getpid()) + '.tmp')
+
+def publish_copy_file(source, target):
+    source_stat = os.stat(source)
+    if os.path.exists(target):
+        target_stat = os.stat(target)
+        if source_stat.st_size == target_stat.st_size and int(source_stat.st_mtime) == int(target_stat.st_mtime):
+            log_debug('unchanged, not publishing: ' + target)
+            return 0
+
+    mkdir_p(os.path.dirname(target))
+    temp_target = publish_temp_name(target)
+    remove_path(temp_target)
+    try:
+        method = None
+        if settings.option(BuildSettings.key_local_publish_hardlinks, False) and publish_try('hardlink', target, os.link, source, temp_target):
+            method = 'hardlink'
+        else:
+            for name, copy_function in (('reflink', reflink_file), ('copy_file_range', copy_file_range_file)):
+                if publish_try(name, target, copy_function, source, temp_target):
+                    method = name
+                    break
+                remove_path(temp_target)
+            if method is None:
+                method = 'stream'
+                stream_copy_file(source, temp_target)
+            shutil.copystat(source, temp_target)
+        os.rename(temp_target, target)
+    except BaseException:
+        remove_path(temp_target)
+        raise
+
+    log_debug('published (' + method + '): ' + source + ' => ' + target)
+    return source_stat.st_size
+
+def publish_try(method, target, copy_function, source, temp_target):
+    key = (method, os.stat(os.path.dirname(target)).st_dev)
+    if key in publish_unsupported:
+        return False
+    try:
+        copy_function(source, temp_target)
+        return True
+    except (OSError, IOError) as e:
+        if e.errno not in publish_fallback_errors:
+            raise
+        log_debug(method + ' not supported for ' + os.path.dirname(target) + ': ' + str(e))
+        publish_unsupported.add(key)
+        return False
+
+def libc():
+    return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+def reflink_file(source, target):
+    if sys.platform == 'darwin':
+        clonefile = getattr(libc(), 'clonefile', None)
+        if clonefile is None:
+            raise OSError(errno.ENOSYS, 'clonefile not available')
+        if clonefile(source, target, 0) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return
+
+    src = open(source, 'rb')
+    try:
+        dst = open(target, 'wb')
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+def copy_file_range_file(source, target):
+    copy_file_range = getattr(libc(), 'copy_file_range', None)
+    if copy_file_range is None:
+        raise OSError(errno.ENOSYS, 'copy_file_range not available')
+    copy_file_range.restype = ctypes.c_ssize_t
+    copy_file_range.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint]
+
+    src = open(source, 'rb')
+    try:
+        dst = open(target, 'wb')
+        try:
+            remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                copied = copy_file_range(src.fileno(), None, dst.fileno(), None, min(remaining, 1 << 30), 0)
+                if copied < 0:
+                    error = ctypes.get_errno()
+                    raise OSError(error, os.strerror(error))
+                if copied == 0:
+                    break
+                remaining -= copied
+            if remaining > 0:
+                raise IOError(errno.EIO, 'copy_file_range stopped early: ' + source)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+def stream_copy_file(source, target):
+    src = open(source, 'rb')
+    try:
+        dst = open(target, 'wb')
+        try:
+            shutil.copyfileobj(src, dst, publish_buffer_size)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+def start_testflight_uploads():
+    backends['testflight'].load()
+    requests = [testflight_create_request(platform) for platform in selected_platforms() if testflight_enabled(platform)]
+    if len(requests) == 0:
+        return
+
+    settings.testflight_thread = threading.Thread(target=testflight_upload_worker, args=(requests,), name='testflight upload')
+    settings.testflight_thread.daemon = True
+    settings.testflight_thread.start()
+
 def upload_projects_to_testflight():
-    if settings.build_platform == '_all_':
-        for platform in settings.config[BuildSettings.key_platforms].keys():
-            testflight_upload(platform)
-    else:
-        testflight_upload(settings.build_platform)
+    if settings.testflight_thread is None:
+        start_testflight_uploads()
+    if settings.testflight_thread is None:
+        return
 
-def testflight_upload(platform):
+    settings.testflight_thread.join()
+    settings.testflight_thread = None
+    if len(settings.testflight_errors) > 0:
+        log_error('testflight upload failed for: ' + ', '.join(settings.testflight_errors))
+        sys.exit(1)
+
+def testflight_enabled(platform):
     platform_settings = settings.config[BuildSettings.key_platforms][platform]
 
-    if (BuildSettings.key_ios_build not in platform_settings.keys()) or\
-        (BuildSettings.key_testflight_upload not in platform_settings) or\
-        not platform_settings[BuildSettings.key_testflight_upload]:
-        return
+    return (BuildSettings.key_ios_build in platform_settings.keys()) and\
+        (BuildSettings.key_testflight_upload in platform_settings) and\
+        platform_settings[BuildSettings.key_testflight_upload]
 
+def testflight_create_request(platform, attempt=0):
     log_info('uploading to testflight ' + platform)
 
     url                 = settings.config[BuildSettings.key_testflight_url]
@@ -623,33 +2843,159 @@ def testflight_upload(platform):
 
     c.setopt(c.WRITEFUNCTION, fout.write)
     c.setopt(c.URL, url)
-    c.setopt(c.NOPROGRESS, 0)
-    c.setopt(c.PROGRESSFUNCTION, curl_progress)
     c.setopt(c.SSL_VERIFYPEER, 0)
     c.setopt(c.SSL_VERIFYHOST, 0)
     c.setopt(c.POST, 1)
     c.setopt(c.HTTPPOST, post_data)
-    c.perform()
 
+    request = {
+        'platform': platform,
+        'curl': c,
+        'response': fout,
+        'size': sum(os.path.getsize(upload_file) for upload_file in (ipa_file, dsym_file) if os.path.exists(upload_file)),
+        'start_time': None,
+        'attempt': attempt,
+        'uploaded': 0}
+
+    send_speed = testflight_send_speed()
+    if send_speed:
+        # curl paces the handle itself, sleeping in the progress callback would stall every transfer in the multi loop
+        c.setopt(c.MAX_SEND_SPEED_LARGE, send_speed)
+        c.setopt(c.NOPROGRESS, 0)
+        c.setopt(c.PROGRESSFUNCTION, lambda download_total, downloaded, upload_total, uploaded: testflight_charge_upload(request, uploaded))
+    return request
+
+def testflight_send_speed():
+    limit = settings.option(BuildSettings.key_upload_bandwidth_limit, 0) * 1024
+    uploads = len([platform for platform in selected_platforms() if testflight_enabled(platform)])
+    return limit // max(uploads, 1)
+
+def testflight_charge_upload(request, uploaded):
+    uploaded = int(uploaded)
+    if uploaded > request['uploaded']:
+        throttle_upload(uploaded - request['uploaded'], wait=False)
+        request['uploaded'] = uploaded
+
+def testflight_upload_worker(requests):
+    try:
+        testflight_perform(requests)
+    except (SystemExit, Exception) as e:
+        print('')
+        log_error('testflight upload thread failed: ' + repr(e))
+        settings.testflight_errors.extend(request['platform'] for request in requests
+                                          if not request.get('finished') and request['platform'] not in settings.testflight_errors)
+
+def testflight_perform(requests):
+    multi = pycurl.CurlMulti()
+    handles = {}
+    for request in requests:
+        request['start_time'] = time.time()
+        multi.add_handle(request['curl'])
+        handles[id(request['curl'])] = request
+
+    remaining = len(requests)
+    retries = []
+    last_progress = 0
+    while remaining > 0:
+        now = time.time()
+        for retry_time, request in [retry for retry in retries if retry[0] <= now]:
+            retries.remove((retry_time, request))
+            request.update(testflight_create_request(request['platform'], request['attempt'] + 1))
+            request['start_time'] = now
+            multi.add_handle(request['curl'])
+            handles[id(request['curl'])] = request
+
+        while True:
+            ret, active = multi.perform()
+            if ret != pycurl.E_CALL_MULTI_PERFORM:
+                break
+
+        while True:
+            queued, succeeded, failed = multi.info_read()
+            finished = [(c, None) for c in succeeded] + [(c, error_message) for c, error_number, error_message in failed]
+            for c, error_message in finished:
+                request = handles.pop(id(c))
+                multi.remove_handle(c)
+                if testflight_should_retry(request, error_message):
+                    retries.append((time.time() + upload_retry_delay(request['attempt']), request))
+                    continue
+                testflight_finish_request(request, error_message)
+                request['finished'] = True
+                remaining -= 1
+            if queued == 0:
+                break
+
+        now = time.time()
+        if remaining > 0 and now - last_progress >= testflight_progress_interval:
+            testflight_report_progress([request for request in requests if request['curl'] is not None and
+                                        id(request['curl']) in handles], now)
+            last_progress = now
+        if len(handles) > 0:
+            multi.select(testflight_progress_interval)
+        else:
+            time.sleep(testflight_progress_interval)
+
+    multi.close()
+
+def testflight_report_progress(requests, now):
+    progress = []
+    for request in requests:
+        uploaded = request['curl'].getinfo(pycurl.SIZE_UPLOAD)
+        elapsed = max(now - request['start_time'], 0.001)
+        speed = uploaded / elapsed
+        percent = (uploaded / float(request['size']) * 100) if request['size'] > 0 else 0
+        eta = (request['size'] - uploaded) / speed if speed > 0 else 0
+        progress.append(request['platform'] + ' ' + "{0:.1f}".format(min(percent, 100)) + '% ' +
+                        format_size(speed) + '/s ETA ' + format_duration(max(eta, 0)))
+    print("\rtestflight upload: " + '; '.join(progress), end="")
+    sys.stdout.flush()
+
+def testflight_should_retry(request, error_message):
+    response_code = request['curl'].getinfo(pycurl.RESPONSE_CODE)
+    if error_message is None and response_code < 500 and response_code not in (408, 429):
+        return False
+    if request['attempt'] >= settings.option(BuildSettings.key_upload_retries, 5):
+        return False
+
+    print('')
+    log_info('testflight upload failed for ' + request['platform'] + ' (' + str(error_message or response_code) +
+             '), retry ' + str(request['attempt'] + 1) + '/' + str(settings.option(BuildSettings.key_upload_retries, 5)))
+    settings.add_trace_event('testflight upload ' + request['platform'], 'upload', request['start_time'], time.time(),
+                             {'bytes': request['size'], 'response_code': response_code, 'error': error_message, 'retry': True})
+    request['curl'].close()
+    request['curl'] = None
+    return True
+
+def testflight_finish_request(request, error_message=None):
+    c = request['curl']
+    platform = request['platform']
     response_code = c.getinfo(pycurl.RESPONSE_CODE)
-    response_data = fout.getvalue()
+    response_data = request['response'].getvalue()
     print('')
     log_debug('TESTFLIGHT RESPONSE CODE: ' + str(response_code))
     log_debug('TESTFLIGHT RESPONSE DATA:\n' + str(response_data))
+    settings.add_trace_event('testflight upload ' + platform, 'upload', request['start_time'], time.time(),
+                             {'bytes': request['size'], 'response_code': response_code, 'error': error_message})
 
-    if response_code is 200:
-        response = json.loads(response_data)
-        settings.add_build_info(platform, testflight_link=response['install_url'])
+    c.close()
+    request['curl'] = None
 
-    io = StringIO.StringIO(response_data)
-    settings.tf_upload_response = json.load(io)
+    if error_message is not None:
+        log_error('testflight upload failed for ' + platform + ': ' + str(error_message))
+        settings.testflight_errors.append(platform)
+        return
 
-    c.close()
+    try:
+        response = json.loads(response_data)
+    except ValueError:
+        response = None
+    if response_code != 200 or not isinstance(response, dict) or 'install_url' not in response:
+        log_error('unexpected testflight response for ' + platform + ' (' + str(response_code) + ')')
+        settings.testflight_errors.append(platform)
+        return
 
-def curl_progress(download_t, download_d, upload_t, upload_d):
-    uploaded = ((upload_d / upload_t) * 100) if upload_t != 0 else 0
-    print("\rtestflight upload progress: %0.2f %%" % uploaded, end="")
-    sys.stdout.flush()
+    settings.add_build_info(platform, testflight_link=response['install_url'])
+    settings.tf_upload_response = response
 
 def build_xcode_projects():
     for platform, platform_settings in settings.config[BuildSettings.key_platforms].items():
@@ -666,16 +3012,15 @@ def build_ios_xcode_project(platform_name, platform_settings):
     xcode_project_file =  os.path.join(xcode_project_dir, 'project.pbxproj')
 
     log_debug('xcode project file: ' + xcode_project_file)
-    for line in fileinput.input(xcode_project_file, inplace=True):
-        m = re.search("(\t+\"CODE_SIGN_IDENTITY\[sdk\=iphoneos\*\]\" = )" + "\"iPhone Developer\"", line)
-        if m is None:
-            print(line, end="")
-        else:
-            print(m.group(1) + "\"" + platform_settings[BuildSettings.key_xcode_profile_name] + "\";")
-
-    execute_command('xcodebuild archive -project ' + xcode_project_dir + ' -scheme Unity-iPhone -configuration Release', dry_run=False)
+    update_xcode_build_settings(xcode_project_file, xcode_build_setting_overrides(platform_settings),
+                                {xcode_signing_identity_setting: (xcode_default_signing_identity,
+                                                                  platform_settings[BuildSettings.key_xcode_profile_name])})
+
+    archive_dir = xcode_archive_path(platform_name)
+    execute_command('xcodebuild archive -project ' + xcode_project_dir + ' -scheme Unity-iPhone -configuration Release' +
+                    ' -archivePath "' + archive_dir + '"', dry_run=False)
+    xcode_archive_record(archive_dir, platform_name)
     log_info('adding xcode archive comment: ' + settings.pretty_version())
-    archive_dir = get_latest_archive_dir()
     plist_file = os.path.join(archive_dir, 'Info.plist')
     log_debug('archive plist file: ' + plist_file)
 
@@ -704,33 +3049,272 @@ def build_ios_xcode_project(platform_name, platform_settings):
     dsym_dir = os.path.join(archive_dir, os.path.join('dSYMs', settings.config[BuildSettings.key_app_name] + '.app.dSYM'))
     log_debug("dsym dir: " + dsym_dir)
     zip_file_or_dir(dsym_dir, dsym_file)
+    store_artifact(platform_name, ipa_file)
+    store_artifact(platform_name, dsym_file)
 
     if platform_settings[BuildSettings.key_dropbox_upload]:
         dp_dest = os.path.join(platform_settings[BuildSettings.key_dropbox_upload_path])
         dropbox_add_file_to_upload(ipa_file, dp_dest, zipped=False, platform=platform_name, store_link=True)
         dropbox_add_file_to_upload(dsym_file, dp_dest, zipped=False, platform=platform_name, store_link=False)
 
-def get_latest_archive_dir():
-    home_dir = expanduser("~")
-    all_archives_dir = os.path.join(home_dir, 'Library/Developer/Xcode/Archives/')
-    latest_archive_dir = sorted(os.walk(all_archives_dir).next()[1], reverse=True)[0]
-    archive_dir = sorted(os.walk(os.path.join(all_archives_dir, latest_archive_dir)).next()[1], reverse=True)[0]
-    return os.path.join(all_archives_dir, os.path.join(latest_archive_dir, archive_dir))
+def xcode_build_setting_overrides(platform_settings):
+    overrides = {}
+    for configuration, build_settings in platform_settings.get(BuildSettings.key_xcode_build_settings, {}).items():
+        overrides.setdefault(configuration, {}).update(build_settings)
+    return overrides
+
+def update_xcode_build_settings(xcode_project_file, overrides, replacements=None):
+    try:
+        project = PbxprojFile(xcode_project_file)
+        changes = project.apply_overrides(overrides, replacements)
+    except (IOError, ValueError) as e:
+        log_error('cannot update xcode project: ' + str(e))
+        sys.exit(1)
+
+    if project.save():
+        log_debug('xcode project updated, ' + str(changes) + ' build setting(s) changed')
+    else:
+        log_debug('xcode project build settings up to date')
+
+def xcode_archives_dir():
+    return settings.option(BuildSettings.key_xcode_archives_dir) or os.path.join(expanduser('~'), 'Library/Developer/Xcode/Archives')
+
+def xcode_archive_path(platform_name):
+    now = datetime.datetime.now()
+    archive_name = settings.config[BuildSettings.key_app_name] + ' ' + platform_name + ' ' + settings.pretty_version() +\
+        ' ' + now.strftime('%Y-%m-%d %H.%M.%S') + '.xcarchive'
+    return os.path.join(xcode_archives_dir(), now.strftime('%Y-%m-%d'), archive_name)
+
+def xcode_archive_index_file():
+    return os.path.join(xcode_archives_dir(), 'unity_auto_build_archives.json')
+
+def xcode_archive_record(archive_dir, platform_name):
+    if not os.path.isdir(archive_dir):
+        log_error('xcode archive not found: ' + archive_dir)
+        sys.exit(1)
+
+    with xcode_archive_lock:
+        index = read_json_file(xcode_archive_index_file(), [])
+        index.append({
+            'path': archive_dir,
+            'app': settings.config[BuildSettings.key_app_name],
+            'platform': platform_name,
+            'version': settings.bundle_version,
+            'build': settings.build_number,
+            'created': time.time(),
+            'size': path_size(archive_dir)})
+        index = xcode_archive_prune(index, archive_dir)
+        write_json_file(xcode_archive_index_file(), index)
+
+def xcode_archive_prune(index, current):
+    keep = settings.option(BuildSettings.key_xcode_archive_keep, 3)
+    max_size = settings.option(BuildSettings.key_xcode_archive_max_size, 0) * 1024 * 1024
+
+    archives = [entry for entry in index if os.path.isdir(entry['path'])]
+    archives.sort(key=lambda entry: entry['created'], reverse=True)
+
+    kept = []
+    counts = {}
+    for entry in archives:
+        group = (entry['app'], entry['platform'], entry['version'])
+        counts[group] = counts.get(group, 0) + 1
+        if counts[group] > keep and entry['path'] != current:
+            xcode_archive_remove(entry, 'more than ' + str(keep) + ' archives of ' + ' '.join(group))
+        else:
+            kept.append(entry)
+
+    total_size = sum(entry['size'] for entry in kept)
+    for entry in reversed(list(kept)):
+        if not max_size or total_size <= max_size:
+            break
+        if entry['path'] == current:
+            continue
+        xcode_archive_remove(entry, 'archives over ' + format_size(max_size))
+        kept.remove(entry)
+        total_size -= entry['size']
+
+    return kept
+
+def xcode_archive_remove(entry, reason):
+    log_info('removing xcode archive (' + reason + '): ' + entry['path'])
+    remove_path(entry['path'])
+    date_dir = os.path.dirname(entry['path'])
+    if os.path.isdir(date_dir) and len(os.listdir(date_dir)) == 0:
+        os.rmdir(date_dir)
+
+def artifact_build_id():
+    return settings.bundle_version + '-' + str(settings.build_number)
+
+def artifact_manifest_file(build_id, platform_name):
+    return os.path.join(settings.config[BuildSettings.key_artifact_store_dir], 'builds', build_id, platform_name + '.json')
+
+def artifact_object_file(digest, executable):
+    name = digest + ('.x' if executable else '')
+    return os.path.join(settings.config[BuildSettings.key_artifact_store_dir], 'objects', digest[:2], name)
+
+def store_artifact(platform_name, path):
+    if not settings.option(BuildSettings.key_artifact_store_dir):
+        return
+
+    source = os.path.join(settings.config[BuildSettings.key_project_path], path)
+    if not os.path.exists(source):
+        log_debug('no artifact to store: ' + source)
+        return
+
+    with trace_span('store ' + os.path.basename(source), 'artifacts', platform=platform_name) as span:
+        files = {}
+        if os.path.isdir(source):
+            for root, dirs, names in os.walk(source):
+                for name in names:
+                    file_name = os.path.join(root, name)
+                    if name not in ignored_files and not os.path.islink(file_name):
+                        files[os.path.relpath(file_name, source)] = store_artifact_file(file_name)
+        else:
+            files[''] = store_artifact_file(source)
+        span['files'] = len(files)
+
+    with artifact_store_lock:
+        manifest_file = artifact_manifest_file(artifact_build_id(), platform_name)
+        manifest = read_json_file(manifest_file, {'version': settings.pretty_version(), 'platform': platform_name, 'artifacts': {}})
+        manifest['created'] = time.time()
+        manifest['artifacts'][os.path.normpath(path) if not os.path.isabs(path) else os.path.basename(path)] = files
+        mkdir_p(os.path.dirname(manifest_file))
+        write_json_file(manifest_file, manifest)
+    log_info('stored artifact: ' + source + ' (' + str(len(files)) + ' files, build ' + artifact_build_id() + ')')
+
+def store_artifact_file(file_name):
+    executable = bool(os.stat(file_name).st_mode & stat.S_IXUSR)
+    objects_dir = os.path.join(settings.config[BuildSettings.key_artifact_store_dir], 'objects')
+    mkdir_p(objects_dir)
+
+    # hash while copying so the artifact is only read once
+    temp_file = os.path.join(objects_dir, 'ingest.' + str(os.getpid()) + '.' + str(threading.current_thread().ident) + '.tmp')
+    digest = hashlib.sha1()
+    try:
+        source = open(file_name, 'rb')
+        target = open(temp_file, 'wb')
+        try:
+            while True:
+                block = source.read(1024 * 1024)
+                if not block:
+                    break
+                digest.update(block)
+                target.write(block)
+        finally:
+            target.close()
+            source.close()
+
+        digest = digest.hexdigest()
+        object_file = artifact_object_file(digest, executable)
+        if os.path.exists(object_file):
+            os.remove(temp_file)
+            os.utime(object_file, None)
+        else:
+            mkdir_p(os.path.dirname(object_file))
+            os.chmod(temp_file, 0555 if executable else 0444)
+            os.rename(temp_file, object_file)
+    except:
+        remove_path(temp_file)
+        raise
+    return [digest, os.path.getsize(object_file), executable]
+
+def artifact_manifests():
+    manifests = []
+    builds_dir = os.path.join(settings.config[BuildSettings.key_artifact_store_dir], 'builds')
+    if not os.path.isdir(builds_dir):
+        return manifests
+    for build_id in os.listdir(builds_dir):
+        for name in os.listdir(os.path.join(builds_dir, build_id)):
+            if name.endswith('.json'):
+                manifest_file = os.path.join(builds_dir, build_id, name)
+                manifest = read_json_file(manifest_file)
+                if manifest is not None:
+                    manifests.append((manifest_file, build_id, manifest))
+    return manifests
+
+def materialize_artifacts(build, platform_name, destination):
+    matching = [(manifest_file, manifest) for manifest_file, build_id, manifest in artifact_manifests()
+                if build in (build_id, manifest['version']) and manifest['platform'] == platform_name]
+    if len(matching) == 0:
+        log_error('no stored artifacts for build ' + build + ' (' + platform_name + ')')
+        sys.exit(1)
+
+    manifest_file, manifest = max(matching, key=lambda match: (match[1].get('created', 0), os.path.getmtime(match[0])))
+    count = 0
+    for artifact, files in manifest['artifacts'].items():
+        for relative_path, (digest, size, executable) in files.items():
+            target = os.path.join(destination, artifact, relative_path) if relative_path else os.path.join(destination, artifact)
+            mkdir_p(os.path.dirname(target))
+            link_or_copy_file(artifact_object_file(digest, executable), target, False)
+            count += 1
+    log_info('materialized ' + str(count) + ' files of build ' + manifest['version'] + ' (' + platform_name + ') in ' + destination)
+
+def prune_artifact_store():
+    if not settings.option(BuildSettings.key_artifact_store_dir):
+        return
+
+    max_size = settings.option(BuildSettings.key_artifact_store_max_size, 0) * 1024 * 1024
+    max_age = settings.option(BuildSettings.key_artifact_store_max_age, 0) * 24 * 3600
+
+    with artifact_store_lock:
+        manifests = sorted(artifact_manifests(), key=lambda manifest: manifest[2].get('created', 0), reverse=True)
+        referenced = {}
+        total_size = 0
+        for index, (manifest_file, build_id, manifest) in enumerate(manifests):
+            objects = {}
+            for files in manifest['artifacts'].values():
+                for digest, size, executable in files.values():
+                    objects[artifact_object_file(digest, executable)] = size
+            added_size = sum(size for object_file, size in objects.items() if object_file not in referenced)
+
+            expired = max_age and time.time() - manifest.get('created', 0) > max_age
+            over_budget = max_size and total_size + added_size > max_size
+            if index > 0 and (expired or over_budget):
+                log_info('removing stored build ' + build_id + ' (' + manifest['platform'] + '): ' +
+                         ('older than ' + format_duration(max_age) if expired else 'store over ' + format_size(max_size)))
+                os.remove(manifest_file)
+                if len(os.listdir(os.path.dirname(manifest_file))) == 0:
+                    os.rmdir(os.path.dirname(manifest_file))
+                continue
+
+            referenced.update(objects)
+            total_size += added_size
+
+        removed_size = 0
+        objects_dir = os.path.join(settings.config[BuildSettings.key_artifact_store_dir], 'objects')
+        for root, dirs, files in os.walk(objects_dir):
+            for name in files:
+                object_file = os.path.join(root, name)
+                if object_file in referenced or time.time() - os.path.getmtime(object_file) < artifact_store_grace_period:
+                    continue
+                removed_size += os.path.getsize(object_file)
+                os.remove(object_file)
+
+    log_info('artifact store: ' + format_size(total_size) + ' in ' + str(len(referenced)) + ' objects, removed ' +
+             format_size(removed_size))
 
 def get_ios_build_files(tmp_dir):
     return (os.path.join(tmp_dir, settings.config[BuildSettings.key_app_name] + '.ipa'),
             os.path.join(tmp_dir, settings.config[BuildSettings.key_app_name] + '.dSYM.zip'))
 
 def zip_file_or_dir(source, destination):
+    workers = settings.option(BuildSettings.key_zip_workers) or multiprocessing.cpu_count()
+    with trace_span('zip', 'zip', source=source, workers=workers) as span:
+        if workers > 1:
+            zip_file_or_dir_parallel(source, destination, workers)
+        else:
+            zip_file_or_dir_serial(source, destination)
+        span['bytes'] = os.path.getsize(destination)
+
+def zip_file_or_dir_serial(source, destination):
     log_info('zipping: ' + source + ' => ' + destination)
     path, filename = os.path.split(destination)
     mkdir_p(path)
 
     path_to_zip, file_to_zip = os.path.split(source)
 
-    zf = zipfile.PyZipFile(destination, mode='w', compression=zipfile.ZIP_DEFLATED)
+    zf = zipfile.PyZipFile(destination, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
     try:
-        zf.debug = 3
         if os.path.isdir(source):
             for root, dirs, files in os.walk(source):
                 for file in files:
@@ -741,6 +3325,218 @@ def zip_file_or_dir(source, destination):
     finally:
         zf.close()
 
+def zip_file_or_dir_parallel(source, destination, workers):
+    log_info('zipping with ' + str(workers) + ' workers: ' + source + ' => ' + destination)
+    path, filename = os.path.split(destination)
+    mkdir_p(path)
+
+    out = open(destination, 'wb')
+    try:
+        zip_write_members(ZipStreamWriter(out), zip_members(source), workers)
+    finally:
+        out.close()
+
+def zip_members(source):
+    path_to_zip = os.path.dirname(os.path.abspath(source))
+    if not os.path.isdir(source):
+        return [(source, os.path.relpath(os.path.abspath(source), path_to_zip))]
+
+    members = []
+    for root, dirs, files in os.walk(source):
+        for file in files:
+            file_name = os.path.join(root, file)
+            members.append((file_name, os.path.relpath(os.path.abspath(file_name), path_to_zip)))
+    return members
+
+def zip_write_members(writer, members, workers):
+    pool = None
+    try:
+        pending = collections.deque()
+        for task in zip_tasks(members):
+            if task['stat'].st_size < zip_pool_min_size:
+                result = ZipChunkResult(zip_compress_chunk(task))
+            else:
+                if pool is None:
+                    pool = multiprocessing.Pool(workers)
+                result = pool.apply_async(zip_compress_chunk, (task,))
+            pending.append((task, result))
+            if len(pending) >= workers * 4:
+                zip_write_chunk(writer, *pending.popleft())
+        while len(pending) > 0:
+            zip_write_chunk(writer, *pending.popleft())
+        writer.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def zip_tasks(members):
+    for file_name, arcname in members:
+        stat = os.stat(file_name)
+        compress = zip_should_compress(file_name, stat.st_size)
+        offset = 0
+        while True:
+            length = min(zip_chunk_size, stat.st_size - offset)
+            first = offset == 0
+            last = offset + length >= stat.st_size
+            yield {'file_name': file_name, 'arcname': arcname, 'stat': stat, 'compress': compress,
+                   'offset': offset, 'length': length, 'first': first, 'last': last}
+            offset += length
+            if last:
+                break
+
+def zip_should_compress(file_name, size):
+    if os.path.splitext(file_name)[1].lower() in zip_stored_extensions:
+        return False
+    if size < 1024 * 1024:
+        return True
+
+    samples = min(zip_sample_count, size // zip_sample_size)
+    sampled = 0
+    compressed = 0
+    f = open(file_name, 'rb')
+    try:
+        for index in range(samples):
+            f.seek((size - zip_sample_size) * index // max(samples - 1, 1))
+            sample = f.read(zip_sample_size)
+            sampled += len(sample)
+            compressed += len(zlib.compress(sample, 1))
+    finally:
+        f.close()
+    return compressed < sampled * 0.9
+
+def zip_compress_chunk(task):
+    f = open(task['file_name'], 'rb')
+    try:
+        f.seek(task['offset'])
+        data = f.read(task['length'])
+    finally:
+        f.close()
+
+    crc = zlib.crc32(data) & 0xFFFFFFFF
+    if not task['compress']:
+        return crc, len(data), data
+
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    payload = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if task['last'] else zlib.Z_SYNC_FLUSH)
+    return crc, len(data), payload
+
+def zip_write_chunk(writer, task, result):
+    crc, length, payload = result.get()
+    if task['first']:
+        compress_type = zipfile.ZIP_DEFLATED if task['compress'] else zipfile.ZIP_STORED
+        writer.start_member(task['arcname'], task['stat'], compress_type)
+        task['stat'] = None
+        writer.member.update({'crc': 0, 'compress_size': 0, 'file_size': 0})
+
+    member = writer.member
+    member['crc'] = crc if task['first'] else crc32_combine(member['crc'], crc, length)
+    member['compress_size'] += len(payload)
+    member['file_size'] += length
+    writer.write(payload)
+
+    if task['last']:
+        writer.end_member(member['crc'], member['compress_size'], member['file_size'])
+
+def crc32_combine(crc1, crc2, length2):
+    global crc32_chunk_operator
+    if length2 == zip_chunk_size:
+        if crc32_chunk_operator is None:
+            crc32_chunk_operator = [crc32_shift(1 << n, length2) for n in range(32)]
+        return gf2_matrix_times(crc32_chunk_operator, crc1) ^ crc2
+    return crc32_shift(crc1, length2) ^ crc2
+
+def crc32_shift(crc, length):
+    if length == 0:
+        return crc
+
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+    even = gf2_matrix_square(odd)
+    odd = gf2_matrix_square(even)
+    while True:
+        even = gf2_matrix_square(odd)
+        if length & 1:
+            crc = gf2_matrix_times(even, crc)
+        length >>= 1
+        if length == 0:
+            break
+        odd = gf2_matrix_square(even)
+        if length & 1:
+            crc = gf2_matrix_times(odd, crc)
+        length >>= 1
+        if length == 0:
+            break
+    return crc
+
+def gf2_matrix_times(matrix, vector):
+    result = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return result
+
+def gf2_matrix_square(matrix):
+    return [gf2_matrix_times(matrix, row) for row in matrix]
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    f = open(path, 'rb')
+    try:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+def read_json_file(path, default=None):
+    if not os.path.exists(path):
+        return default
+    f = open(path)
+    try:
+        return json.load(f)
+    except ValueError:
+        log_debug('ignoring malformed json file: ' + path)
+        return default
+    finally:
+        f.close()
+
+def write_json_file(path, content, mode=None):
+    temp_path = path + '.tmp'
+    if mode is None:
+        f = open(temp_path, 'w')
+    else:
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        os.fchmod(fd, mode)
+        f = os.fdopen(fd, 'w')
+    try:
+        json.dump(content, f, sort_keys=True, indent=4, separators=(',', ': '))
+    finally:
+        f.close()
+    os.rename(temp_path, path)
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2 == 1:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+def format_duration(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024.0:
+            return "{0:.1f}".format(size) + ' ' + unit
+        size /= 1024.0
+    return "{0:.2f}".format(size) + ' GB'
+
 def mkdir_p(path):
     try:
         os.makedirs(path)
@@ -756,6 +3552,9 @@ def mail_notification_message():
     message += unit_tests_results() + '\n\n'
     message += settings.build_message.replace('\\n', '\n') + '\n\n'
     message += settings.generate_build_info()
+    message += '\n' + settings.generate_unity_reports_info()
+    message += '\n' + settings.generate_unit_test_report_info()
+    message += '\n' + settings.generate_history_info()
 
     return message
 
@@ -782,9 +3581,6 @@ def delete_mail_password(mail):
         pass
 
 def mail_notification():
-    if not settings.config[BuildSettings.key_mail_notification]:
-        return
-
     from_addr = settings.config[BuildSettings.key_default_mail]
     to_addrs = settings.config[BuildSettings.key_mail_recipents]
 
@@ -801,6 +3597,7 @@ def mail_notification():
     server.quit()
 
 def mail_authenticate():
+    backends['mail'].load()
     mail = settings.config[BuildSettings.key_default_mail]
     smtp = settings.config[BuildSettings.key_default_mail_smtp]
     password = get_mail_password(mail)
@@ -814,7 +3611,9 @@ def mail_authenticate():
         try:
             server.login(mail, password)
             logged_in = True
+            session_cache_set('mail', mail_session_key(), True)
         except smtplib.SMTPAuthenticationError, e:
+            session_cache_invalidate('mail', mail_session_key())
             password = get_mail_password(mail)
             if password is not None:
                 delete_mail_password(mail)
@@ -828,45 +3627,333 @@ def prompt_mail_password(mail):
     return password
 
 def request_mail_password():
-    if BuildSettings.key_default_mail in settings.config and len(settings.config[BuildSettings.key_default_mail]) > 0:
+    if len(settings.option(BuildSettings.key_default_mail) or '') > 0:
+        backends['mail'].load()
+        mail = settings.config[BuildSettings.key_default_mail]
+        if session_cache_get('mail', mail_session_key()) is not None and get_mail_password(mail) is not None:
+            log_debug('mail password checked recently, skipping check')
+            return
         log_info('checking mail password')
-        mail_authenticate()
+        mail_authenticate().quit()
+
+def mail_session_key():
+    return mail_hash(settings.config[BuildSettings.key_default_mail] + '|' + settings.config[BuildSettings.key_default_mail_smtp])
 
 def prompt(prompt):
     return raw_input(prompt).strip()
 
 def commit_version_file():
-    if settings.config[BuildSettings.key_commit_changes]:
-        project_path = settings.config[BuildSettings.key_project_path]
-        version_file = settings.config[BuildSettings.key_version_file]
+    project_path = settings.config[BuildSettings.key_project_path]
+    version_file = settings.config[BuildSettings.key_version_file]
 
-        repo = Repo(project_path)
+    backends['git'].load()
+    repo = git.Repo(project_path)
 
-        log_debug('commiting version file: ' + version_file)
-        repo.index.add([version_file])
-        repo.index.commit('build v' + settings.pretty_version())
-        log_debug('git commit performed')
+    log_debug('commiting version file: ' + version_file)
+    repo.index.add([version_file])
+    repo.index.commit('build v' + settings.pretty_version())
+    log_debug('git commit performed')
 
 def run_unit_tests():
     log_info('running unit tests')
 
     unity = settings.config[BuildSettings.key_unity_app]
-    result_file = os.path.join(settings.config[BuildSettings.key_project_path], 'UnitTestResults.xml')
+    project_path = settings.config[BuildSettings.key_project_path]
+    result_file = os.path.join(project_path, unit_test_result_file)
     if os.path.exists(result_file):
         os.remove(result_file)
-    execute_command(unity + ' -batchmode -quit -executeMethod ' + 'UnityTest.Batch.RunUnitTests', dry_run=False)
 
-    tree = ET.parse(os.path.abspath(result_file))
-    root = tree.getroot()
+    history = read_json_file(unit_test_history_file(), {})
+    fixtures = {}
+    shards = []
+    if settings.option(BuildSettings.key_unit_test_shards, 1) > 1:
+        fixtures = unit_test_fixtures(project_path)
+        shards = split_unit_tests(sorted(fixtures.keys()), settings.config[BuildSettings.key_unit_test_shards],
+                                  unit_test_durations(history))
 
-    settings.tests_total = int(root.attrib['total'])
-    settings.tests_errors = int(root.attrib['errors']) + int(root.attrib['failures'])
+    if len(shards) > 1:
+        run_unit_test_shards(shards, result_file)
+    else:
+        # the output goes to a followed log file, the idle timeout would kill a silent unity otherwise
+        log_file = os.path.join(settings.config[BuildSettings.key_temp_dir], 'unit_tests_unity.log')
+        mkdir_p(settings.config[BuildSettings.key_temp_dir])
+        execute_command(unity + ' -batchmode -quit -logFile "' + log_file + '" -executeMethod ' + unit_test_method, dry_run=False,
+                        log_file=log_file)
+
+    totals, test_cases = read_unit_test_results(os.path.abspath(result_file))
+    update_unit_test_history(history, test_cases)
+    write_json_file(unit_test_history_file(), history)
+
+    settings.tests_total = int(totals['total'])
+    settings.tests_errors = int(totals['errors']) + int(totals['failures'])
     log_info(unit_tests_results())
+    log_debug(settings.generate_unit_test_report_info())
 
+    if len(shards) > 1 and settings.tests_errors == 0:
+        check_unit_test_shards(fixtures, test_cases)
     if (settings.tests_errors > 0):
         log_error('some unit tests failed')
         sys.exit(1)
 
+def unit_test_history_file():
+    return settings.option(BuildSettings.key_unit_test_history) or\
+        os.path.join(settings.config[BuildSettings.key_temp_dir], 'unit_test_history.json')
+
+def read_unit_test_results(result_file):
+    totals = None
+    test_cases = []
+    parents = []
+    for event, element in ET.iterparse(result_file, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'test-results' and totals is None:
+                totals = dict(element.attrib)
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if element.tag == 'test-case':
+            time_attribute = element.get('time')
+            test_cases.append({
+                'name': element.get('name'),
+                'time': float(time_attribute) if time_attribute is not None else None,
+                'result': element.get('result', 'Unknown')})
+            # clear() alone keeps the emptied element attached to its parent for the whole parse
+            if len(parents) > 0:
+                parents[-1].remove(element)
+    return totals, test_cases
+
+def update_unit_test_history(history, test_cases):
+    tests = history.setdefault('tests', {})
+    runs = settings.option(BuildSettings.key_unit_test_history_runs, 10)
+    factor = settings.option(BuildSettings.key_unit_test_regression_factor, 1.5)
+
+    timed = []
+    regressed = []
+    for test_case in test_cases:
+        if test_case['time'] is None:
+            continue
+        timed.append(test_case)
+        entry = tests.setdefault(test_case['name'], {'times': []})
+        if len(entry['times']) >= unit_test_regression_min_runs:
+            baseline = median(entry['times'])
+            if test_case['time'] > baseline * factor and test_case['time'] - baseline >= unit_test_regression_min_seconds:
+                regressed.append({'name': test_case['name'], 'time': test_case['time'], 'median': baseline})
+        entry['times'] = (entry['times'] + [test_case['time']])[-runs:]
+        entry['result'] = test_case['result']
+
+    if len(timed) == 0:
+        settings.unit_test_report = None
+        return
+
+    slowest = sorted(timed, key=lambda test_case: -test_case['time'])[:unit_test_report_size]
+    regressed.sort(key=lambda test: test['median'] - test['time'])
+    settings.unit_test_report = {
+        'slowest': [{'name': test_case['name'], 'time': test_case['time']} for test_case in slowest],
+        'regressed': regressed[:unit_test_report_size]}
+
+def unit_test_durations(history):
+    return dict((name, median(entry['times'])) for name, entry in history.get('tests', {}).items() if len(entry['times']) > 0)
+
+def unit_test_fixtures(project_path):
+    classes = {}
+    for root, dirs, files in os.walk(os.path.join(project_path, 'Assets')):
+        for file in files:
+            if not file.endswith('.cs'):
+                continue
+            f = open(os.path.join(root, file))
+            try:
+                source = f.read()
+            finally:
+                f.close()
+            for test_class in unit_test_source_classes(source):
+                classes.setdefault(test_class['name'], test_class)
+
+    by_simple_name = {}
+    for test_class in classes.values():
+        by_simple_name.setdefault(test_class['simple_name'], test_class)
+
+    def inherited_methods(test_class, seen):
+        methods = list(test_class['methods'])
+        base = by_simple_name.get((test_class['base'] or '').split('.')[-1])
+        if base is not None and base['name'] not in seen:
+            seen.add(base['name'])
+            methods.extend(inherited_methods(base, seen))
+        return methods
+
+    fixtures = {}
+    for name, test_class in classes.items():
+        methods = inherited_methods(test_class, set([name]))
+        if test_class['abstract'] or (len(methods) == 0 and not test_class['fixture']):
+            continue
+        fixtures[name] = sorted(set(name + '.' + method for method in methods))
+    return fixtures
+
+def unit_test_source_classes(source):
+    source = unit_test_noise_pattern.sub(' ', source)
+    scopes = []
+    classes = []
+    test_attribute = False
+    fixture_attribute = False
+    for m in unit_test_source_pattern.finditer(source):
+        if m.group('namespace') is not None:
+            scopes.append(('namespace', m.group('namespace_name')))
+        elif m.group('class') is not None:
+            outer = [scope[1] for scope in scopes if scope[0] == 'class']
+            if len(outer) > 0:
+                name = outer[-1]['name'] + '+' + m.group('class_name')
+            else:
+                name = '.'.join(scope[1] for scope in scopes if scope[0] == 'namespace' and scope[1] is not None)
+                name = (name + '.' if name else '') + m.group('class_name')
+            test_class = {'name': name, 'simple_name': m.group('class_name'), 'base': m.group('base'), 'methods': [],
+                          'abstract': 'abstract' in m.group('modifiers').split() or 'static' in m.group('modifiers').split(),
+                          'fixture': fixture_attribute}
+            classes.append(test_class)
+            scopes.append(('class', test_class))
+            test_attribute = fixture_attribute = False
+        elif m.group('attribute') is not None:
+            for attribute in unit_test_attribute_pattern.findall(m.group('attribute')[1:-1]):
+                if attribute == 'TestFixture':
+                    fixture_attribute = True
+                else:
+                    test_attribute = True
+        elif m.group('method') is not None:
+            if test_attribute and len(scopes) > 0 and scopes[-1][0] == 'class':
+                scopes[-1][1]['methods'].append(unit_test_method_pattern.search(m.group('method')).group(1))
+            test_attribute = False
+        elif m.group('open') is not None:
+            scopes.append(('block', None))
+            test_attribute = fixture_attribute = False
+        elif len(scopes) > 0:
+            scopes.pop()
+    return classes
+
+def unit_test_fixture_name(test_name):
+    name = test_name.split('(')[0]
+    while unit_test_generic_pattern.search(name) is not None:
+        name = unit_test_generic_pattern.sub('', name)
+    return name.rsplit('.', 1)[0]
+
+def check_unit_test_shards(fixtures, test_cases):
+    executed = set(unit_test_fixture_name(test_case['name']) + '.' + test_case['name'].split('(')[0].rsplit('.', 1)[-1]
+                   for test_case in test_cases)
+    expected = set(test for tests in fixtures.values() for test in tests)
+    missing = sorted(expected - executed)
+    log_debug('sharded unit tests: ' + str(len(test_cases)) + ' result(s), ' + str(len(expected)) + ' test(s) found in sources')
+    if len(missing) > 0:
+        log_error('sharded unit test run did not execute ' + str(len(missing)) + ' test(s) found in the sources: ' +
+                  ', '.join(missing[:10]) + (' ...' if len(missing) > 10 else '') + ' (run without unit_test_shards to check)')
+        sys.exit(1)
+
+def split_unit_tests(fixtures, shard_count, durations):
+    fixture_times = dict((fixture, 0.0) for fixture in fixtures)
+    for name, seconds in durations.items():
+        fixture = unit_test_fixture_name(name)
+        if fixture in fixture_times:
+            fixture_times[fixture] += seconds
+
+    known = [seconds for seconds in fixture_times.values() if seconds > 0]
+    default_time = sum(known) / len(known) if len(known) > 0 else 1.0
+    for fixture, seconds in fixture_times.items():
+        if seconds == 0:
+            fixture_times[fixture] = default_time
+
+    shards = [{'time': 0.0, 'fixtures': []} for index in range(min(shard_count, len(fixtures)))]
+    for fixture in sorted(fixtures, key=lambda fixture: (-fixture_times[fixture], fixture)):
+        shard = min(shards, key=lambda shard: shard['time'])
+        shard['fixtures'].append(fixture)
+        shard['time'] += fixture_times[fixture]
+
+    for index, shard in enumerate(shards):
+        log_debug('unit test shard ' + str(index) + ': ' + str(len(shard['fixtures'])) + ' fixture(s), ~' +
+                  format_duration(shard['time']))
+    return [shard['fixtures'] for shard in shards]
+
+def run_unit_test_shards(shards, result_file):
+    log_info('running unit tests in ' + str(len(shards)) + ' shards')
+    cancel = threading.Event()
+    slots = threading.Semaphore(max(settings.option(BuildSettings.key_unit_test_max_parallel, 2), 1))
+    results = [None] * len(shards)
+    threads = []
+    for index, fixtures in enumerate(shards):
+        thread = threading.Thread(target=run_unit_test_shard, args=(index, fixtures, results, cancel, slots),
+                                  name='unit test shard ' + str(index))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(0.5)
+
+    failed = [str(index) for index, result in enumerate(results) if result['root'] is None and not result['cancelled']]
+    if len(failed) > 0:
+        log_error('unit test shard(s) without results: ' + ', '.join(failed))
+        sys.exit(1)
+
+    cancelled = [result for result in results if result['cancelled']]
+    if len(cancelled) > 0:
+        log_info('cancelled ' + str(len(cancelled)) + ' unit test shard(s) after failure')
+
+    roots = [result['root'] for result in results if result['root'] is not None]
+    if len(roots) == 0:
+        log_error('unit tests failed: no unit test shard wrote results')
+        sys.exit(1)
+    merge_unit_test_results(roots).write(result_file)
+
+def run_unit_test_shard(index, fixtures, results, cancel, slots):
+    result = {'root': None, 'cancelled': False}
+    try:
+        with slots:
+            if cancel.is_set():
+                result['cancelled'] = True
+                results[index] = result
+                return
+
+            workspace = prepare_workspace('unit_tests_' + str(index))
+            shard_result_file = os.path.join(workspace, unit_test_result_file)
+            remove_path(shard_result_file)
+
+            command = unity_command(unit_test_method, workspace) +\
+                ' -resultFilePath="' + shard_result_file + '" -filter=' + ','.join(fixtures)
+            with trace_span('unit test shard ' + str(index), 'test', fixtures=len(fixtures)):
+                execute_command(command, exit_on_error=False, cancel=cancel, log_file=unity_log_file(workspace),
+                                idle_timeout=unity_idle_timeout())
+
+        if os.path.exists(shard_result_file):
+            result['root'] = ET.parse(shard_result_file).getroot()
+        result['cancelled'] = result['root'] is None and cancel.is_set()
+    except (SystemExit, Exception) as e:
+        log_error('unit test shard ' + str(index) + ' failed: ' + str(e))
+    results[index] = result
+
+    shard_failed = result['root'] is None or\
+        int(result['root'].get('errors', 0)) + int(result['root'].get('failures', 0)) > 0
+    if shard_failed and not result['cancelled'] and settings.option(BuildSettings.key_unit_test_fail_fast, False):
+        log_info('unit test shard ' + str(index) + ' failed, cancelling remaining shards')
+        cancel.set()
+
+def merge_unit_test_results(roots):
+    merged = ET.Element('test-results', dict(roots[0].attrib))
+    for attribute in unit_test_count_attributes:
+        if attribute in roots[0].attrib:
+            merged.set(attribute, str(sum(int(root.get(attribute, 0)) for root in roots)))
+    for child in roots[0]:
+        if child.tag != 'test-suite':
+            merged.append(child)
+
+    suites = [suite for root in roots for suite in root.findall('test-suite')]
+    success = all(suite.get('success', 'True') == 'True' for suite in suites)
+    project = ET.SubElement(merged, 'test-suite', {
+        'type': 'Project',
+        'name': 'unit test shards',
+        'executed': 'True',
+        'result': 'Success' if success else 'Failure',
+        'success': str(success),
+        'time': "{0:.3f}".format(max(float(suite.get('time', 0)) for suite in suites) if len(suites) > 0 else 0),
+        'asserts': str(sum(int(suite.get('asserts', 0)) for suite in suites))})
+    ET.SubElement(project, 'results').extend(suites)
+    return ET.ElementTree(merged)
+
 def unit_tests_results():
     if settings.tests_total == 0:
         return 'unit tests: none'
@@ -876,30 +3963,255 @@ def unit_tests_results():
 
 def main():
     parse_arguments()
+    if daemon_port is not None:
+        run_daemon(daemon_port)
+        return
+
+    run_build()
+
+def run_build(check_passwords=True):
     settings.start_timer()
     settings.start_log()
 
-    request_mail_password()
-    request_dropbox_password()
+    try:
+        run_stage(load_backends)
+        if check_passwords:
+            run_stage(preflight_backends)
+
+        run_stage(run_unit_tests)
 
-    run_unit_tests()
+        # todo: generalize
+        run_stage(increment_build_number)
+        run_stage(parse_version)
 
-    # todo: generalize
-    increment_build_number()
-    parse_version()
+        run_stage(start_backends)
+        run_stage(build_unity_projects)
+        run_stage(build_xcode_projects)
+        run_stage(prune_artifact_store)
 
-    build_unity_projects()
-    build_xcode_projects()
+        run_stage(upload_build_products)
+        run_stage(commit_build)
 
-    upload_files_to_dropbox()
-    upload_projects_to_testflight()
+        settings.end_timer()
+        run_stage(record_build_history)
+        run_stage(notify_build)
+    except BaseException:
+        try:
+            if not settings.history_recorded:
+                record_build_history('failed')
+        except Exception as e:
+            log_error('cannot record failed build in history: ' + str(e))
+        raise
+    finally:
+        settings.save_trace()
+        settings.end_log()
+
+def history_db_file():
+    return settings.option(BuildSettings.key_history_db) or os.path.join(settings.config[BuildSettings.key_temp_dir], 'build_history.sqlite')
+
+def open_history_db():
+    connection = sqlite3.connect(history_db_file())
+    connection.execute('CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started REAL, config TEXT, version TEXT, '
+                       'build_number INTEGER, platform TEXT, result TEXT, execution_time REAL, tests_total INTEGER, tests_errors INTEGER)')
+    connection.execute('CREATE TABLE IF NOT EXISTS metrics (run_id INTEGER REFERENCES runs(id), kind TEXT, name TEXT, value REAL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id)')
+    connection.execute('CREATE INDEX IF NOT EXISTS runs_config ON runs (config, platform, result)')
+    return connection
+
+def build_history_metrics():
+    metrics = collections.defaultdict(float)
+    with trace_lock:
+        events = list(settings.trace_events)
+    for event in events:
+        if event['cat'] == 'stage':
+            metrics[('stage', event['name'])] += event['dur'] / 1000000.0
+        elif event['cat'] == 'subprocess':
+            metrics[('subprocess', event['name'])] += event['dur'] / 1000000.0
+        elif event['cat'] == 'upload' and not event['args'].get('retry') and event['args'].get('bytes'):
+            metrics[('upload', event['name'])] += event['args']['bytes']
+
+    for cache in settings.dropbox_upload_cache:
+        source = cache[BuildSettings.key_dp_source]
+        if os.path.exists(source):
+            metrics[('artifact', cache[BuildSettings.key_dp_platform] + '/' + os.path.basename(source))] = path_size(source)
+    return metrics
+
+def record_build_history(result='success'):
+    metrics = build_history_metrics()
+    execution_time = time.time() - settings.start_time
+    metrics[('stage', 'total')] = execution_time
+    config = os.path.abspath(settings.file_name)
+
+    settings.history_recorded = True
+    connection = open_history_db()
+    try:
+        with connection:
+            cursor = connection.execute('INSERT INTO runs (started, config, version, build_number, platform, result, execution_time, '
+                                        'tests_total, tests_errors) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                        (settings.start_time, config, settings.bundle_version, settings.build_number,
+                                         settings.build_platform, result, execution_time, settings.tests_total, settings.tests_errors))
+            run_id = cursor.lastrowid
+            connection.executemany('INSERT INTO metrics (run_id, kind, name, value) VALUES (?, ?, ?, ?)',
+                                   [(run_id, kind, name, value) for (kind, name), value in metrics.items()])
+
+        if result == 'success':
+            settings.history_regressions = find_history_regressions(connection, run_id, config, metrics)
+            for kind, name, value, baseline in settings.history_regressions:
+                log_info('regression: ' + kind + ' ' + name + ' ' + "{0:.1f}".format(value) + ' vs baseline ' + "{0:.1f}".format(baseline))
+    finally:
+        connection.close()
+    log_debug('build recorded in history: ' + history_db_file())
+
+def find_history_regressions(connection, run_id, config, metrics):
+    runs = settings.option(BuildSettings.key_history_baseline_runs, 10)
+    threshold = settings.option(BuildSettings.key_history_regression_threshold, 25) / 100.0
+    previous = [row[0] for row in connection.execute(
+        'SELECT id FROM runs WHERE config = ? AND platform = ? AND result = ? AND id < ? ORDER BY id DESC LIMIT ?',
+        (config, settings.build_platform, 'success', run_id, runs))]
+    if len(previous) < history_min_runs:
+        return []
+
+    history = collections.defaultdict(list)
+    query = 'SELECT kind, name, value FROM metrics WHERE run_id IN (' + ','.join('?' * len(previous)) + ')'
+    for kind, name, value in connection.execute(query, previous):
+        history[(kind, name)].append(value)
+
+    regressions = []
+    for (kind, name), value in sorted(metrics.items()):
+        if kind not in ('stage', 'artifact') or len(history[(kind, name)]) < history_min_runs:
+            continue
+        baseline = median(history[(kind, name)])
+        minimum = history_min_bytes if kind == 'artifact' else history_min_seconds
+        if baseline > 0 and value > baseline * (1 + threshold) and value - baseline >= minimum:
+            regressions.append((kind, name, value, baseline))
+    return regressions
+
+def print_build_history(count):
+    config = os.path.abspath(settings.file_name)
+    connection = open_history_db()
+    try:
+        runs = list(reversed(connection.execute(
+            'SELECT id, started, version, build_number, platform, result, execution_time, tests_total, tests_errors FROM runs '
+            'WHERE config = ? ORDER BY id DESC LIMIT ?', (config, count)).fetchall()))
+        if len(runs) == 0:
+            print('no builds recorded for ' + config)
+            return
+
+        trends = collections.OrderedDict()
+        for run in runs:
+            for kind, name, value in connection.execute('SELECT kind, name, value FROM metrics WHERE run_id = ? ORDER BY kind, name', (run[0],)):
+                trends.setdefault((kind, name), {})[run[0]] = value
+    finally:
+        connection.close()
+
+    for run_id, started, version, build_number, platform, result, execution_time, tests_total, tests_errors in runs:
+        print(datetime.datetime.fromtimestamp(started).strftime('%Y-%m-%d %H:%M') + '  ' + str(version) + ' (' + str(build_number) + ')  ' +
+              platform + '  ' + result + '  ' + format_duration(execution_time) + '  tests: ' +
+              str(tests_total - tests_errors) + '/' + str(tests_total))
+
+    print('\ntrends (oldest to newest):')
+    for (kind, name), values in sorted(trends.items()):
+        formatted = []
+        for run in runs:
+            if run[0] not in values:
+                formatted.append('-')
+            elif kind in ('artifact', 'upload'):
+                formatted.append(format_size(values[run[0]]))
+            else:
+                formatted.append(format_duration(values[run[0]]))
+        print(' ' + kind + ' ' + name + ': ' + ', '.join(formatted))
+
+def run_stage(stage):
+    with trace_span(stage.__name__):
+        stage()
+
+def run_daemon(port):
+    global daemon_allowed_config
+    if settings is not None:
+        daemon_check_config(settings)
+        daemon_allowed_config = os.path.realpath(settings.file_name)
+    if daemon_allowed_config is None and daemon_config_dir is None:
+        log_info('warning: neither -x CONFIG_FILE nor --daemon_config_dir given, every build request will be rejected')
+
+    queue = BuildQueue()
+    server = BuildRequestServer(('127.0.0.1', port), BuildRequestHandler)
+    server.build_queue = queue
+    server_thread = threading.Thread(target=server.serve_forever, name='daemon http')
+    server_thread.daemon = True
+    server_thread.start()
+    log_info('build daemon listening on 127.0.0.1:' + str(port))
+
+    try:
+        while True:
+            request = queue.get()
+            try:
+                run_daemon_build(request)
+            finally:
+                queue.done()
+    except KeyboardInterrupt:
+        log_info('stopping build daemon')
+    finally:
+        server.shutdown()
 
-    # todo: genralize
-    commit_version_file()
+def daemon_check_config(config_settings):
+    global settings
+    settings = config_settings
+    load_backends()
+    preflight_backends()
+    daemon_keep_dropbox_client()
+    daemon_checked_configs.add(os.path.abspath(settings.file_name))
+
+def daemon_keep_dropbox_client():
+    if settings.dropbox_client is not None:
+        token = settings.config[BuildSettings.key_dropbox_access_token]
+        daemon_dropbox_clients[token] = (settings.dropbox_client, settings.dropbox_account_info)
+
+def daemon_config_allowed(config):
+    # realpath resolves symlinks and '..', a request must not reach configs outside the allowed ones
+    config = os.path.realpath(config)
+    if config == daemon_allowed_config:
+        return True
+    return daemon_config_dir is not None and config.startswith(os.path.join(os.path.realpath(daemon_config_dir), ''))
+
+def daemon_config_platforms(config):
+    config_file = open(config)
+    try:
+        return json.load(config_file)[BuildSettings.key_platforms].keys()
+    finally:
+        config_file.close()
+
+def run_daemon_build(request):
+    if not daemon_config_allowed(request['config']):
+        log_error('build #' + str(request['id']) + ' rejected, config file not allowed: ' + request['config'])
+        return
 
-    settings.end_timer()
-    mail_notification()
-    settings.end_log()
+    global settings
+    settings = BuildSettings()
+    settings.read_config_file(request['config'])
+    settings.build_platform = request['platform']
+    settings.build_message = '\n'.join(request['messages'])
+
+    platforms = settings.config[BuildSettings.key_platforms].keys()
+    if settings.build_platform != '_all_' and settings.build_platform not in platforms:
+        log_error('build #' + str(request['id']) + ' rejected, platform not configured: ' + settings.build_platform +
+                  ' (available: ' + ', '.join(sorted(platforms)) + ')')
+        return
+
+    token = settings.option(BuildSettings.key_dropbox_access_token)
+    if token in daemon_dropbox_clients:
+        settings.dropbox_client, settings.dropbox_account_info = daemon_dropbox_clients[token]
+
+    log_info('starting build #' + str(request['id']) + ': ' + request['config'] + ' (' + request['platform'] + ')')
+    try:
+        run_build(check_passwords=request['config'] not in daemon_checked_configs)
+        daemon_checked_configs.add(request['config'])
+        log_info('build #' + str(request['id']) + ' finished')
+    except SystemExit as e:
+        log_error('build #' + str(request['id']) + ' failed with exit code: ' + str(e.code))
+    except Exception:
+        log_error('build #' + str(request['id']) + ' failed:\n' + traceback.format_exc())
+    finally:
+        daemon_keep_dropbox_client()
 
 if __name__ == '__main__':
     main()